@@ -1,14 +1,11 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
-import pymysql
+from sqlalchemy import text
 import logging
 import os
 import sys
-
-# MySQL驱动注册
-pymysql.install_as_MySQLdb()
+from app.replicas import RoutingSession, init_replicas
 
 
 # 不添加下面的代码的化，在虚拟环境下运行start_dev.bat 找不到 模块 config
@@ -16,10 +13,22 @@ pymysql.install_as_MySQLdb()
 project_root = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 sys.path.append(project_root)
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
+logger = logging.getLogger(__name__)
+
+
+def register_mysql_driver(app):
+    """只有使用 mysql:// 连接串时才导入 pymysql 并注册为 MySQLdb"""
+    uris = [app.config.get('SQLALCHEMY_DATABASE_URI') or '']
+    uris.extend(app.config.get('SQLALCHEMY_REPLICA_URIS') or [])
+    if any(uri.startswith('mysql://') for uri in uris):
+        # MySQL驱动注册
+        import pymysql
+        pymysql.install_as_MySQLdb()
+
+
 def create_app(config_name=None):
     """应用工厂函数"""
     # app = Flask(__name__)
@@ -52,17 +61,73 @@ def create_app(config_name=None):
     # 从环境变量覆盖配置
     app.config.from_prefixed_env()
 
+    register_mysql_driver(app)
+
+    # 响应压缩（最先注册的 after_request 最后执行，压缩总是发生在其他处理之后）
+    from app.compression import init_compression
+    init_compression(app)
+
+    # Prometheus 指标（需在准入闸门之前注册，使被拒绝的请求也能计时）
+    from app.metrics import init_metrics
+    init_metrics(app)
+
+    # 按 worker 分配数据库连接预算（需在初始化数据库之前）
+    from app.pool import configure_connection_budget
+    configure_connection_budget(app)
+
     # 初始化扩展
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_replicas(app)
+
+    # SQLite 连接参数与组提交（仅在使用 SQLite 时生效）
+    from app.sqlite_mode import init_sqlite_mode
+    init_sqlite_mode(app)
+
+    # SQL 查询分析（慢查询、执行计划、N+1）
+    from app.sql_profiler import init_sql_profiler
+    init_sql_profiler(app)
+
+    # 按需 CPU 采样与内存快照（默认关闭）
+    from app.profiling import init_profiling
+    init_profiling(app)
+
+    # 密码哈希放到独立进程池，并限制整台主机的并发（见 app/password_hashing.py）
+    from app.password_hashing import init_password_hasher
+    init_password_hasher(app)
     jwt.init_app(app)
 
+    # orjson 可用时替换默认 JSON 编码
+    from app.json_provider import init_json_provider
+    init_json_provider(app)
+
     # 注册蓝图
     from app.routes import main_bp
     # from app.routes import tracking_bp
     app.register_blueprint(main_bp)
+
+    # 只负责采集的部署（APP_ROLE=ingest）不加载导出和数据库迁移，缩短 worker 启动时间
+    if app.config.get('APP_ROLE', 'all') != 'ingest':
+        from app.export import export_bp
+        app.register_blueprint(export_bp)
+
+        from flask_migrate import Migrate
+        Migrate(app, db)
     # app.register_blueprint(tracking_bp, url_prefix='/api/track')
 
+    # 注册命令行工具
+    from app.partitioning import partitions_cli
+    app.cli.add_command(partitions_cli)
+    from app.retention import retention_cli
+    app.cli.add_command(retention_cli)
+    from app.archive import archive_cli
+    app.cli.add_command(archive_cli)
+    from app.event_metadata import metadata_cli
+    app.cli.add_command(metadata_cli)
+    from app.provisioning import users_cli
+    app.cli.add_command(users_cli)
+    from app.write_keys import writekeys_cli
+    app.cli.add_command(writekeys_cli)
+
     # 配置日志
     setup_logging(app)
 
@@ -76,22 +141,9 @@ def create_app(config_name=None):
 
 
 def setup_logging(app):
-    """配置日志"""
-    if app.debug:
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format=app.config['LOG_FORMAT']
-        )
-    else:
-        # 生产环境日志到文件
-        logging.basicConfig(
-            level=getattr(logging, app.config['LOG_LEVEL']),
-            format=app.config['LOG_FORMAT'],
-            handlers=[
-                logging.FileHandler('app.log'),
-                logging.StreamHandler()
-            ]
-        )
+    """配置日志（经队列由后台线程写出，见 app/logging_pipeline.py）"""
+    from app.logging_pipeline import init_logging
+    init_logging(app)
 
 
 def setup_development_environment(app):
@@ -101,9 +153,9 @@ def setup_development_environment(app):
         try:
             from app import models
             db.create_all()
-            print("开发环境数据库表创建完成")
+            logger.info("开发环境数据库表创建完成")
         except Exception as e:
-            print(f"数据库表创建错误: {e}")
+            logger.error("数据库表创建错误: %s", e)
 
     # 开发环境添加调试工具
     try:
@@ -123,8 +175,8 @@ def setup_production_environment(app):
     with app.app_context():
         try:
             # 检查数据库连接
-            db.session.execute('SELECT 1')
-            print("生产环境数据库连接正常")
+            db.session.execute(text('SELECT 1'))
+            logger.info("生产环境数据库连接正常")
         except Exception as e:
-            print(f"生产环境数据库连接失败: {e}")
+            logger.error("生产环境数据库连接失败: %s", e)
             raise
\ No newline at end of file
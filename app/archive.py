@@ -0,0 +1,629 @@
+"""
+冷数据归档与联合查询
+
+flask archive run 将早于 ARCHIVE_AFTER_DAYS 天的事件按天写入压缩的 Parquet 列式文件，
+写入 manifest.json 后再从数据库中分块删除。目录结构：
+
+    <ARCHIVE_DIR>/manifest.json
+    <ARCHIVE_DIR>/events/dt=2024-01-15/part-<最小ID>-<最大ID>.parquet
+
+管理端列表、导出接口在查询范围与归档日期有交集时（不带 start_date 视为包含全部归档），
+同时读取数据库（热数据）和归档文件（冷数据），并按 manifest 中的日期裁剪不需要读取的文件，
+使列表、导出与统计接口的总数一致。列表按时间排序时利用"归档数据都早于数据库中的数据"直接定位到页所在的位置：
+热数据只取本页的列，冷数据按每天的行数跳过不需要的日期，只读取页所在的那一两天；
+只按日期筛选的计数直接使用 manifest 中每个文件的行数。
+每个文件写入时顺带统计按事件类型、页面、用户的计数并记录在 manifest 中，
+管理端统计只累加 manifest，不读取归档文件（早期没有计数的文件用 flask archive stats 补齐）。
+按ID删除和删除任务（包括保留策略）同样作用于归档：重写受影响的文件（删空的文件直接移除），
+更新 manifest 中的行数和计数并递增版本。
+依赖 pyarrow，仅在启用归档时导入。
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from app import db
+from app.models import Event
+from app.serializers import EVENT_FIELDS, event_columns, event_row_dict, project_event_dicts
+
+
+logger = logging.getLogger(__name__)
+
+archive_cli = AppGroup('archive', help='冷数据归档')
+
+ARCHIVE_COLUMNS = ['id', 'user_id', 'anonymous_id', 'event_type', 'event_name', 'page_url', 'element_id',
+                   'event_metadata', 'ip_address', 'user_agent', 'created_at']
+
+# 筛选条件 -> 需要读取的归档列
+_FILTER_COLUMNS = {'user_id': 'user_id', 'anonymous_id': 'anonymous_id', 'event_type': 'event_type', 'page_url': 'page_url',
+                   'event_name': 'event_name', 'start_date': 'created_at', 'end_date': 'created_at'}
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('anonymous_id', pa.string()),
+        ('event_type', pa.string()),
+        ('event_name', pa.string()),
+        ('page_url', pa.string()),
+        ('element_id', pa.string()),
+        ('event_metadata', pa.string()),
+        ('ip_address', pa.string()),
+        ('user_agent', pa.string()),
+        ('created_at', pa.timestamp('us')),
+    ])
+
+
+def _metadata_text(value):
+    """归档文件中统一以 JSON 文本保存 event_metadata"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _metadata_value_text(value):
+    """与数据库中 JSON_UNQUOTE 的结果保持一致，用于 meta.<key> 筛选"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _file_counts(columns, counts=None):
+    """累加一批归档行的类型 / 页面 / 用户计数（写入 manifest 的 counts 字段）"""
+    counts = counts or {'types': Counter(), 'pages': Counter(), 'users': Counter()}
+    counts['types'].update(columns['event_type'])
+    counts['pages'].update(value for value in columns['page_url'] if value is not None)
+    # JSON 对象的键只能是字符串
+    counts['users'].update(str(int(value)) for value in columns['user_id'] if value is not None)
+    return counts
+
+
+def cold_row_to_dict(row):
+    """将归档行转换为与 Event.to_dict 相同的结构"""
+    metadata = row.get('event_metadata')
+    created_at = row.get('created_at')
+    return {
+        'id': row['id'],
+        # 含空值的整数列读入 pandas 后是浮点数
+        'user_id': int(row['user_id']) if row['user_id'] is not None else None,
+        'anonymous_id': row.get('anonymous_id'),
+        'event_type': row['event_type'],
+        'event_name': row['event_name'],
+        'page_url': row['page_url'],
+        'element_id': row['element_id'],
+        'event_metadata': json.loads(metadata) if metadata else {},
+        'ip_address': row['ip_address'],
+        'user_agent': row['user_agent'],
+        'created_at': created_at.isoformat() if created_at else None
+    }
+
+
+class ColdStore:
+    """归档文件目录及其 manifest"""
+
+    def __init__(self, root, compression='zstd'):
+        self.root = root
+        self.compression = compression
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._aggregates = None
+        self._aggregates_version = None
+
+    # ===== manifest =====
+
+    def load_manifest(self):
+        """读取 manifest（按文件修改时间缓存）"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return {'version': 0, 'files': []}
+
+        with self._lock:
+            if self._manifest is None or mtime != self._manifest_mtime:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save_manifest(self, manifest):
+        """原子写入 manifest"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def version(self):
+        return self.load_manifest().get('version', 0)
+
+    def total_rows(self):
+        return sum(entry['rows'] for entry in self.load_manifest()['files'])
+
+    def files_for_range(self, start=None, end=None):
+        """按日期裁剪：返回与 [start, end] 有交集的归档文件"""
+        start_day = start.date() if start else None
+        end_day = end.date() if end else None
+
+        entries = []
+        for entry in self.load_manifest()['files']:
+            day = date.fromisoformat(entry['date'])
+            if start_day and day < start_day:
+                continue
+            if end_day and day > end_day:
+                continue
+            entries.append(entry)
+        return entries
+
+    def needs_cold(self, filters):
+        """查询范围是否与归档文件的日期有交集（不带 start_date 时包含全部归档）"""
+        return bool(self.files_for_range(filters.get('start_date'), filters.get('end_date')))
+
+    # ===== 读取 =====
+
+    def read_events(self, filters, columns=None, entries=None):
+        """读取满足筛选条件的归档事件（entries 为要读取的文件，默认按日期范围裁剪），返回 pandas DataFrame"""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = columns or ARCHIVE_COLUMNS
+        if entries is None:
+            entries = self.files_for_range(filters.get('start_date'), filters.get('end_date'))
+        read_columns = list(dict.fromkeys(columns + [column for key, column in _FILTER_COLUMNS.items()
+                                                     if filters.get(key)]))
+        if filters.get('meta'):
+            read_columns = list(dict.fromkeys(read_columns + ['event_metadata']))
+
+        predicates = []
+        if filters.get('user_id'):
+            predicates.append(('user_id', '=', filters['user_id']))
+        if filters.get('anonymous_id'):
+            predicates.append(('anonymous_id', '=', filters['anonymous_id']))
+        if filters.get('event_type'):
+            predicates.append(('event_type', '=', filters['event_type']))
+        if filters.get('start_date'):
+            predicates.append(('created_at', '>=', filters['start_date']))
+        if filters.get('end_date'):
+            predicates.append(('created_at', '<=', filters['end_date']))
+
+        tables = []
+        for entry in entries:
+            path = os.path.join(self.root, entry['path'])
+            # 按完整 schema 读取：早期归档文件没有 anonymous_id 等新列，读出为空值
+            tables.append(pq.read_table(path, columns=read_columns, filters=predicates or None,
+                                        schema=_arrow_schema()))
+
+        if not tables:
+            return pd.DataFrame(columns=columns)
+
+        df = pa.concat_tables(tables).to_pandas()
+        if filters.get('meta'):
+            metadata = df['event_metadata'].map(lambda value: json.loads(value) if value else {})
+            mask = pd.Series(True, index=df.index)
+            for key, value in filters['meta'].items():
+                mask &= metadata.map(lambda item, key=key: _metadata_value_text(
+                    item.get(key) if isinstance(item, dict) else None)) == str(value)
+            df = df[mask]
+        if filters.get('page_url'):
+            df = df[df['page_url'].fillna('').str.contains(filters['page_url'], regex=False)]
+        if filters.get('event_name'):
+            df = df[df['event_name'].fillna('').str.contains(filters['event_name'], regex=False)]
+        return df[columns]
+
+    def read_event_dicts(self, filters, sort_by='created_at', sort_order='desc', limit=None):
+        """
+        读取归档事件并转换为字典列表，按指定字段排序
+
+        按时间排序且给定 limit 时逐天读取（倒序从最新的一天开始），读够 limit 行后不再读取更早（更晚）的文件。
+        """
+        import pandas as pd
+
+        entries = self.files_for_range(filters.get('start_date'), filters.get('end_date'))
+        if limit is None or sort_by != 'created_at':
+            df = self.read_events(filters, entries=entries)
+        else:
+            by_day = {}
+            for entry in entries:
+                by_day.setdefault(entry['date'], []).append(entry)
+            frames, rows = [], 0
+            # 每个文件只包含一天的数据，读完一整天后已够 limit 行，其余日期的数据都排在后面
+            for day in sorted(by_day, reverse=sort_order != 'asc'):
+                frame = self.read_events(filters, entries=by_day[day])
+                frames.append(frame)
+                rows += len(frame)
+                if rows >= limit:
+                    break
+            df = pd.concat(frames) if frames else self.read_events(filters, entries=[])
+        df = _sort_frame(df, sort_by, sort_order)
+        if limit is not None:
+            df = df.head(limit)
+        df = df.astype(object).where(df.notna(), None)
+        return [cold_row_to_dict(row) for row in df.to_dict('records')]
+
+    def read_event_page(self, filters, sort_order='desc', offset=0, limit=50):
+        """
+        按时间排序的第 [offset, offset + limit) 条归档事件（字典列表）
+
+        逐天定位：页之前的日期只计数（尽量使用 manifest 行数）不读取全部列，页之后的日期不再读取。
+        """
+        by_day = {}
+        for entry in self.files_for_range(filters.get('start_date'), filters.get('end_date')):
+            by_day.setdefault(entry['date'], []).append(entry)
+
+        events = []
+        for day in sorted(by_day, reverse=sort_order != 'asc'):
+            if len(events) >= limit:
+                break
+            count = self._count_entries(filters, by_day[day])
+            if offset >= count:
+                offset -= count
+                continue
+            df = _sort_frame(self.read_events(filters, entries=by_day[day]), 'created_at', sort_order)
+            df = df.iloc[offset:offset + limit - len(events)]
+            offset = 0
+            df = df.astype(object).where(df.notna(), None)
+            events.extend(cold_row_to_dict(row) for row in df.to_dict('records'))
+        return events
+
+    def count_events(self, filters):
+        """统计满足筛选条件的归档事件数（无筛选或只按日期筛选时使用 manifest 中的行数）"""
+        return self._count_entries(filters, self.files_for_range(filters.get('start_date'), filters.get('end_date')))
+
+    def _count_entries(self, filters, entries):
+        start, end = filters.get('start_date'), filters.get('end_date')
+        if any(filters.get(key) for key in ('user_id', 'anonymous_id', 'event_type', 'page_url', 'event_name', 'meta')):
+            return len(self.read_events(filters, columns=['id'], entries=entries))
+
+        total = 0
+        partial = []
+        for entry in entries:
+            day_start = datetime.combine(date.fromisoformat(entry['date']), datetime.min.time())
+            day_end = day_start + timedelta(days=1)
+            # 整天都在范围内的文件直接累加行数，只有范围两端被截断的那一天需要读取 created_at 列
+            if (start is None or start <= day_start) and (end is None or end >= day_end - timedelta(microseconds=1)):
+                total += entry['rows']
+            else:
+                partial.append(entry)
+        if partial:
+            total += len(self.read_events(filters, columns=['id'], entries=partial))
+        return total
+
+    def aggregates(self):
+        """归档数据的全量聚合：只累加 manifest 中每个文件的计数（按 manifest 版本缓存）"""
+        manifest = self.load_manifest()
+        version = manifest.get('version', 0)
+        with self._lock:
+            if self._aggregates is not None and self._aggregates_version == version:
+                return self._aggregates
+
+        aggregates = {'total': 0, 'types': Counter(), 'pages': Counter(), 'users': Counter(), 'dates': Counter()}
+        missing = 0
+        for entry in manifest['files']:
+            aggregates['total'] += entry['rows']
+            aggregates['dates'][entry['date']] += entry['rows']
+            counts = entry.get('counts')
+            if counts is None:
+                missing += 1
+                continue
+            aggregates['types'].update(counts['types'])
+            aggregates['pages'].update(counts['pages'])
+            aggregates['users'].update({int(user_id): count for user_id, count in counts['users'].items()})
+        if missing:
+            logger.warning('部分归档文件没有计数，类型/页面/用户统计不完整，请运行 flask archive stats',
+                           extra={'files': missing})
+
+        with self._lock:
+            self._aggregates = aggregates
+            self._aggregates_version = version
+        return aggregates
+
+    # ===== 归档 =====
+
+    def archive_day(self, day, chunk_size=10000):
+        """
+        将某一天的热数据写入归档文件并从数据库中删除
+
+        若上次归档在删除阶段中断，会先补删已归档的行，再归档剩余的行。
+        返回本次归档的行数。
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        in_day = (Event.created_at >= day_start, Event.created_at < day_end)
+
+        archived_max = max((entry['max_id'] for entry in self.load_manifest()['files']
+                            if entry['date'] == day.isoformat()), default=0)
+        if archived_max:
+            self._delete_hot_rows(in_day + (Event.id <= archived_max,))
+
+        table = Event.__table__
+        stmt = select(*[table.c[name] for name in ARCHIVE_COLUMNS]) \
+            .where(*in_day, table.c.id > archived_max) \
+            .order_by(table.c.id.asc()) \
+            .execution_options(stream_results=True, yield_per=chunk_size)
+
+        relative_dir = os.path.join('events', f'dt={day.isoformat()}')
+        os.makedirs(os.path.join(self.root, relative_dir), exist_ok=True)
+        tmp_path = os.path.join(self.root, relative_dir, 'part.parquet.tmp')
+
+        schema = _arrow_schema()
+        rows = 0
+        min_id = max_id = None
+        counts = None
+        writer = None
+        try:
+            for partition in db.session.execute(stmt).partitions():
+                columns = {name: [] for name in ARCHIVE_COLUMNS}
+                for row in partition:
+                    for name in ARCHIVE_COLUMNS:
+                        value = getattr(row, name)
+                        columns[name].append(_metadata_text(value) if name == 'event_metadata' else value)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, schema, compression=self.compression)
+                writer.write_table(pa.table(columns, schema=schema))
+                counts = _file_counts(columns, counts)
+                rows += len(partition)
+                min_id = columns['id'][0] if min_id is None else min_id
+                max_id = columns['id'][-1]
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if not rows:
+            return 0
+
+        relative_path = os.path.join(relative_dir, f'part-{min_id}-{max_id}.parquet')
+        os.replace(tmp_path, os.path.join(self.root, relative_path))
+
+        manifest = dict(self.load_manifest())
+        manifest['files'] = manifest.get('files', []) + [{
+            'path': relative_path,
+            'date': day.isoformat(),
+            'rows': rows,
+            'min_id': min_id,
+            'max_id': max_id,
+            'counts': counts,
+            'archived_at': datetime.now().isoformat()
+        }]
+        manifest['version'] = manifest.get('version', 0) + 1
+        self._save_manifest(manifest)
+
+        self._delete_hot_rows(in_day + (Event.id <= max_id,))
+        return rows
+
+    def delete_events(self, filters=None, event_ids=None, exclude_types=None):
+        """
+        从归档文件中删除事件，返回被删除的事件ID列表
+
+        按 event_ids 删除时只打开ID范围覆盖这些ID的文件；否则按筛选条件（已解析，与删除任务相同）
+        和 exclude_types 删除，按日期裁剪文件。写墓碑由调用方负责。
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        manifest = dict(self.load_manifest())
+        if event_ids is not None:
+            wanted = sorted({event_id for event_id in event_ids if isinstance(event_id, int)})
+
+            def affected(entry):
+                index = bisect.bisect_left(wanted, entry['min_id'])
+                return index < len(wanted) and wanted[index] <= entry['max_id']
+        else:
+            filters = filters or {}
+            in_range = {entry['path'] for entry in self.files_for_range(filters.get('start_date'),
+                                                                         filters.get('end_date'))}
+
+            def affected(entry):
+                return entry['path'] in in_range
+
+        files, removed, deleted = [], [], []
+        for entry in manifest.get('files', []):
+            if not affected(entry):
+                files.append(entry)
+                continue
+            path = os.path.join(self.root, entry['path'])
+            table = pq.read_table(path, schema=_arrow_schema())
+            if event_ids is not None:
+                doomed = table.filter(pc.is_in(table['id'], value_set=pa.array(wanted, pa.int64())))['id'].to_pylist()
+            else:
+                df = self.read_events(filters, columns=['id', 'event_type'], entries=[entry])
+                if exclude_types:
+                    df = df[~df['event_type'].isin(exclude_types)]
+                doomed = [int(event_id) for event_id in df['id']]
+            if not doomed:
+                files.append(entry)
+                continue
+
+            deleted.extend(doomed)
+            remaining = table.filter(pc.invert(pc.is_in(table['id'], value_set=pa.array(doomed, pa.int64()))))
+            if not remaining.num_rows:
+                removed.append(path)
+                continue
+            tmp_path = path + '.tmp'
+            pq.write_table(remaining, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            # min_id / max_id 保持不变：表示该文件覆盖的ID范围，归档中断后据此补删热数据
+            files.append(dict(entry, rows=remaining.num_rows,
+                              counts=_file_counts(remaining.select(['user_id', 'event_type', 'page_url']).to_pydict())))
+
+        if deleted:
+            manifest['files'] = files
+            manifest['version'] = manifest.get('version', 0) + 1
+            self._save_manifest(manifest)
+            # 先保存 manifest 再删除文件，之后的请求不会再读取它们
+            for path in removed:
+                os.remove(path)
+        return deleted
+
+    def backfill_counts(self):
+        """为没有计数的早期归档文件补充 counts（逐个文件读取三列），返回补充的文件数"""
+        import pyarrow.parquet as pq
+
+        manifest = dict(self.load_manifest())
+        files = []
+        filled = 0
+        for entry in manifest.get('files', []):
+            if entry.get('counts') is None:
+                table = pq.read_table(os.path.join(self.root, entry['path']),
+                                      columns=['user_id', 'event_type', 'page_url'])
+                entry = dict(entry, counts=_file_counts(table.to_pydict()))
+                filled += 1
+            files.append(entry)
+        if filled:
+            manifest['files'] = files
+            manifest['version'] = manifest.get('version', 0) + 1
+            self._save_manifest(manifest)
+        return filled
+
+    def _delete_hot_rows(self, conditions):
+        """分块删除已归档的热数据（归档不是删除，不写墓碑）"""
+        chunk_size = current_app.config.get('DELETE_CHUNK_SIZE', 1000)
+        while True:
+            event_ids = [row[0] for row in db.session.query(Event.id).filter(*conditions)
+                         .order_by(Event.id.asc()).limit(chunk_size).all()]
+            if not event_ids:
+                break
+            Event.query.filter(Event.id.in_(event_ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+
+def _sort_frame(df, sort_by, sort_order):
+    ascending = sort_order == 'asc'
+    if sort_by == 'page_url':
+        return df.sort_values(['page_url', 'created_at'], ascending=ascending, na_position='first' if ascending else 'last')
+    return df.sort_values('created_at', ascending=ascending)
+
+
+def get_cold_store():
+    """返回当前应用的归档存储；未启用归档时返回 None"""
+    if not current_app.config.get('ARCHIVE_ENABLED'):
+        return None
+
+    store = current_app.extensions.get('cold_store')
+    if store is None:
+        store = ColdStore(current_app.config['ARCHIVE_DIR'],
+                          current_app.config.get('ARCHIVE_COMPRESSION', 'zstd'))
+        current_app.extensions['cold_store'] = store
+    return store
+
+
+def _hot_event_dicts(query, fields, offset, limit):
+    """热数据中 [offset, offset + limit) 的事件字典（只查询 fields 对应的列，created_at 转为 ISO 字符串与冷数据一致）"""
+    if limit <= 0:
+        return []
+    events = []
+    for row in query.with_entities(*event_columns(fields)).offset(offset).limit(limit).all():
+        event = event_row_dict(row, fields)
+        if isinstance(event.get('created_at'), datetime):
+            event['created_at'] = event['created_at'].isoformat()
+        events.append(event)
+    return events
+
+
+def read_merged_page(query, store, filters, sort_by, sort_order, offset, limit, fields=EVENT_FIELDS):
+    """
+    跨冷热数据的一页事件，返回 (事件字典列表, 总数)；query 为已筛选、排序的热数据查询
+
+    按时间排序时归档数据都早于数据库中的数据（倒序时热数据在前，正序时冷数据在前），
+    按两边的行数直接定位，不需要取出页之前的行。按页面排序时两边的前 offset + limit 行都要参与合并，
+    深度超过 ARCHIVE_MERGE_MAX_ROWS 时抛出 ValueError。
+    """
+    hot_total = query.order_by(None).count()
+    cold_total = store.count_events(filters)
+    total = hot_total + cold_total
+
+    if sort_by != 'created_at':
+        depth = offset + limit
+        max_rows = current_app.config.get('ARCHIVE_MERGE_MAX_ROWS', 10000)
+        if depth > max_rows:
+            raise ValueError(f'跨归档数据按页面排序时最多翻到第 {max_rows} 条，请缩小日期范围或按时间排序')
+        merge_fields = tuple(field for field in EVENT_FIELDS
+                             if field in fields or field in ('page_url', 'created_at'))
+        hot_events = _hot_event_dicts(query, merge_fields, 0, depth)
+        cold_events = store.read_event_dicts(filters, sort_by, sort_order, limit=depth)
+        events = merge_event_pages(hot_events, cold_events, sort_by, sort_order, offset, limit)
+        return project_event_dicts(events, fields), total
+
+    if sort_order == 'asc':
+        events = project_event_dicts(store.read_event_page(filters, 'asc', offset, limit), fields)
+        events += _hot_event_dicts(query, fields, max(0, offset - cold_total), limit - len(events))
+    else:
+        events = _hot_event_dicts(query, fields, offset, limit) if offset < hot_total else []
+        if len(events) < limit:
+            events += project_event_dicts(
+                store.read_event_page(filters, 'desc', max(0, offset - hot_total), limit - len(events)), fields)
+    return events, total
+
+
+def merge_event_pages(hot_events, cold_events, sort_by, sort_order, offset, limit):
+    """合并已排序的热数据和冷数据，返回 [offset, offset + limit) 区间"""
+    reverse = sort_order != 'asc'
+    if sort_by == 'page_url':
+        def key(event):
+            return (event['page_url'] is not None, event['page_url'] or '', event['created_at'] or '')
+    else:
+        def key(event):
+            return event['created_at'] or ''
+
+    merged = sorted(hot_events + cold_events, key=key, reverse=reverse)
+    return merged[offset:offset + limit]
+
+
+@archive_cli.command('run')
+@click.option('--days', type=int, default=None, help='归档早于多少天的数据（默认 ARCHIVE_AFTER_DAYS）')
+def run_archive(days):
+    """将旧事件归档到 Parquet 文件并从数据库中删除"""
+    if not current_app.config.get('ARCHIVE_ENABLED'):
+        raise click.ClickException('未启用归档（ARCHIVE_ENABLED）')
+
+    store = get_cold_store()
+    days = days if days is not None else current_app.config.get('ARCHIVE_AFTER_DAYS', 30)
+    cutoff = date.today() - timedelta(days=days)
+
+    oldest = db.session.query(db.func.min(Event.created_at)).scalar()
+    if not oldest or oldest.date() >= cutoff:
+        click.echo('没有需要归档的数据')
+        return
+
+    day = oldest.date()
+    total = 0
+    while day < cutoff:
+        rows = store.archive_day(day)
+        if rows:
+            click.echo(f'{day.isoformat()}: 归档 {rows} 条')
+        total += rows
+        day += timedelta(days=1)
+
+    click.echo(f'归档完成，共 {total} 条')
+
+
+@archive_cli.command('stats')
+def backfill_archive_stats():
+    """为早期归档文件补充 manifest 中的类型 / 页面 / 用户计数"""
+    if not current_app.config.get('ARCHIVE_ENABLED'):
+        raise click.ClickException('未启用归档（ARCHIVE_ENABLED）')
+
+    filled = get_cold_store().backfill_counts()
+    click.echo(f'已补充 {filled} 个文件的计数')
@@ -0,0 +1,213 @@
+"""
+增量导出（变更流）
+
+下游 ETL 通过水位线（watermark）拉取上次同步之后的新增事件、删除墓碑和 identify 关联记录，
+不再需要每晚重新导出整个日期范围。identify 会原地更新已有事件的 user_id，
+下游按关联记录（anonymous_id -> user_id）同步更新即可。
+
+水位线格式为 "<事件ID>:<墓碑ID>:<关联记录ID>"，对客户端而言是不透明字符串，
+原样回传上一次响应中的 next_since 即可。
+
+自增ID的分配顺序不等于提交顺序：InnoDB 下并发事务可能先提交较大的ID，较小的ID稍后才可见。
+水位线如果直接推进到已读到的最大ID，之后才提交的较小ID就会被永久跳过。因此：
+- 对外的变更流只返回"已稳定"的行：写入时间早于 CHANGES_SETTLE_SECONDS 秒之前的行，
+  ID 小于仍在稳定期内的最小ID，更新的行留到下一次拉取；
+- 进程内的增量同步（最近事件窗口、实时事件流）用 ChangeCursor，新行立即处理，
+  水位线只推进到已稳定的位置，之间缺失的ID每次同步时补查，按ID去重。
+两者都假设单个写入事务（包括 ingest 批量提交的排队时间）短于 CHANGES_SETTLE_SECONDS。
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import Event, EventTombstone, IdentityLink
+
+
+DEFAULT_CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 10000
+
+
+def parse_watermark(since):
+    """解析水位线，返回 (事件ID, 墓碑ID, 关联记录ID)；格式错误时抛出 ValueError"""
+    if not since:
+        return 0, 0, 0
+
+    parts = str(since).split(':')
+    if len(parts) > 3:
+        raise ValueError(f'无效的水位线: {since}')
+    # 兼容只传事件ID、或 "<事件ID>:<墓碑ID>" 的旧式水位线
+    parts.extend(['0'] * (3 - len(parts)))
+
+    marks = tuple(int(part) for part in parts)
+    if any(mark < 0 for mark in marks):
+        raise ValueError(f'无效的水位线: {since}')
+    return marks
+
+
+def format_watermark(event_mark, tombstone_mark, identity_mark=0):
+    """生成水位线字符串"""
+    return f'{event_mark}:{tombstone_mark}:{identity_mark}'
+
+
+def unsettled_floor(model, time_column, mark, settle_seconds):
+    """返回 mark 之后写入时间仍在稳定期内的最小ID；没有或不启用时返回 None"""
+    if settle_seconds <= 0:
+        return None
+    cutoff = datetime.now() - timedelta(seconds=settle_seconds)
+    return db.session.query(db.func.min(model.id)) \
+        .filter(model.id > mark, time_column > cutoff).scalar()
+
+
+def _settled_rows(model, time_column, mark, limit, settle_seconds):
+    query = model.query.filter(model.id > mark)
+    floor = unsettled_floor(model, time_column, mark, settle_seconds)
+    if floor is not None:
+        # 稳定期内的行之后可能还有较小的ID未提交，水位线不能越过它们
+        query = query.filter(model.id < floor)
+    return query.order_by(model.id.asc()).limit(limit).all()
+
+
+def fetch_changes(since, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    按ID顺序获取水位线之后的一批新增事件、删除墓碑和 identify 关联记录
+
+    每个流各自最多返回 limit 条，has_more 表示还有未拉取完的数据；
+    最近 CHANGES_SETTLE_SECONDS 秒内写入的行暂不返回，等较小的ID都提交后再出现在下一批中。
+    """
+    event_mark, tombstone_mark, identity_mark = parse_watermark(since)
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+    settle_seconds = current_app.config.get('CHANGES_SETTLE_SECONDS', 5)
+
+    # 多取一条用于判断是否还有下一批
+    events = _settled_rows(Event, Event.created_at, event_mark, limit + 1, settle_seconds)
+    tombstones = _settled_rows(EventTombstone, EventTombstone.deleted_at, tombstone_mark, limit + 1, settle_seconds)
+    identities = _settled_rows(IdentityLink, IdentityLink.created_at, identity_mark, limit + 1, settle_seconds)
+
+    has_more = len(events) > limit or len(tombstones) > limit or len(identities) > limit
+    events = events[:limit]
+    tombstones = tombstones[:limit]
+    identities = identities[:limit]
+
+    if events:
+        event_mark = events[-1].id
+    if tombstones:
+        tombstone_mark = tombstones[-1].id
+    if identities:
+        identity_mark = identities[-1].id
+
+    return {
+        'events': [event.to_dict() for event in events],
+        'deleted': [tombstone.to_dict() for tombstone in tombstones],
+        'identities': [identity.to_dict() for identity in identities],
+        'next_since': format_watermark(event_mark, tombstone_mark, identity_mark),
+        'has_more': has_more
+    }
+
+
+class ChangeCursor:
+    """
+    进程内按主键增量同步的游标
+
+    mark 之前的ID都已处理且不会再有新的提交；(mark, seen] 之间已处理的ID记录在 known 中，
+    其余的ID可能属于尚未提交的事务，由 fetch_gaps 补查。调用方负责加锁。
+    指定 columns 时只查询这些列（必须包含主键），返回结果行而不是 ORM 实例。
+    """
+
+    def __init__(self, model, time_column, settle_seconds=5, columns=None):
+        self.model = model
+        self.time_column = time_column
+        self.settle_seconds = settle_seconds
+        self.columns = columns
+        self.mark = 0
+        self.seen = 0
+        self.known = set()
+        self.has_more = False
+
+    def start(self, mark):
+        """从 mark 之后开始同步"""
+        self.mark = self.seen = mark
+        self.known = set()
+
+    def start_at_latest(self):
+        """从当前最大ID开始同步；稳定期内的行由第一次 fetch_gaps 补发"""
+        model = self.model
+        self.seen = db.session.query(db.func.max(model.id)).scalar() or 0
+        floor = unsettled_floor(model, self.time_column, 0, self.settle_seconds)
+        if floor is None:
+            self.mark = self.seen
+        else:
+            self.mark = db.session.query(db.func.max(model.id)).filter(model.id < floor).scalar() or 0
+        self.known = set()
+
+    def remember(self, row_id):
+        """记录本进程已经处理过的行（如本地写入），返回是否为新行"""
+        if row_id <= self.mark or row_id in self.known:
+            return False
+        self.known.add(row_id)
+        return True
+
+    def fetch_gaps(self, limit=1000):
+        """补查 (mark, seen] 中还没有见到的ID，返回其中已提交的新行"""
+        missing = [row_id for row_id in range(self.mark + 1, self.seen + 1) if row_id not in self.known]
+        if not missing:
+            return []
+        model = self.model
+        rows = self._query().filter(model.id.in_(missing[:limit])).order_by(model.id.asc()).all()
+        return [row for row in rows if self.remember(row.id)]
+
+    def fetch_new(self, limit=None):
+        """拉取 seen 之后的新行（按ID升序，跳过本进程已处理过的）；has_more 表示可能还有下一批"""
+        model = self.model
+        query = self._query().filter(model.id > self.seen).order_by(model.id.asc())
+        if limit:
+            query = query.limit(limit)
+        rows = query.all()
+        self.has_more = bool(limit) and len(rows) >= limit
+        if rows:
+            self.seen = rows[-1].id
+        return [row for row in rows if self.remember(row.id)]
+
+    def settle(self):
+        """把 mark 推进到稳定期之前，丢弃不再需要的去重记录"""
+        floor = unsettled_floor(self.model, self.time_column, self.mark, self.settle_seconds)
+        if floor is None:
+            self.mark = self.seen
+        else:
+            # 只推进到稳定期之前最后一条已处理的行：紧挨在稳定期行之前缺失的ID可能仍在事务中
+            self.mark = max([self.mark] + [row_id for row_id in self.known if row_id < floor])
+        self.known = {row_id for row_id in self.known if row_id > self.mark}
+
+    def _query(self):
+        if self.columns:
+            return db.session.query(*self.columns)
+        return self.model.query
+
+
+def delete_events(event_ids):
+    """
+    删除事件并写入墓碑（不提交事务，由调用方负责 commit）
+
+    返回实际删除的条数。
+    """
+    if not event_ids:
+        return 0
+
+    existing_ids = [row[0] for row in db.session.query(Event.id).filter(Event.id.in_(event_ids)).all()]
+    if not existing_ids:
+        return 0
+
+    deleted_count = Event.query.filter(Event.id.in_(existing_ids)).delete(synchronize_session=False)
+    record_tombstones(existing_ids)
+    return deleted_count
+
+
+def record_tombstones(event_ids):
+    """为已删除的事件（包括从归档文件中删除的）写入墓碑（不提交事务）"""
+    if not event_ids:
+        return
+    now = datetime.now()
+    db.session.execute(
+        EventTombstone.__table__.insert(),
+        [{'event_id': event_id, 'deleted_at': now} for event_id in event_ids]
+    )
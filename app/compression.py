@@ -0,0 +1,154 @@
+"""
+响应压缩
+
+按 Accept-Encoding 协商 br / zstd / gzip（br、zstd 需要安装 brotli、zstandard，未安装时只提供 gzip），
+作用于 COMPRESS_BLUEPRINTS 中的蓝图（列表、统计、导出等接口）：
+- 普通响应小于 COMPRESS_MIN_SIZE 字节时不压缩；
+- 流式响应（生成器、send_file）边读边压缩，不会把整个文件读进内存；
+- 只压缩文本类内容（JSON、CSV、HTML 等），xlsx 等已压缩格式跳过。
+
+远程管理端主要受带宽限制，压缩级别按算法在 COMPRESS_LEVELS 中配置。
+"""
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+
+DEFAULT_LEVELS = {'br': 5, 'zstd': 6, 'gzip': 6}
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31：带 gzip 头和校验
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def available_encodings(preferred):
+    """按服务端偏好顺序返回已安装的编码"""
+    installed = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+    return [encoding for encoding in preferred if installed.get(encoding)]
+
+
+def make_compressor(encoding, level):
+    if encoding == 'br':
+        return _BrotliCompressor(level)
+    if encoding == 'zstd':
+        return _ZstdCompressor(level)
+    return _GzipCompressor(level)
+
+
+def _is_compressible(mimetype):
+    # 事件流需要逐条即时送达，压缩器的缓冲会让推送延迟，不压缩
+    if mimetype is None or mimetype == 'text/event-stream':
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, encodings, levels, min_size):
+    """对响应做内容协商压缩，返回（可能被替换了响应体的）response"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or not _is_compressible(response.mimetype)
+            or request.method == 'HEAD'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding is None:
+        return response
+
+    streamed = response.direct_passthrough or response.is_streamed
+    if not streamed and (response.content_length or 0) < min_size:
+        return response
+
+    compressor = make_compressor(encoding, levels.get(encoding, DEFAULT_LEVELS[encoding]))
+    if streamed:
+        # send_file 的文件包装器或生成器：边读边压缩，长度未知
+        response.response = _compress_stream(response.response, compressor)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.compress(response.get_data()) + compressor.flush())
+
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的字节区间与原文件不同，不再支持 Range 请求
+    response.headers.pop('Accept-Ranges', None)
+    if response.get_etag()[0]:
+        # 不同编码的表示需要不同的弱 ETag
+        etag, _ = response.get_etag()
+        response.set_etag(f'{etag}-{encoding}', weak=True)
+    return response
+
+
+def init_compression(app):
+    """为 COMPRESS_BLUEPRINTS 中的蓝图注册响应压缩"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    encodings = available_encodings(app.config.get('COMPRESS_ALGORITHMS', ['br', 'zstd', 'gzip']))
+    levels = dict(DEFAULT_LEVELS, **(app.config.get('COMPRESS_LEVELS') or {}))
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    blueprints = set(app.config.get('COMPRESS_BLUEPRINTS', ['main', 'export']))
+
+    @app.after_request
+    def compress(response):
+        if request.blueprint not in blueprints:
+            return response
+        return compress_response(response, encodings, levels, min_size)
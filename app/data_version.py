@@ -0,0 +1,177 @@
+"""
+事件数据版本与列表接口的条件请求
+
+数据版本 = (最大事件ID, 最大墓碑ID, 最大 identify 记录ID[, 归档清单版本])：
+新增事件推高第一项，任何删除路径（批量删除、删除任务、保留策略）都会写墓碑推高第二项，
+identify 把匿名事件关联到用户时写入关联记录推高第三项，归档把事件移入冷存储时清单版本递增。
+各个 MAX 都走主键索引，一次查询即可取到。
+
+被 @conditional_event_list 装饰的列表接口：
+- 根据 数据版本 + 路径 + 查询参数 计算弱 ETag，并给出 Last-Modified；
+- If-None-Match 命中时直接返回 304，不执行分页查询；
+- 否则先查进程内的短期结果缓存（键同样包含数据版本，数据变化后自然失效），未命中才执行查询。
+
+各个 MAX(ID) 只在ID按提交顺序可见时才能代表数据版本：并发写入时较小的ID可能在较大的ID被读到之后才提交，
+版本不变而数据已经变化。因此最近一次写入还在 CHANGES_SETTLE_SECONDS 稳定期内时（与增量导出相同的假设），
+版本视为未稳定：不返回 ETag、不返回 304、不读写结果缓存，直接执行查询。持续写入期间列表接口相当于不缓存，
+写入停止一个稳定期后恢复。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import func, select
+
+from app import db
+from app.archive import get_cold_store
+from app.models import Event, EventTombstone, IdentityLink
+
+
+DataVersion = namedtuple('DataVersion', ['max_event_id', 'max_tombstone_id', 'max_identity_id',
+                                         'cold_version', 'last_modified', 'settled'])
+
+# 压缩后 ETag 会带上编码后缀（见 app/compression.py），比较时去掉
+_ENCODING_SUFFIXES = ('-br', '-zstd', '-gzip')
+
+
+def get_data_version():
+    """读取当前数据版本（同一请求内只查询一次）"""
+    version = g.get('data_version')
+    if version is not None:
+        return version
+
+    row = db.session.execute(select(
+        select(func.max(Event.id)).scalar_subquery(),
+        select(func.max(EventTombstone.id)).scalar_subquery(),
+        select(func.max(IdentityLink.id)).scalar_subquery(),
+        select(func.max(Event.created_at)).scalar_subquery(),
+        select(func.max(EventTombstone.deleted_at)).scalar_subquery(),
+        select(func.max(IdentityLink.created_at)).scalar_subquery()
+    )).one()
+    max_event_id, max_tombstone_id, max_identity_id, last_created, last_deleted, last_linked = row
+
+    cold_store = get_cold_store()
+    cold_version = cold_store.version if cold_store else 0
+
+    changed = [value for value in (last_created, last_deleted, last_linked) if value is not None]
+    newest = max(changed) if changed else None
+    settle_seconds = current_app.config.get('CHANGES_SETTLE_SECONDS', 5)
+    settled = newest is None or newest <= datetime.now() - timedelta(seconds=settle_seconds)
+    version = DataVersion(max_event_id or 0, max_tombstone_id or 0, max_identity_id or 0, cold_version,
+                          newest.replace(microsecond=0) if newest else None, settled)
+    g.data_version = version
+    return version
+
+
+def compute_etag(version):
+    """数据版本 + 路径 + 查询参数（与顺序无关）的摘要"""
+    digest = hashlib.sha1()
+    digest.update(f'{version.max_event_id}:{version.max_tombstone_id}:{version.max_identity_id}:'
+                  f'{version.cold_version}'.encode())
+    digest.update(request.path.encode())
+    for key, value in sorted(request.args.items(multi=True)):
+        digest.update(f'\0{key}={value}'.encode())
+    return digest.hexdigest()[:20]
+
+
+def _strip_encoding(tag):
+    for suffix in _ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        if request.if_none_match.star_tag:
+            return True
+        return any(_strip_encoding(tag) == etag for tag in request.if_none_match.as_set(include_weak=True))
+    # 没有 If-None-Match 时才看 If-Modified-Since
+    since = request.if_modified_since
+    return bool(since and last_modified and last_modified <= since.replace(tzinfo=None))
+
+
+class ResponseCache:
+    """键为 ETag 的短期响应缓存（LRU + TTL）"""
+
+    def __init__(self, ttl=10, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, body, mimetype):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_response_cache():
+    cache = current_app.extensions.get('event_list_cache')
+    if cache is None:
+        cache = ResponseCache(
+            ttl=current_app.config.get('EVENT_LIST_CACHE_SECONDS', 10),
+            max_entries=current_app.config.get('EVENT_LIST_CACHE_SIZE', 256)
+        )
+        current_app.extensions['event_list_cache'] = cache
+    return cache
+
+
+def _with_validators(response, etag, version):
+    response.set_etag(etag, weak=True)
+    if version.last_modified is not None:
+        response.last_modified = version.last_modified
+    # 浏览器每次都带验证器回源确认
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional_event_list(view):
+    """列表接口的 ETag / 304 / 短期缓存（需放在 @read_replica 之内，使版本查询同样走副本）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get('EVENT_LIST_CONDITIONAL', True):
+            return view(*args, **kwargs)
+
+        version = get_data_version()
+        if not version.settled:
+            # 稳定期内可能还有较小的ID未提交，此时的结果不能和版本绑定
+            response = current_app.make_response(view(*args, **kwargs))
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        etag = compute_etag(version)
+
+        if _not_modified(etag, version.last_modified):
+            return _with_validators(current_app.response_class(status=304), etag, version)
+
+        cache = get_response_cache()
+        cached = cache.get(etag)
+        if cached is not None:
+            body, mimetype = cached
+            return _with_validators(current_app.response_class(body, mimetype=mimetype), etag, version)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        cache.put(etag, response.get_data(), response.mimetype)
+        return _with_validators(response, etag, version)
+    return wrapper
@@ -0,0 +1,114 @@
+"""
+event_metadata 的原生 JSON 存储与提升字段
+
+- flask metadata promote        为 EVENT_PROMOTED_METADATA_KEYS 中的键创建生成列和索引
+
+MySQL 上 event_metadata 从 TEXT 转为原生 JSON 类型由 Alembic 迁移完成（flask db upgrade，
+见 migrations/versions/3f1c2a9b7d10_event_metadata_json.py）。
+
+管理端筛选支持 meta.<key>=value 语法：提升过的键直接命中生成列 meta_<key> 上的索引，
+其他键退化为 JSON 路径表达式（全表扫描）。配置了但还没执行 promote 的键同样走 JSON 路径，
+生成列是否存在在首次筛选时检查一次并缓存在 app.extensions['promoted_metadata_columns']，
+执行 promote 后需重启 worker 才会切到生成列。
+"""
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import String, cast, inspect, literal_column, text
+
+from app import db
+from app.models import Event
+
+
+metadata_cli = AppGroup('metadata', help='事件元数据（JSON）维护')
+
+METADATA_FILTER_PREFIX = 'meta.'
+
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_]{1,48}$')
+
+
+def validate_metadata_key(key):
+    """元数据键只允许字母、数字和下划线（会被拼接进生成列名和 JSON 路径）"""
+    if not _KEY_PATTERN.match(key):
+        raise ValueError(f'无效的元数据键: {key}')
+    return key
+
+
+def promoted_column_name(key):
+    return f'meta_{key}'
+
+
+def get_promoted_keys():
+    return current_app.config.get('EVENT_PROMOTED_METADATA_KEYS') or []
+
+
+def get_promoted_columns():
+    """events 表上实际存在的 meta_* 生成列（每个 app 只检查一次）"""
+    columns = current_app.extensions.get('promoted_metadata_columns')
+    if columns is None:
+        columns = frozenset(
+            column['name'] for column in inspect(db.engine).get_columns(Event.__tablename__)
+            if column['name'].startswith('meta_')
+        )
+        current_app.extensions['promoted_metadata_columns'] = columns
+    return columns
+
+
+def metadata_filter_clause(key, value):
+    """构建 meta.<key>=value 的筛选条件"""
+    validate_metadata_key(key)
+    # 只配置未 promote 时列不存在，直接引用会报 no such column
+    if key in get_promoted_keys() and promoted_column_name(key) in get_promoted_columns():
+        return literal_column(f'{Event.__tablename__}.{promoted_column_name(key)}') == str(value)
+    # 统一转为字符串比较：SQLite 的 json_extract 会返回数字等原始类型
+    return cast(Event.event_metadata[key].as_string(), String) == str(value)
+
+
+def _generated_column_ddl(dialect, key):
+    column = promoted_column_name(key)
+    index = f'ix_events_{column}'
+    if dialect == 'mysql':
+        return [
+            f"ALTER TABLE events ADD COLUMN {column} VARCHAR(191) "
+            f"GENERATED ALWAYS AS (JSON_UNQUOTE(JSON_EXTRACT(event_metadata, '$.{key}'))) VIRTUAL",
+            f'CREATE INDEX {index} ON events ({column})'
+        ]
+    if dialect == 'sqlite':
+        return [
+            f"ALTER TABLE events ADD COLUMN {column} TEXT "
+            f"GENERATED ALWAYS AS (json_extract(event_metadata, '$.{key}')) VIRTUAL",
+            f'CREATE INDEX {index} ON events ({column})'
+        ]
+    raise click.ClickException(f'不支持的数据库: {dialect}')
+
+
+def _run(statements, dry_run):
+    for statement in statements:
+        click.echo(statement + ';')
+        if not dry_run:
+            db.session.execute(text(statement))
+    if not dry_run:
+        db.session.commit()
+
+
+@metadata_cli.command('promote')
+@click.option('--dry-run', is_flag=True, help='只打印 SQL，不执行')
+def promote_keys(dry_run):
+    """为配置的元数据键创建生成列和索引（已存在的跳过）"""
+    keys = [validate_metadata_key(key) for key in get_promoted_keys()]
+    if not keys:
+        click.echo('未配置 EVENT_PROMOTED_METADATA_KEYS')
+        return
+
+    existing = {column['name'] for column in inspect(db.engine).get_columns('events')}
+    statements = []
+    for key in keys:
+        if promoted_column_name(key) in existing:
+            click.echo(f'跳过已存在的生成列: {promoted_column_name(key)}')
+            continue
+        statements.extend(_generated_column_ddl(db.engine.dialect.name, key))
+
+    _run(statements, dry_run)
+    current_app.extensions.pop('promoted_metadata_columns', None)
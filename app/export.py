@@ -0,0 +1,178 @@
+"""
+事件数据导出
+
+pandas / openpyxl 体积大、导入慢，只在导出 Excel 时才在函数内部导入；
+CSV 导出直接使用标准库 csv 模块。导出接口放在单独的蓝图中，
+APP_ROLE=ingest 的部署不注册该蓝图。
+"""
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from itertools import chain
+
+from flask import Blueprint, request, jsonify, send_file
+
+from app.models import Event
+from app.queries import get_event_filters, apply_event_filters
+from app.archive import get_cold_store
+from app.replicas import read_replica
+
+
+export_bp = Blueprint('export', __name__)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ['事件ID', '用户ID', '匿名ID', '事件类型', '事件名称', '页面URL', '元素ID',
+                  'IP地址', 'User Agent', '事件数据', '创建时间']
+
+
+def _export_row(event):
+    """事件字典 -> 导出行"""
+    event_data = event['event_metadata']
+    return {
+        '事件ID': event['id'],
+        '用户ID': event['user_id'] if event['user_id'] is not None else '',
+        '匿名ID': event.get('anonymous_id') or '',
+        '事件类型': event['event_type'],
+        '事件名称': event['event_name'],
+        '页面URL': event['page_url'] or '',
+        '元素ID': event['element_id'] or '',
+        'IP地址': event['ip_address'] or '',
+        'User Agent': event['user_agent'] or '',
+        '事件数据': json.dumps(event_data, ensure_ascii=False) if event_data else '',
+        '创建时间': event['created_at'] or ''
+    }
+
+
+def build_csv(rows):
+    """生成带 BOM 的 UTF-8 CSV（Excel 打开中文不乱码）"""
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return io.BytesIO(text.getvalue().encode('utf-8-sig'))
+
+
+def build_excel(rows):
+    """生成 xlsx 文件并按内容调整列宽"""
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='事件数据', index=False)
+
+        # 获取工作表并调整列宽
+        worksheet = writer.sheets['事件数据']
+        for column in worksheet.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            adjusted_width = min(max_length + 2, 50)
+            worksheet.column_dimensions[column_letter].width = adjusted_width
+
+    output.seek(0)
+    return output
+
+
+@export_bp.route('/api/admin/events/export/test', methods=['GET'])
+def export_events_test():
+    """
+    导出功能测试端点
+    """
+    try:
+        # 测试基本功能
+        build_csv([])
+        build_excel([])
+
+        return jsonify({
+            'message': '导出测试成功',
+            'data_created': True,
+            'pandas_available': True
+        })
+
+    except ImportError as e:
+        return jsonify({
+            'error': '依赖包未安装',
+            'details': str(e),
+            'required_packages': ['pandas', 'openpyxl']
+        }), 500
+    except Exception as e:
+        return jsonify({
+            'error': '测试失败',
+            'details': str(e)
+        }), 500
+
+
+@export_bp.route('/api/admin/events/export', methods=['GET'])
+@read_replica
+def export_events():
+    """
+    导出事件数据接口
+    支持格式：csv, excel
+    """
+    try:
+        # 获取查询参数
+        try:
+            filters = get_event_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        export_format = request.args.get('format', 'csv')  # csv 或 excel
+
+        # 构建查询并应用筛选条件
+        query = apply_event_filters(Event.query, filters)
+
+        # 按时间倒序排列
+        events = query.order_by(Event.created_at.desc()).all()
+
+        # 查询范围与归档日期有交集（包括不带 start_date 的全量导出）时追加冷数据（归档数据都早于数据库中的数据）
+        cold_events = []
+        cold_store = get_cold_store()
+        if cold_store and cold_store.needs_cold(filters):
+            cold_events = cold_store.read_event_dicts(filters, 'created_at', 'desc')
+
+        if not events and not cold_events:
+            return jsonify({'error': '没有找到可导出的数据'}), 404
+
+        # 准备数据
+        rows = [_export_row(event) for event in chain((event.to_dict() for event in events), cold_events)]
+
+        # 生成文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"事件数据_{timestamp}"
+
+        if export_format.lower() == 'excel':
+            # 导出为 Excel
+            return send_file(
+                build_excel(rows),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name=f'{filename}.xlsx'
+            )
+
+        # 导出为 CSV
+        response = send_file(
+            build_csv(rows),
+            mimetype='text/csv; charset=utf-8',  # 明确指定字符集
+            as_attachment=True,
+            download_name=f'{filename}.csv'
+        )
+
+        # 添加额外的头部信息
+        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        # 添加缓存控制头部，避免缓存问题
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+
+        return response
+    except Exception as e:
+        logger.exception('导出错误')
+        return jsonify({'error': '导出失败', 'details': str(e)}), 500
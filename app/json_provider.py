@@ -0,0 +1,57 @@
+"""
+基于 orjson 的 JSON 编码
+
+安装了 orjson 时替换 Flask 默认的 JSON provider（jsonify 走 C 实现的编码器），
+输出与默认 provider 保持一致：键排序、datetime 仍按 Flask 的 HTTP 日期格式处理。
+未安装时保持 Flask 默认行为。
+"""
+import json
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    _PROVIDER_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                         | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _iso_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def fast_dumps(obj):
+    """编码为 UTF-8 JSON 字节串（datetime 输出 ISO 格式，不排序键）"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_iso_default).encode('utf-8')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """使用 orjson 编码的 JSON provider"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # indent 等 orjson 不支持的参数交给标准库
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=_PROVIDER_OPTIONS).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # 调试模式下保留缩进输出
+            return super().response(obj)
+        body = orjson.dumps(obj, default=self.default, option=_PROVIDER_OPTIONS) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    if orjson is not None and app.config.get('JSON_FAST_PROVIDER', True):
+        app.json = OrjsonProvider(app)
@@ -0,0 +1,289 @@
+"""
+管理端实时事件流（Server-Sent Events）
+
+管理端页面通过 GET /api/admin/events/stream 订阅新写入的事件，不再反复轮询完整的列表查询：
+- 每个进程一个 EventBroker，ingest 路径写入成功后把事件发布给本进程的所有订阅者，
+  按订阅时的筛选条件（与 /api/admin/events 相同）在内存中匹配，不访问数据库；
+- 其他 worker 写入的事件由本进程的跟随线程按主键增量拉取后发布：有订阅者时才运行，
+  每 LIVE_STREAM_POLL_SECONDS 秒一次主键范围查询，与订阅者数量无关；
+  使用 ChangeCursor，较晚提交的较小ID在之后的拉取中补发，不会因水位线已越过而丢失；
+- 每个订阅者一个有界队列（LIVE_STREAM_QUEUE_SIZE），队列满说明客户端消费不过来，
+  直接断开该订阅者（发送 dropped 事件），不让慢客户端拖住发布方或占用无限内存；
+- 最近 LIVE_STREAM_REPLAY_SIZE 条事件保留在内存中，EventSource 重连时根据 Last-Event-ID 补发断开期间的事件；
+- 单个连接最长 LIVE_STREAM_MAX_SECONDS 秒后由服务端结束，浏览器自动重连，该值必须小于 gunicorn 的 timeout。
+
+每个连接在整个连接期间占用处理它的 worker 或线程，因此按 worker 类型限制连接数（worker_stream_capacity）：
+gevent worker 和开发服务器按 LIVE_STREAM_MAX_SUBSCRIBERS；gthread worker 最多占用 LIVE_STREAM_THREAD_SHARE
+比例的线程；sync worker 直接拒绝（返回 503），否则一个连接就让整个 worker 最长 LIVE_STREAM_MAX_SECONDS 秒不处理其他请求。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.changes import ChangeCursor
+from app.models import Event
+from app.serializers import project_event_dicts
+
+
+logger = logging.getLogger(__name__)
+
+# 跟随线程每次最多拉取的事件数
+_POLL_BATCH_SIZE = 500
+
+
+class LiveStreamFull(Exception):
+    """订阅者数量已达上限，应返回 503"""
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def worker_stream_capacity(environ, config):
+    """当前 worker 能同时保持的连接数（environ 为请求的 WSGI environ）；0 表示不支持实时事件流"""
+    limit = config.get('LIVE_STREAM_MAX_SUBSCRIBERS', 20)
+    if _gevent_patched() or not str(environ.get('SERVER_SOFTWARE', '')).startswith('gunicorn'):
+        return limit
+    if not environ.get('wsgi.multithread'):
+        # sync worker
+        return 0
+    # gthread worker：线程数由 gunicorn_config.py 写入 GUNICORN_THREADS
+    threads = int(os.environ.get('GUNICORN_THREADS') or 1)
+    return min(limit, int(threads * config.get('LIVE_STREAM_THREAD_SHARE', 0.25)))
+
+
+def event_matches(event, filters):
+    """事件字典是否满足 get_event_filters 的筛选条件（语义与 apply_event_filters 一致）"""
+    if filters.get('user_id') and event.get('user_id') != filters['user_id']:
+        return False
+    if filters.get('anonymous_id') and event.get('anonymous_id') != filters['anonymous_id']:
+        return False
+    if filters.get('event_type') and event.get('event_type') != filters['event_type']:
+        return False
+    for name in ('page_url', 'event_name'):
+        if filters.get(name) and filters[name] not in (event.get(name) or ''):
+            return False
+    if filters.get('start_date') or filters.get('end_date'):
+        created = datetime.fromisoformat(event['created_at'])
+        if filters.get('start_date') and created < filters['start_date']:
+            return False
+        if filters.get('end_date') and created > filters['end_date']:
+            return False
+    metadata = event.get('event_metadata') or {}
+    for key, value in (filters.get('meta') or {}).items():
+        if key not in metadata or metadata[key] is None or str(metadata[key]) != str(value):
+            return False
+    return True
+
+
+class Subscriber:
+    """一个 SSE 连接：筛选条件 + 有界队列"""
+
+    def __init__(self, filters, queue_size):
+        self.filters = filters
+        self.queue = queue.Queue(queue_size)
+        self.dropped = False
+
+    def offer(self, event):
+        """发布方调用，永不阻塞；队列满时标记为已丢弃，返回是否仍然有效"""
+        if self.dropped:
+            return False
+        if not event_matches(event, self.filters):
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+
+class EventBroker:
+    """进程内的事件扇出"""
+
+    def __init__(self, app, queue_size=1000, max_subscribers=20, replay_size=1000, poll_interval=1.0,
+                 settle_seconds=5):
+        self.app = app
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.dropped = 0
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)
+        self._recent_ids = set()
+        self._lock = threading.Lock()
+        self._follower = None
+        self._cursor = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event):
+        """发布一条已提交的事件（字典形式）"""
+        with self._lock:
+            # 本进程写入的事件跟随线程也会从数据库拉到，按最近发布过的 ID 去重
+            if event['id'] in self._recent_ids:
+                return
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_ids.discard(self._recent[0]['id'])
+            self._recent.append(event)
+            self._recent_ids.add(event['id'])
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            if not subscriber.offer(event):
+                self._remove(subscriber, dropped=True)
+
+    def subscribe(self, filters, last_event_id=None):
+        """注册订阅者；last_event_id 不为空时先放入断开期间的事件"""
+        subscriber = Subscriber(filters, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise LiveStreamFull()
+            for event in self._replay_after(last_event_id):
+                if not subscriber.offer(event):
+                    break
+            self._subscribers.add(subscriber)
+            if self.poll_interval > 0 and self._follower is None:
+                self._start_follower()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._remove(subscriber)
+
+    def _remove(self, subscriber, dropped=False):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+            if dropped:
+                self.dropped += 1
+        if dropped:
+            logger.warning('实时事件流订阅者消费过慢，已断开', extra={'queue_size': self.queue_size})
+
+    def _replay_after(self, last_event_id):
+        if last_event_id is None:
+            return []
+        recent = list(self._recent)
+        # 按发布顺序而不是 ID 大小定位：其他 worker 的事件由跟随线程稍后发布，ID 可能小于已发送的本地事件
+        for index, event in enumerate(recent):
+            if event['id'] == last_event_id:
+                return recent[index + 1:]
+        return [event for event in recent if event['id'] > last_event_id]
+
+    # ===== 其他 worker 写入的事件 =====
+
+    def _start_follower(self):
+        self._follower = threading.Thread(target=self._follow, name='live-stream-follower', daemon=True)
+        self._follower.start()
+
+    def _follow(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self._poll()
+            except Exception:
+                logger.exception('实时事件流拉取新事件失败')
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    # 没有订阅者时退出，下一个订阅者到来时重新从当前最大 ID 开始跟随
+                    self._follower = None
+                    self._cursor = None
+                    return
+
+    def _poll(self):
+        if self._cursor is None:
+            self._cursor = ChangeCursor(Event, Event.created_at, self.settle_seconds)
+            self._cursor.start_at_latest()
+            return
+        # 本进程写入的事件游标也会拉到，由 publish 按最近发布过的 ID 去重
+        rows = self._cursor.fetch_gaps(_POLL_BATCH_SIZE) + self._cursor.fetch_new(_POLL_BATCH_SIZE)
+        for row in rows:
+            self.publish(row.to_dict())
+        self._cursor.settle()
+
+
+def get_event_broker(create=True, max_subscribers=None):
+    broker = current_app.extensions.get('live_stream')
+    if broker is None and create:
+        config = current_app.config
+        broker = EventBroker(
+            current_app._get_current_object(),
+            queue_size=config.get('LIVE_STREAM_QUEUE_SIZE', 1000),
+            max_subscribers=max_subscribers or config.get('LIVE_STREAM_MAX_SUBSCRIBERS', 20),
+            replay_size=max(1, config.get('LIVE_STREAM_REPLAY_SIZE', 1000)),
+            poll_interval=config.get('LIVE_STREAM_POLL_SECONDS', 1.0),
+            settle_seconds=config.get('CHANGES_SETTLE_SECONDS', 5)
+        )
+        current_app.extensions['live_stream'] = broker
+    return broker
+
+
+def publish_event(event_data):
+    """ingest 路径调用：还没有人订阅过时什么也不做"""
+    broker = get_event_broker(create=False)
+    if broker is not None:
+        broker.publish(event_data)
+
+
+def _sse_message(event, event_name=None):
+    lines = []
+    if event_name:
+        lines.append(f'event: {event_name}')
+    if event is not None and 'id' in event:
+        lines.append(f'id: {event["id"]}')
+    lines.append('data: ' + json.dumps(event, ensure_ascii=False, default=str))
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_stream(broker, subscriber, fields, decorate=None):
+    """生成 SSE 响应体：事件、心跳注释，超过最长时间或被丢弃时结束"""
+    config = current_app.config
+    heartbeat = config.get('LIVE_STREAM_HEARTBEAT_SECONDS', 15)
+    deadline = time.monotonic() + config.get('LIVE_STREAM_MAX_SECONDS', 25)
+    try:
+        # 告诉浏览器断开后多久重连
+        yield f'retry: {int(config.get("LIVE_STREAM_RETRY_MS", 1000))}\n\n'
+        while True:
+            if subscriber.dropped:
+                yield _sse_message({'reason': '消费过慢，请重新连接'}, 'dropped')
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                events = [subscriber.queue.get(timeout=min(heartbeat, remaining))]
+            except queue.Empty:
+                if time.monotonic() < deadline:
+                    # 心跳注释，防止代理因空闲断开连接
+                    yield ': keep-alive\n\n'
+                continue
+            while len(events) < 100:
+                try:
+                    events.append(subscriber.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = [dict(event) for event in project_event_dicts(events, fields)]
+            if decorate:
+                decorate(events)
+                # 用户名通常来自缓存；未命中时查过库，立即归还连接，不在长连接期间占用
+                db.session.close()
+            yield ''.join(_sse_message(event) for event in events)
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,227 @@
+"""
+非阻塞的结构化日志
+
+请求线程只把日志记录放进有界内存队列（QueueHandler），由后台线程（QueueListener）
+格式化并写入文件和标准错误，日志盘卡顿不再直接变成请求延迟：
+- 队列满时直接丢弃（计入 dropped），绝不阻塞请求；ERROR 及以上同样遵守此规则；
+- 输出为单行 JSON，带 request_id（来自 X-Request-ID 请求头或自动生成，并回写到响应头）、
+  方法、路径、进程号，以及通过 extra= 传入的字段；
+- LOG_SAMPLING 按 logger 名称前缀配置采样率，只作用于 WARNING 以下的高频日志；
+- 文件使用 WatchedFileHandler：多个 gunicorn worker 以追加方式写同一个文件，
+  由 logrotate 等外部工具轮转（copytruncate 不需要，按 create 方式轮转即可），
+  每个进程检测到文件被移走后自动重新打开，不会出现多个进程各自轮转互相覆盖的问题。
+
+preload_app 时应用在 master 中创建，后台线程不会随 fork 进入 worker，
+因此在 fork 后的子进程中重建队列并重新启动后台线程。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+
+# LogRecord 的标准属性，其余属性视为 extra= 传入的结构化字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_REQUEST_ID_HEADER = 'X-Request-ID'
+
+_pipeline = None
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为单行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        elif record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """在请求线程中给记录补上 request_id、方法和路径（后台线程中已无请求上下文）"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 名称前缀采样 WARNING 以下的日志，例如 {'app.sql_profiler': 0.1}"""
+
+    def __init__(self, rates):
+        super().__init__()
+        # 最长前缀优先匹配
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def rate_for(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        # 记录采样率，便于统计时还原真实数量
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不是阻塞或报错"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 只在请求线程中解析消息和异常文本，其余格式化交给后台线程
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """根 logger 上的队列处理器及其后台写入线程"""
+
+    def __init__(self, handlers, queue_size, filters):
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        for log_filter in filters:
+            self.queue_handler.addFilter(log_filter)
+        self.listener = None
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def restart_after_fork(self):
+        # 父进程的队列锁可能在 fork 时被后台线程持有，子进程换用新队列
+        self.queue_handler.queue = queue.Queue(self.queue_size)
+        self.queue_handler.dropped = 0
+        self.start()
+
+    def stop(self):
+        if self.listener is not None:
+            # 写完队列中剩余的记录
+            self.listener.stop()
+            self.listener = None
+        for handler in self.handlers:
+            handler.close()
+
+    @property
+    def dropped(self):
+        return self.queue_handler.dropped
+
+
+def _after_fork_in_child():
+    if _pipeline is not None and _pipeline.listener is not None:
+        _pipeline.restart_after_fork()
+
+
+def _stop_pipeline():
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(_stop_pipeline)
+
+
+def get_logging_pipeline():
+    return _pipeline
+
+
+def _build_handlers(app):
+    if app.config.get('LOG_JSON', True):
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(app.config['LOG_FORMAT'])
+
+    handlers = [logging.StreamHandler()]
+    log_file = app.config.get('LOG_FILE')
+    if log_file and not app.debug:
+        handlers.append(logging.handlers.WatchedFileHandler(log_file, encoding='utf-8', delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def init_logging(app):
+    """把根 logger 的输出改为 队列 -> 后台线程 -> 文件/标准错误，并注册 request_id 钩子"""
+    global _pipeline
+
+    level = logging.DEBUG if app.debug else getattr(logging, app.config['LOG_LEVEL'])
+    root = logging.getLogger()
+
+    # 重复创建应用（测试、基准脚本）时替换之前的管道
+    if _pipeline is not None:
+        root.removeHandler(_pipeline.queue_handler)
+        _pipeline.stop()
+
+    filters = [RequestContextFilter()]
+    if app.config.get('LOG_SAMPLING'):
+        filters.append(SamplingFilter(app.config['LOG_SAMPLING']))
+
+    _pipeline = LoggingPipeline(_build_handlers(app), app.config.get('LOG_QUEUE_SIZE', 10000), filters)
+    _pipeline.start()
+    root.addHandler(_pipeline.queue_handler)
+    root.setLevel(level)
+    app.extensions['logging_pipeline'] = _pipeline
+
+    @app.before_request
+    def assign_request_id():
+        # 只接受长度合理的外部 ID，避免把任意内容写进日志
+        incoming = request.headers.get(_REQUEST_ID_HEADER, '')
+        g.request_id = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[_REQUEST_ID_HEADER] = request_id
+        return response
+
+    return _pipeline
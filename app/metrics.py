@@ -0,0 +1,198 @@
+"""
+Prometheus 指标
+
+/metrics 暴露：
+- 每个路由的请求耗时直方图（endpoint、method、status）
+- 事件采集成功 / 拒绝计数
+- 每个请求的数据库查询次数和耗时
+- 连接池、准入闸门和 SQLite 组提交队列的深度
+
+gunicorn 多 worker 下通过 PROMETHEUS_MULTIPROC_DIR 共享目录（由 gunicorn_config.py 设置）汇总所有 worker 的数据，
+任意一个 worker 处理 /metrics 请求都能返回全局结果。
+
+热路径上每个请求只有几次计时和 mmap 写入；队列深度这类 gauge 每个 worker 至多每
+METRICS_GAUGE_REFRESH_SECONDS 秒刷新一次。未安装 prometheus_client 或 METRICS_ENABLED=false 时不注册任何钩子。
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+from app.pool import pool_status
+from app.sqlite_mode import get_group_commit_writer
+
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+INGEST_ENDPOINTS = {'main.record_event', 'main.ingest_event'}
+
+# 当前线程（gevent 下为当前协程）正在处理的请求的数据库计数
+_request_state = threading.local()
+
+_metrics = None
+
+
+class _Metrics:
+    """所有指标对象（首次启用时创建，进程内唯一）"""
+
+    def __init__(self):
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', '请求处理耗时', ['endpoint', 'method', 'status'])
+        self.events_ingested = Counter('events_ingested_total', '成功写入的事件数')
+        self.events_rejected = Counter('events_rejected_total', '被拒绝的事件上报', ['reason'])
+        self.db_queries = Histogram(
+            'db_queries_per_request', '单个请求执行的 SQL 条数', ['endpoint'],
+            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+        self.db_time = Histogram(
+            'db_time_per_request_seconds', '单个请求的数据库耗时', ['endpoint'],
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+        # 多进程下按存活 worker 求和
+        self.pool_size = Gauge('db_pool_size', '连接池大小', ['pool'], multiprocess_mode='livesum')
+        self.pool_checked_out = Gauge('db_pool_checked_out', '已借出的连接数', ['pool'], multiprocess_mode='livesum')
+        self.pool_wait_max = Gauge('db_pool_wait_max_seconds', '获取连接的最长等待', ['pool'], multiprocess_mode='max')
+        self.admission_in_flight = Gauge('db_admission_in_flight', '已获准访问数据库的请求数', multiprocess_mode='livesum')
+        self.admission_waiting = Gauge('db_admission_waiting', '等待准入的请求数', multiprocess_mode='livesum')
+        self.writer_queue_depth = Gauge('sqlite_group_commit_queue_depth', '组提交队列中的事件数', multiprocess_mode='livesum')
+        self.log_records_dropped = Gauge('log_records_dropped', '日志队列已满而丢弃的记录数', multiprocess_mode='livesum')
+        self.live_stream_subscribers = Gauge('live_stream_subscribers', '实时事件流订阅者数', multiprocess_mode='livesum')
+        self.live_stream_dropped = Gauge('live_stream_dropped', '因消费过慢被断开的订阅者数', multiprocess_mode='livesum')
+
+        self.gauges_refreshed_at = 0.0
+
+
+def _reason_for_status(status):
+    if status == 503:
+        return 'busy'
+    if status in (401, 422):
+        return 'unauthorized'
+    if status == 400:
+        return 'invalid'
+    return 'error'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_request_state, 'active', False):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts and getattr(_request_state, 'active', False):
+        _request_state.db_time += time.perf_counter() - starts.pop()
+        _request_state.db_queries += 1
+
+
+def refresh_gauges(metrics, force=False):
+    """把连接池和队列的当前状态写入 gauge"""
+    now = time.monotonic()
+    if not force and now - metrics.gauges_refreshed_at < current_app.config.get('METRICS_GAUGE_REFRESH_SECONDS', 1.0):
+        return
+    metrics.gauges_refreshed_at = now
+
+    engines = [('primary', db.engine)]
+    engines.extend((replica.name, replica.engine) for replica in current_app.extensions['replicas'].replicas)
+    for name, engine in engines:
+        status = pool_status(engine)
+        if 'size' in status:
+            metrics.pool_size.labels(name).set(status['size'])
+            metrics.pool_checked_out.labels(name).set(status['checked_out'])
+        if 'wait_max_ms' in status:
+            metrics.pool_wait_max.labels(name).set(status['wait_max_ms'] / 1000)
+
+    gate = current_app.extensions.get('admission_gate')
+    if gate is not None:
+        metrics.admission_in_flight.set(gate.in_flight)
+        metrics.admission_waiting.set(gate.waiting)
+
+    writer = get_group_commit_writer()
+    if writer is not None:
+        metrics.writer_queue_depth.set(writer.depth)
+
+    pipeline = current_app.extensions.get('logging_pipeline')
+    if pipeline is not None:
+        metrics.log_records_dropped.set(pipeline.dropped)
+
+    broker = current_app.extensions.get('live_stream')
+    if broker is not None:
+        metrics.live_stream_subscribers.set(broker.subscriber_count)
+        metrics.live_stream_dropped.set(broker.dropped)
+
+
+def init_metrics(app):
+    """注册请求计时钩子和 /metrics 蓝图（需在准入闸门之前调用，使被拒绝的请求也能计时）"""
+    global _metrics
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+    try:
+        import prometheus_client  # noqa: F401
+    except ImportError:
+        logger.warning('未安装 prometheus_client，/metrics 不可用')
+        return None
+
+    if _metrics is None:
+        _metrics = _Metrics()
+        # SQL 计数钩子对进程内所有引擎生效，只在首次启用时注册一次
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    metrics = _metrics
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_request_timer():
+        _request_state.started = time.perf_counter()
+        _request_state.db_queries = 0
+        _request_state.db_time = 0.0
+        _request_state.active = True
+
+    @app.after_request
+    def record_request_metrics(response):
+        if not getattr(_request_state, 'active', False):
+            return response
+        _request_state.active = False
+
+        endpoint = request.endpoint or 'unmatched'
+        status = response.status_code
+        metrics.request_latency.labels(endpoint, request.method, status).observe(
+            time.perf_counter() - _request_state.started)
+        metrics.db_queries.labels(endpoint).observe(_request_state.db_queries)
+        metrics.db_time.labels(endpoint).observe(_request_state.db_time)
+
+        if endpoint in INGEST_ENDPOINTS:
+            if status == 201:
+                metrics.events_ingested.inc()
+            else:
+                metrics.events_rejected.labels(_reason_for_status(status)).inc()
+
+        refresh_gauges(metrics)
+        return response
+
+    app.register_blueprint(metrics_bp)
+    return metrics
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 抓取端点"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    refresh_gauges(current_app.extensions['metrics'], force=True)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -36,12 +36,14 @@ class Event(db.Model):
     __tablename__ = 'events'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # 通过写入密钥匿名上报的事件没有 user_id，由 anonymous_id（设备/匿名ID）标识，identify 后再关联用户
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    anonymous_id = db.Column(db.String(64), index=True)
     event_type = db.Column(db.String(50), nullable=False)  # 事件类型：click、view、login等
     event_name = db.Column(db.String(100), nullable=False)  # 事件名称
     page_url = db.Column(db.String(500))  # 页面URL
     element_id = db.Column(db.String(100))  # 元素ID
-    event_metadata = db.Column(db.Text)  # 额外数据，存储为JSON格式
+    event_metadata = db.Column(db.JSON)  # 额外数据，原生JSON类型（MySQL JSON / SQLite JSON1）
     ip_address = db.Column(db.String(45))  # IP地址
     user_agent = db.Column(db.Text)  # 用户代理
     created_at = db.Column(db.DateTime, default=datetime.now, index=True)
@@ -51,15 +53,122 @@ class Event(db.Model):
         return {
             'id': self.id,
             'user_id': self.user_id,
+            'anonymous_id': self.anonymous_id,
             'event_type': self.event_type,
             'event_name': self.event_name,
             'page_url': self.page_url,
             'element_id': self.element_id,
-            'event_metadata': json.loads(self.event_metadata) if self.event_metadata else {},
+            'event_metadata': self.event_metadata or {},
             'ip_address': self.ip_address,
             'user_agent': self.user_agent,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
     def __repr__(self):
-        return f'<Event {self.event_type}:{self.event_name}>'
\ No newline at end of file
+        return f'<Event {self.event_type}:{self.event_name}>'
+
+class EventTombstone(db.Model):
+    """事件删除墓碑：记录被删除的事件ID，供增量导出同步删除"""
+    __tablename__ = 'event_tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, nullable=False)  # 被删除的事件ID
+    deleted_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+    def to_dict(self):
+        """将墓碑对象转换为字典"""
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None
+        }
+
+    def __repr__(self):
+        return f'<EventTombstone {self.event_id}>'
+
+
+class WriteKey(db.Model):
+    """项目级写入密钥：用于匿名/设备事件上报，只保存密钥的 SHA-256"""
+    __tablename__ = 'write_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    key_prefix = db.Column(db.String(16), nullable=False)  # 密钥前几位，便于识别
+    active = db.Column(db.Boolean, nullable=False, default=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    revoked_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """将写入密钥转换为字典（不含密钥本身）"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'key_prefix': self.key_prefix,
+            'active': self.active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'revoked_at': self.revoked_at.isoformat() if self.revoked_at else None
+        }
+
+    def __repr__(self):
+        return f'<WriteKey {self.name}>'
+
+
+class IdentityLink(db.Model):
+    """identify 记录：匿名ID 关联到用户，同时作为数据版本和增量导出的变更流"""
+    __tablename__ = 'identity_links'
+
+    id = db.Column(db.Integer, primary_key=True)
+    anonymous_id = db.Column(db.String(64), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    linked_count = db.Column(db.Integer, nullable=False, default=0)  # 本次关联的事件数
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+    def to_dict(self):
+        """将关联记录转换为字典"""
+        return {
+            'id': self.id,
+            'anonymous_id': self.anonymous_id,
+            'user_id': self.user_id,
+            'linked_count': self.linked_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<IdentityLink {self.anonymous_id}->{self.user_id}>'
+
+
+class DeleteJob(db.Model):
+    """后台分块删除任务（按条件删除 / 数据保留策略）"""
+    __tablename__ = 'delete_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False, default='filter')  # filter 或 retention
+    filters = db.Column(db.Text, nullable=False)  # 筛选条件，存储为JSON格式
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending、running、completed、failed
+    cursor_id = db.Column(db.Integer, nullable=False, default=0)  # 已处理到的事件ID，用于断点续删
+    deleted_count = db.Column(db.Integer, nullable=False, default=0)
+    estimated_total = db.Column(db.Integer)  # 创建任务时估算的待删除条数
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """将任务对象转换为字典"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'filters': json.loads(self.filters) if self.filters else {},
+            'status': self.status,
+            'cursor_id': self.cursor_id,
+            'deleted_count': self.deleted_count,
+            'estimated_total': self.estimated_total,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<DeleteJob {self.id}:{self.status}>'
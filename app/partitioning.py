@@ -0,0 +1,198 @@
+"""
+events 表按 created_at 的时间分区（仅 MySQL）
+
+- flask partitions init          将现有 events 表转换为 RANGE COLUMNS(created_at) 分区表
+- flask partitions maintain      预先创建未来的分区（建议每天由 cron 执行）
+- flask partitions drop-before   按分区整体删除某日期之前的数据（DROP PARTITION，瞬间完成）
+
+注意：MySQL 分区表要求主键包含分区列且不支持外键，
+init 会把主键改为 (id, created_at) 并删除 user_id 上的外键约束。
+通过 DROP PARTITION 删除的数据不会写入删除墓碑，下游需按日期同步清理。
+"""
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from app import db
+
+
+partitions_cli = AppGroup('partitions', help='events 表时间分区维护')
+
+MAXVALUE_PARTITION = 'pmax'
+
+
+def _period_start(day, granularity):
+    """返回日期所在分区周期的起始日"""
+    if granularity == 'daily':
+        return day
+    return day.replace(day=1)
+
+
+def _next_period(day, granularity):
+    """返回下一个分区周期的起始日"""
+    if granularity == 'daily':
+        return day + timedelta(days=1)
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def partition_name(start, granularity):
+    """分区命名：月分区 p202401，日分区 p20240115"""
+    if granularity == 'daily':
+        return start.strftime('p%Y%m%d')
+    return start.strftime('p%Y%m')
+
+
+def partition_bounds(first_day, last_day, granularity):
+    """
+    生成覆盖 [first_day, last_day] 的分区列表
+
+    返回 [(分区名, 上界日期), ...]，上界为开区间（VALUES LESS THAN）。
+    """
+    bounds = []
+    start = _period_start(first_day, granularity)
+    while start <= last_day:
+        upper = _next_period(start, granularity)
+        bounds.append((partition_name(start, granularity), upper))
+        start = upper
+    return bounds
+
+
+def _partition_clause(name, upper):
+    return f"PARTITION {name} VALUES LESS THAN ('{upper.isoformat()}')"
+
+
+def _get_settings():
+    granularity = current_app.config.get('EVENTS_PARTITION_GRANULARITY', 'monthly')
+    if granularity not in ('monthly', 'daily'):
+        raise click.ClickException(f'不支持的分区粒度: {granularity}')
+    precreate = current_app.config.get('EVENTS_PARTITION_PRECREATE', 3)
+    return granularity, precreate
+
+
+def _ensure_mysql():
+    if db.engine.dialect.name != 'mysql':
+        raise click.ClickException('时间分区仅支持 MySQL 数据库')
+
+
+def get_existing_partitions():
+    """读取 events 表当前的分区 [(分区名, 上界表达式), ...]，未分区时返回空列表"""
+    rows = db.session.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )).all()
+    return [(row[0], row[1]) for row in rows]
+
+
+def _parse_upper_bound(description):
+    """解析 PARTITION_DESCRIPTION，例如 '2024-02-01 00:00:00'；MAXVALUE 返回 None"""
+    value = description.strip("'")
+    if value.upper() == 'MAXVALUE':
+        return None
+    return datetime.fromisoformat(value).date()
+
+
+def _run(statements, dry_run):
+    for statement in statements:
+        click.echo(statement + ';')
+        if not dry_run:
+            db.session.execute(text(statement))
+    if not dry_run:
+        db.session.commit()
+
+
+@partitions_cli.command('init')
+@click.option('--dry-run', is_flag=True, help='只打印 SQL，不执行')
+def init_partitions(dry_run):
+    """将 events 表转换为按 created_at 分区的表"""
+    _ensure_mysql()
+    granularity, precreate = _get_settings()
+
+    if get_existing_partitions():
+        raise click.ClickException('events 表已经是分区表，请使用 maintain 命令')
+
+    first = db.session.execute(text('SELECT MIN(created_at) FROM events')).scalar()
+    today = date.today()
+    first_day = first.date() if first else today
+
+    last_day = today
+    for _ in range(precreate):
+        last_day = _next_period(_period_start(last_day, granularity), granularity)
+
+    statements = []
+    foreign_keys = db.session.execute(text(
+        "SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events' AND CONSTRAINT_TYPE = 'FOREIGN KEY'"
+    )).scalars().all()
+    for name in foreign_keys:
+        statements.append(f'ALTER TABLE events DROP FOREIGN KEY `{name}`')
+
+    statements.append('UPDATE events SET created_at = NOW() WHERE created_at IS NULL')
+    statements.append('ALTER TABLE events MODIFY created_at DATETIME NOT NULL')
+    statements.append('ALTER TABLE events DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)')
+
+    clauses = [_partition_clause(name, upper) for name, upper in partition_bounds(first_day, last_day, granularity)]
+    clauses.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)')
+    statements.append('ALTER TABLE events PARTITION BY RANGE COLUMNS(created_at) (\n    '
+                      + ',\n    '.join(clauses) + '\n)')
+
+    _run(statements, dry_run)
+    click.echo(f'已生成 {len(clauses)} 个分区')
+
+
+@partitions_cli.command('maintain')
+@click.option('--dry-run', is_flag=True, help='只打印 SQL，不执行')
+def maintain_partitions(dry_run):
+    """预先创建未来的分区（从 pmax 分区中拆分）"""
+    _ensure_mysql()
+    granularity, precreate = _get_settings()
+
+    existing = get_existing_partitions()
+    if not existing:
+        raise click.ClickException('events 表尚未分区，请先执行 init 命令')
+
+    bounded = [upper for upper in (_parse_upper_bound(desc) for _, desc in existing) if upper]
+    start = max(bounded) if bounded else _period_start(date.today(), granularity)
+
+    target = _period_start(date.today(), granularity)
+    for _ in range(precreate + 1):
+        target = _next_period(target, granularity)
+
+    new_bounds = []
+    while start < target:
+        upper = _next_period(start, granularity)
+        new_bounds.append((partition_name(start, granularity), upper))
+        start = upper
+
+    if not new_bounds:
+        click.echo('未来分区已足够，无需创建')
+        return
+
+    clauses = [_partition_clause(name, upper) for name, upper in new_bounds]
+    clauses.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)')
+    _run([f'ALTER TABLE events REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO (\n    '
+          + ',\n    '.join(clauses) + '\n)'], dry_run)
+    click.echo(f'新建 {len(new_bounds)} 个分区')
+
+
+@partitions_cli.command('drop-before')
+@click.argument('cutoff')
+@click.option('--dry-run', is_flag=True, help='只打印 SQL，不执行')
+def drop_partitions_before(cutoff, dry_run):
+    """删除上界不晚于 CUTOFF（YYYY-MM-DD）的全部分区"""
+    _ensure_mysql()
+    cutoff_day = date.fromisoformat(cutoff)
+
+    expired = [name for name, desc in get_existing_partitions()
+               if _parse_upper_bound(desc) and _parse_upper_bound(desc) <= cutoff_day]
+    if not expired:
+        click.echo('没有需要删除的分区')
+        return
+
+    _run([f"ALTER TABLE events DROP PARTITION {', '.join(expired)}"], dry_run)
+    click.echo(f'已删除 {len(expired)} 个分区')
@@ -0,0 +1,318 @@
+"""
+密码哈希执行器
+
+scrypt / pbkdf2 按设计就是耗 CPU、耗内存的，放在 sync worker 里同步执行时，
+一波登录或撞库请求就能占满所有 worker，埋点上报随之排队。这里做三层隔离：
+- 整台主机同时进行的哈希数不超过 PASSWORD_HASH_MAX_CONCURRENT：每个名额是 PASSWORD_HASH_SLOT_DIR 下的
+  一个锁文件，持有名额即持有该文件的 flock。worker 被 gunicorn 杀掉（超时、max_requests 回收、OOM）时
+  内核自动释放文件锁，名额不会泄漏；拿不到名额时以非阻塞方式轮询（gevent 下 sleep 会让出 hub），
+  等待 PASSWORD_HASH_QUEUE_TIMEOUT 秒后返回 503，而不是占着 worker 排队；
+- 哈希在每个 worker 自己的小进程池中执行（PASSWORD_HASH_POOL_SIZE 个进程，降低调度优先级），
+  协程 / 线程 worker 在等待结果期间可以继续处理其他请求；为 0 时在请求线程内执行；
+- 等待哈希期间暂时交还数据库准入名额和连接，登录请求不会挤占埋点写入的连接。
+
+哈希参数由 PASSWORD_HASH_METHOD / PASSWORD_SALT_LENGTH 配置，参数变化后用户下次登录成功时自动用新参数重新哈希。
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+
+from flask import current_app, g
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import db
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为进程间信号量（worker 异常退出时名额无法回收）
+    fcntl = None
+
+# 哈希进程内缓存：配置的方法 -> werkzeug 实际写入哈希串的方法（补全默认参数后）
+_normalized_methods = {}
+
+
+class PasswordHashingBusy(Exception):
+    """哈希并发已满，应返回 503"""
+
+
+def _hash_method_of(pwhash):
+    return pwhash.split('$', 1)[0]
+
+
+def _normalized_method(method, salt_length):
+    if method not in _normalized_methods:
+        _normalized_methods[method] = _hash_method_of(generate_password_hash('', method, salt_length))
+    return _normalized_methods[method]
+
+
+def _hash_task(password, method, salt_length):
+    return generate_password_hash(password, method, salt_length)
+
+
+def _verify_task(pwhash, password, method, salt_length):
+    """校验密码；成功且哈希参数已过时则顺便返回新哈希"""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if _hash_method_of(pwhash) != _normalized_method(method, salt_length):
+        return True, generate_password_hash(password, method, salt_length)
+    return True, None
+
+
+# 本进程当前持有的名额锁文件描述符
+_held_leases = set()
+
+
+def _init_hash_process(niceness):
+    # 哈希进程由 worker fork 而来，会继承 worker 正持有的名额描述符；
+    # 立即关闭（不解锁），否则 worker 被杀后哈希进程仍握着文件锁，名额无法回收
+    for fd in list(_held_leases):
+        os.close(fd)
+    _held_leases.clear()
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+class _SlotLeases:
+    """主机级名额：每个名额一个锁文件，进程退出时由内核释放"""
+
+    def __init__(self, directory, count, poll_interval=0.005):
+        self.directory = directory
+        self.count = max(1, count)
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self._paths = [os.path.join(directory, f'slot-{index}.lock') for index in range(self.count)]
+
+    def _try_acquire(self):
+        for path in self._paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            _held_leases.add(fd)
+            return fd
+        return None
+
+    def acquire(self, timeout):
+        """返回租约（文件描述符），timeout 秒内拿不到时返回 None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            lease = self._try_acquire()
+            if lease is not None or time.monotonic() >= deadline:
+                return lease
+            time.sleep(self.poll_interval)
+
+    def release(self, lease):
+        _held_leases.discard(lease)
+        # 显式解锁：fork 出的进程即使还持有描述符副本，名额也立即归还
+        fcntl.flock(lease, fcntl.LOCK_UN)
+        os.close(lease)
+
+
+class _SemaphoreLeases:
+    """没有 fcntl 的平台：进程间信号量（preload_app 时在 master 中创建，由各 worker 继承）"""
+
+    def __init__(self, count):
+        self._semaphore = multiprocessing.BoundedSemaphore(max(1, count))
+
+    def acquire(self, timeout):
+        return True if self._semaphore.acquire(timeout=timeout) else None
+
+    def release(self, lease):
+        self._semaphore.release()
+
+
+class PasswordHasher:
+    """主机级并发上限 + 每个 worker 的哈希进程池"""
+
+    def __init__(self, method, salt_length, max_concurrent, queue_timeout, pool_size, timeout, niceness,
+                 slot_dir=None):
+        self.method = method
+        self.salt_length = salt_length
+        self.queue_timeout = queue_timeout
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.niceness = niceness
+        self.rejected = 0
+        if fcntl is not None:
+            self._slots = _SlotLeases(slot_dir or os.path.join(tempfile.gettempdir(), 'tracking_app_hash_slots'),
+                                      max_concurrent)
+        else:
+            self._slots = _SemaphoreLeases(max_concurrent)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        # 本 worker 已提交、尚未执行完的哈希数（包括等待超时后仍在哈希进程中运行的）
+        self._in_flight = 0
+
+    def _get_executor(self):
+        # 进程池不能跨 fork 使用，每个 worker 首次使用时各自创建
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                # 哈希进程只执行 werkzeug 的哈希函数，不会用到 fork 时从 worker 继承的锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    initializer=_init_hash_process,
+                    initargs=(self.niceness,)
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _release(self, lease):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release(lease)
+
+    def _submit(self, fn, *args, slot_timeout, check_pool=True):
+        """
+        占用一个主机级名额并提交到本 worker 的哈希进程池，返回 Future
+
+        名额在哈希真正执行完时才归还：等待超时的请求虽已返回 503，哈希进程仍在计算，
+        提前归还会让同时进行的哈希超过上限。本 worker 的哈希进程都在忙时直接拒绝，不占名额排队。
+        """
+        with self._lock:
+            if check_pool and self._in_flight >= self.pool_size:
+                self.rejected += 1
+                raise PasswordHashingBusy()
+            self._in_flight += 1
+        lease = self._slots.acquire(slot_timeout)
+        if lease is None:
+            with self._lock:
+                self._in_flight -= 1
+            self.rejected += 1
+            raise PasswordHashingBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release(lease)
+            raise
+        future.add_done_callback(lambda _: self._release(lease))
+        return future
+
+    def _run(self, fn, *args):
+        with released_db_admission():
+            if self.pool_size <= 0:
+                lease = self._slots.acquire(self.queue_timeout)
+                if lease is None:
+                    self.rejected += 1
+                    raise PasswordHashingBusy()
+                try:
+                    return fn(*args)
+                finally:
+                    self._slots.release(lease)
+            future = self._submit(fn, *args, slot_timeout=self.queue_timeout)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                raise PasswordHashingBusy()
+
+    def hash(self, password):
+        return self._run(_hash_task, password, self.method, self.salt_length)
+
+    def hash_many(self, passwords):
+        """
+        批量哈希（批量开通用户接口）：与登录共用主机级名额和本 worker 的哈希进程池，
+        同时最多占用 pool_size 个名额；每个名额最多等待 PASSWORD_HASH_TIMEOUT 秒，拿不到时抛出 PasswordHashingBusy
+        """
+        args = (self.method, self.salt_length)
+        if self.pool_size <= 0:
+            hashes = []
+            for password in passwords:
+                lease = self._slots.acquire(self.timeout)
+                if lease is None:
+                    self.rejected += 1
+                    raise PasswordHashingBusy()
+                try:
+                    hashes.append(_hash_task(password, *args))
+                finally:
+                    self._slots.release(lease)
+            return hashes
+
+        futures = []
+        for password in passwords:
+            pending = [future for future in futures if not future.done()]
+            if len(pending) >= self.pool_size:
+                wait(pending, return_when=FIRST_COMPLETED)
+            # 自己的并发已由上面的等待限制，不再按本 worker 的在途数拒绝
+            futures.append(self._submit(_hash_task, password, *args, slot_timeout=self.timeout, check_pool=False))
+        return [future.result() for future in futures]
+
+    def verify(self, pwhash, password):
+        """返回 (是否匹配, 需要写回的新哈希或 None)"""
+        return self._run(_verify_task, pwhash, password, self.method, self.salt_length)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+class released_db_admission:
+    """哈希期间交还数据库准入名额和连接，结束后重新排队获取"""
+
+    def __enter__(self):
+        gate = current_app.extensions.get('admission_gate')
+        self.gate = gate if gate is not None and g.pop('admitted', False) else None
+        if self.gate is not None:
+            # 结束只读事务，把连接还给连接池（已加载的对象会在下次访问时重新读取）
+            db.session.rollback()
+            self.gate.release()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.gate is None or exc_type is not None:
+            return False
+        if not self.gate.acquire():
+            raise PasswordHashingBusy()
+        g.admitted = True
+        return False
+
+
+def hash_passwords(passwords, method, salt_length, workers, niceness=0):
+    """
+    批量哈希（flask users provision 命令），workers > 1 时分摊到多个进程
+
+    不受主机级名额限制，会占满指定数量的 CPU；Web 请求中请使用 PasswordHasher.hash_many。
+    """
+    if workers <= 1 or len(passwords) < 2:
+        return [_hash_task(password, method, salt_length) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_hash_process, initargs=(niceness,)) as executor:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(_hash_task, passwords, [method] * len(passwords),
+                                 [salt_length] * len(passwords), chunksize=chunksize))
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def hash_password(password):
+    """按当前配置的参数哈希密码（可能抛出 PasswordHashingBusy）"""
+    return get_password_hasher().hash(password)
+
+
+def verify_password(pwhash, password):
+    """校验密码，返回 (是否匹配, 新哈希或 None)（可能抛出 PasswordHashingBusy）"""
+    return get_password_hasher().verify(pwhash, password)
+
+
+def init_password_hasher(app):
+    hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        salt_length=app.config.get('PASSWORD_SALT_LENGTH', 16),
+        max_concurrent=app.config.get('PASSWORD_HASH_MAX_CONCURRENT', 2),
+        queue_timeout=app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 0.05),
+        pool_size=app.config.get('PASSWORD_HASH_POOL_SIZE', 1),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5),
+        niceness=app.config.get('PASSWORD_HASH_NICE', 10),
+        slot_dir=app.config.get('PASSWORD_HASH_SLOT_DIR')
+    )
+    previous = app.extensions.get('password_hasher')
+    if previous is not None:
+        previous.shutdown()
+    app.extensions['password_hasher'] = hasher
+    return hasher
@@ -0,0 +1,217 @@
+"""
+按 worker 分配的数据库连接预算与连接池监控
+
+DB_CONNECTION_BUDGET 表示整台主机允许打开的数据库连接总数，按 gunicorn worker 数平均分配：
+每个 worker 的 pool_size = 预算 // worker 数，max_overflow = 0，部署或重启时不会出现连接风暴。
+
+每个 worker 内再用准入闸门（AdmissionGate）限制同时访问数据库的请求数不超过 pool_size，
+超出的请求排队等待；排队数或等待时间超过上限时直接返回 503，而不是堆积溢出连接。
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """连接获取次数与等待时间"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def to_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3)
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录从连接池获取连接耗时的 QueuePool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record(0, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+# SQLAlchemy 按连接池类所在模块命名日志记录器，开发环境的 DEBUG 根日志会输出每次借还连接，这里单独调高级别
+logging.getLogger(f'{__name__}.{InstrumentedQueuePool.__name__}').setLevel(logging.WARNING)
+
+
+class AdmissionGate:
+    """限制单个 worker 内同时访问数据库的请求数"""
+
+    def __init__(self, capacity, queue_limit, timeout):
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        """获取许可；排队已满或等待超时返回 False"""
+        if self._semaphore.acquire(blocking=False):
+            self._admit(0.0)
+            return True
+
+        with self._lock:
+            if self.waiting >= self.queue_limit:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+
+        started = time.perf_counter()
+        acquired = self._semaphore.acquire(timeout=self.timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+        if acquired:
+            self._admit(time.perf_counter() - started)
+        return acquired
+
+    def _admit(self, wait):
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def to_dict(self):
+        return {
+            'capacity': self.capacity,
+            'queue_limit': self.queue_limit,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'wait_avg_ms': round(self.wait_total / self.admitted * 1000, 3) if self.admitted else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 3)
+        }
+
+
+def get_worker_count():
+    """当前主机的 worker 数（由 gunicorn_config.py 写入 GUNICORN_WORKERS）"""
+    value = os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1
+    return max(1, int(value))
+
+
+def configure_connection_budget(app):
+    """根据连接预算计算每个 worker 的连接池参数（需在 db.init_app 之前调用）"""
+    budget = app.config.get('DB_CONNECTION_BUDGET') or 0
+    if budget <= 0 or app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:///:memory:'):
+        return None
+
+    workers = get_worker_count()
+    pool_size = max(app.config.get('DB_MIN_POOL_SIZE', 2), budget // workers)
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': 0,
+        'pool_timeout': app.config.get('DB_POOL_TIMEOUT', 10)
+    })
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    # 后台线程（删除任务、组提交写线程）也会占用连接，闸门给它们留出一个
+    gate = AdmissionGate(
+        capacity=max(1, pool_size - 1),
+        queue_limit=app.config.get('DB_ADMISSION_QUEUE_LIMIT', 100),
+        timeout=app.config.get('DB_ADMISSION_TIMEOUT', 5)
+    )
+    app.extensions['admission_gate'] = gate
+
+    exempt = set(app.config.get('DB_ADMISSION_EXEMPT_ENDPOINTS') or ())
+
+    @app.before_request
+    def admit_request():
+        if request.endpoint in exempt or request.endpoint is None:
+            return None
+        if not gate.acquire():
+            return jsonify({'error': '服务繁忙，请稍后重试'}), 503
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(exc=None):
+        if g.pop('admitted', False):
+            gate.release()
+
+    return options
+
+
+def pool_status(engine):
+    """连接池当前使用情况"""
+    pool = engine.pool
+    status = {'pid': os.getpid(), 'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'checked_in': pool.checkedin()
+        })
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(stats.to_dict())
+    return status
+
+
+def get_pool_report(db):
+    """主库、副本连接池以及准入闸门的汇总"""
+    report = {
+        'workers': get_worker_count(),
+        'budget': current_app.config.get('DB_CONNECTION_BUDGET') or 0,
+        'primary': pool_status(db.engine),
+        'replicas': [dict(pool_status(replica.engine), name=replica.name)
+                     for replica in current_app.extensions['replicas'].replicas]
+    }
+    gate = current_app.extensions.get('admission_gate')
+    if gate is not None:
+        report['admission'] = gate.to_dict()
+    return report
@@ -0,0 +1,345 @@
+"""
+按需 CPU 采样与内存快照
+
+PROFILING_ENABLED=true 时才注册钩子和 /api/admin/profiling/* 接口，关闭时没有任何额外开销。
+所有接口都要求请求头 X-Admin-Token 与 PROFILING_ADMIN_TOKEN 一致（未配置令牌时一律拒绝）。
+
+CPU 采样：
+- 按 PROFILING_SAMPLE_RATE 随机抽取请求，或在请求头带 X-Profile: 1（同样需要管理令牌）指定某个请求；
+- 被抽中的请求由一个后台线程每 PROFILING_INTERVAL_MS 毫秒抓取一次处理线程的调用栈，
+  结果为折叠栈格式（flamegraph.pl / speedscope 可直接读取），指定请求的响应头 X-Profile-Id 给出结果编号。
+- gevent worker 下不可用：所有协程跑在同一个系统线程里，sys._current_frames() 只能看到 hub 线程，
+  而采样协程运行时请求协程都停在让出点，抓到的只有等待位置而不是 CPU 耗时。
+  此时不做随机采样，带 X-Profile: 1 的请求和采样结果接口返回 400，tracemalloc 接口不受影响。
+
+内存：
+- 通过接口启停 tracemalloc，快照返回分配最多的位置以及与上一次快照的差异。
+
+所有数据只保存在当前 worker 进程内，结果中带 pid 区分。
+"""
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, g, jsonify, request
+
+
+profiling_bp = Blueprint('profiling', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+def _gevent_patched():
+    """threading 是否已被 gevent 打补丁"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """定时抓取指定线程的调用栈"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+
+def folded(stacks):
+    """折叠栈文本：每行 '栈;帧 次数'"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class Profiler:
+    """当前 worker 的采样结果和内存快照"""
+
+    def __init__(self, sample_rate=0.0, interval_ms=5, history=50, tracemalloc_frames=10, cpu_sampling=True):
+        self.cpu_sampling = cpu_sampling
+        self.sample_rate = sample_rate if cpu_sampling else 0.0
+        self.interval = interval_ms / 1000
+        self.tracemalloc_frames = tracemalloc_frames
+        self.profiles = deque(maxlen=history)
+        self.by_endpoint = {}
+        self.last_snapshot = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def should_sample(self, explicit):
+        return explicit or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler, started, endpoint):
+        stacks = sampler.stop()
+        profile = {
+            'id': next(self._ids),
+            'pid': os.getpid(),
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'started_at': started,
+            'duration_ms': round((time.time() - started) * 1000, 3),
+            'samples': sampler.samples,
+            'stacks': stacks
+        }
+        with self._lock:
+            self.profiles.append(profile)
+            self.by_endpoint.setdefault(endpoint, Counter()).update(stacks)
+        return profile
+
+    def get_profile(self, profile_id):
+        with self._lock:
+            return next((profile for profile in self.profiles if profile['id'] == profile_id), None)
+
+    def reset(self):
+        with self._lock:
+            self.profiles.clear()
+            self.by_endpoint = {}
+
+    # ===== tracemalloc =====
+
+    def snapshot(self, group_by='lineno', top=20):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            'pid': os.getpid(),
+            'traced_current_bytes': current,
+            'traced_peak_bytes': peak,
+            'top': [{
+                'location': _trace_location(stat.traceback),
+                'size_bytes': stat.size,
+                'count': stat.count
+            } for stat in snapshot.statistics(group_by)[:top]]
+        }
+        if self.last_snapshot is not None:
+            result['diff'] = [{
+                'location': _trace_location(stat.traceback),
+                'size_diff_bytes': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size_bytes': stat.size
+            } for stat in snapshot.compare_to(self.last_snapshot, group_by)[:top]]
+        self.last_snapshot = snapshot
+        return result
+
+
+def _trace_location(traceback):
+    return [f'{frame.filename}:{frame.lineno}' for frame in traceback]
+
+
+def get_profiler():
+    return current_app.extensions.get('profiler')
+
+
+def admin_token_valid(config_key='PROFILING_ADMIN_TOKEN'):
+    """请求头 X-Admin-Token 是否与 config_key 配置的令牌一致（未配置时为 False）"""
+    token = current_app.config.get(config_key)
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(provided, token)
+
+
+CPU_SAMPLING_UNAVAILABLE = 'gevent worker 下无法按线程采样调用栈，CPU 采样已停用（请在 sync 或 gthread worker 上分析）'
+
+
+def cpu_sampling_required(view):
+    """采样结果接口在 gevent worker 下返回 400，而不是返回空的或只有等待位置的结果"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not get_profiler().cpu_sampling:
+            return jsonify({'error': CPU_SAMPLING_UNAVAILABLE}), 400
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def profiling_admin_required(view):
+    """分析接口只对持有管理令牌的请求开放"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admin_token_valid():
+            return jsonify({'error': '需要有效的管理令牌'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_profiling(app):
+    """PROFILING_ENABLED 时注册采样钩子和分析接口"""
+    if not app.config.get('PROFILING_ENABLED'):
+        return None
+
+    profiler = Profiler(
+        sample_rate=app.config.get('PROFILING_SAMPLE_RATE', 0.0),
+        interval_ms=app.config.get('PROFILING_INTERVAL_MS', 5),
+        history=app.config.get('PROFILING_HISTORY', 50),
+        tracemalloc_frames=app.config.get('PROFILING_TRACEMALLOC_FRAMES', 10),
+        cpu_sampling=not _gevent_patched()
+    )
+    app.extensions['profiler'] = profiler
+    if not profiler.cpu_sampling:
+        logger.warning(CPU_SAMPLING_UNAVAILABLE)
+
+    @app.before_request
+    def start_sampling():
+        explicit = request.headers.get('X-Profile') == '1' and admin_token_valid()
+        if explicit and not profiler.cpu_sampling:
+            return jsonify({'error': CPU_SAMPLING_UNAVAILABLE}), 400
+        if profiler.should_sample(explicit):
+            g.profile_sampler = (profiler.start(), time.time(), explicit)
+
+    @app.after_request
+    def finish_sampling(response):
+        sampling = g.pop('profile_sampler', None)
+        if sampling is not None:
+            sampler, started, explicit = sampling
+            profile = profiler.finish(sampler, started, request.endpoint or 'unmatched')
+            if explicit:
+                response.headers['X-Profile-Id'] = str(profile['id'])
+        return response
+
+    app.register_blueprint(profiling_bp)
+    return profiler
+
+
+@profiling_bp.route('/api/admin/profiling/profiles', methods=['GET'])
+@profiling_admin_required
+@cpu_sampling_required
+def list_profiles():
+    """
+    最近的采样结果（不含调用栈）
+    """
+    profiler = get_profiler()
+    return jsonify({
+        'pid': os.getpid(),
+        'sample_rate': profiler.sample_rate,
+        'profiles': [{key: value for key, value in profile.items() if key != 'stacks'}
+                     for profile in reversed(profiler.profiles)],
+        'endpoints': {endpoint: sum(stacks.values()) for endpoint, stacks in profiler.by_endpoint.items()}
+    })
+
+
+@profiling_bp.route('/api/admin/profiling/profiles/<int:profile_id>', methods=['GET'])
+@profiling_admin_required
+@cpu_sampling_required
+def get_profile(profile_id):
+    """
+    单个请求的折叠栈
+    """
+    profile = get_profiler().get_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': '采样结果不存在或已被淘汰'}), 404
+    return Response(folded(profile['stacks']), mimetype='text/plain')
+
+
+@profiling_bp.route('/api/admin/profiling/flamegraph', methods=['GET'])
+@profiling_admin_required
+@cpu_sampling_required
+def get_flamegraph():
+    """
+    按接口汇总的折叠栈；不指定 endpoint 时汇总全部
+    """
+    profiler = get_profiler()
+    endpoint = request.args.get('endpoint')
+    if endpoint:
+        stacks = profiler.by_endpoint.get(endpoint, Counter())
+    else:
+        stacks = sum(profiler.by_endpoint.values(), Counter())
+    return Response(folded(stacks), mimetype='text/plain')
+
+
+@profiling_bp.route('/api/admin/profiling/profiles', methods=['DELETE'])
+@profiling_admin_required
+@cpu_sampling_required
+def reset_profiles():
+    """
+    清空采样结果
+    """
+    get_profiler().reset()
+    return jsonify({'message': '采样结果已清空'})
+
+
+@profiling_bp.route('/api/admin/profiling/tracemalloc/start', methods=['POST'])
+@profiling_admin_required
+def start_tracemalloc():
+    """
+    开始跟踪内存分配（有额外开销，排查完后应停止）
+    """
+    profiler = get_profiler()
+    frames = request.args.get('frames', profiler.tracemalloc_frames, type=int)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    profiler.last_snapshot = None
+    return jsonify({'message': '已开始跟踪内存分配', 'pid': os.getpid(), 'frames': tracemalloc.get_traceback_limit()})
+
+
+@profiling_bp.route('/api/admin/profiling/tracemalloc/snapshot', methods=['POST'])
+@profiling_admin_required
+def take_tracemalloc_snapshot():
+    """
+    内存快照：分配最多的位置，以及与上一次快照的差异
+    """
+    if not tracemalloc.is_tracing():
+        return jsonify({'error': '尚未开始跟踪内存分配'}), 400
+
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'group_by 只能是 lineno、filename 或 traceback'}), 400
+    top = request.args.get('top', 20, type=int)
+
+    try:
+        return jsonify(get_profiler().snapshot(group_by=group_by, top=top))
+    except Exception as e:
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+
+@profiling_bp.route('/api/admin/profiling/tracemalloc/stop', methods=['POST'])
+@profiling_admin_required
+def stop_tracemalloc():
+    """
+    停止跟踪内存分配并丢弃快照
+    """
+    tracemalloc.stop()
+    get_profiler().last_snapshot = None
+    return jsonify({'message': '已停止跟踪内存分配', 'pid': os.getpid()})
@@ -0,0 +1,251 @@
+"""
+批量开通用户
+
+逐个调用 /api/register 时每个用户都要做两次唯一性查询、一次哈希和一次提交。批量开通：
+- 先校验每一行（必填字段、邮箱格式、密码强度、批次内重复）；
+- 用户名、邮箱的唯一性各用 IN 查询按块一次查出已存在的值；
+- 密码哈希：命令行分摊到多个进程并行计算；HTTP 接口走 PasswordHasher 的主机级名额，不会挤占登录和埋点
+  （也可直接提供 werkzeug 格式的 password_hash，迁移时不必重新哈希）；
+- 按块多行 INSERT，每块一次提交；某块因并发注册撞上唯一约束时退回逐行插入，只让冲突的行失败。
+
+HTTP 接口要求请求头 X-Admin-Token 与 PROVISION_ADMIN_TOKEN 一致（未配置令牌时一律拒绝），
+否则任何人都能以任意 password_hash 开通账号。
+
+返回逐行结果：{'row': 行号, 'username': ..., 'status': 'created' | 'exists' | 'invalid', 'id' / 'error': ...}，
+dry_run 时合法的行为 'valid'。
+"""
+import csv
+import io
+import json
+import os
+import time
+from functools import wraps
+
+import click
+from flask import current_app, jsonify
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import User
+from app.password_hashing import hash_passwords, released_db_admission
+from app.profiling import admin_token_valid
+from app.utils import validate_email, validate_password
+
+
+users_cli = AppGroup('users', help='用户批量开通')
+
+# 单条 IN 查询的参数个数（SQLite 旧版本上限为 999）
+_LOOKUP_CHUNK_SIZE = 900
+
+# werkzeug 哈希串的方法前缀
+_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+def provision_admin_required(view):
+    """批量开通接口只对持有管理令牌的请求开放"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admin_token_valid('PROVISION_ADMIN_TOKEN'):
+            return jsonify({'error': '需要有效的管理令牌'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def parse_users_csv(text):
+    """CSV（表头含 username,email,password 或 password_hash）-> 字典列表"""
+    return [dict(row) for row in csv.DictReader(io.StringIO(text.lstrip('\ufeff')))]
+
+
+def _looks_like_hash(value):
+    return isinstance(value, str) and value.startswith(_HASH_PREFIXES) and value.count('$') == 2 and len(value) <= 256
+
+
+def _validate(record):
+    """返回错误信息，合法时返回 None"""
+    if not isinstance(record, dict):
+        return '每一行必须是对象'
+    for field in ('username', 'email'):
+        if not record.get(field) or not isinstance(record[field], str):
+            return f'缺少必要字段: {field}'
+    if len(record['username']) > 64 or len(record['email']) > 120:
+        return '用户名或邮箱过长'
+    if not validate_email(record['email']):
+        return '邮箱格式不正确'
+    if record.get('password_hash'):
+        if not _looks_like_hash(record['password_hash']):
+            return 'password_hash 不是有效的哈希格式'
+        return None
+    if not record.get('password') or not isinstance(record['password'], str):
+        return '缺少必要字段: password'
+    is_valid, password_msg = validate_password(record['password'])
+    return None if is_valid else password_msg
+
+
+def _existing_values(column, values):
+    """按块查询已存在的用户名或邮箱"""
+    values = list(values)
+    existing = set()
+    for start in range(0, len(values), _LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + _LOOKUP_CHUNK_SIZE]
+        existing.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return existing
+
+
+def _ids_by_username(usernames):
+    ids = {}
+    for start in range(0, len(usernames), _LOOKUP_CHUNK_SIZE):
+        chunk = usernames[start:start + _LOOKUP_CHUNK_SIZE]
+        ids.update(db.session.execute(select(User.username, User.id).where(User.username.in_(chunk))).all())
+    return ids
+
+
+def _insert_chunk(rows):
+    """多行插入一块用户；返回插入失败的 {username: 错误}"""
+    try:
+        db.session.execute(insert(User), rows)
+        db.session.commit()
+        return {}
+    except IntegrityError:
+        db.session.rollback()
+
+    # 块内有行与并发注册冲突：逐行插入，只让冲突的行失败
+    failed = {}
+    for row in rows:
+        try:
+            db.session.execute(insert(User), [row])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            failed[row['username']] = '用户名或邮箱已存在'
+    return failed
+
+
+def count_plain_passwords(records):
+    """需要哈希的明文密码数（提供了 password_hash 的行不需要哈希）"""
+    return sum(1 for record in records if isinstance(record, dict) and not record.get('password_hash'))
+
+
+def provision_users(records, chunk_size=1000, workers=1, dry_run=False, hasher=None):
+    """
+    批量开通用户，返回 (汇总, 逐行结果)
+
+    给定 hasher（PasswordHasher）时通过它的名额哈希，否则用 workers 个进程的独立进程池（仅限命令行）。
+    """
+    started = time.perf_counter()
+    config = current_app.config
+    results = [None] * len(records)
+    pending = []
+
+    # 行级校验与批次内去重
+    seen_usernames, seen_emails = set(), set()
+    for index, record in enumerate(records):
+        error = _validate(record)
+        username = record.get('username') if isinstance(record, dict) else None
+        if error is None:
+            email = record['email']
+            if username in seen_usernames or email in seen_emails:
+                error = '批次内用户名或邮箱重复'
+            else:
+                seen_usernames.add(username)
+                seen_emails.add(email)
+        if error is not None:
+            results[index] = {'row': index, 'username': username, 'status': 'invalid', 'error': error}
+        else:
+            pending.append(index)
+
+    # 集合方式检查唯一性
+    existing_usernames = _existing_values(User.username, [records[i]['username'] for i in pending])
+    existing_emails = _existing_values(User.email, [records[i]['email'] for i in pending])
+    to_create = []
+    for index in pending:
+        record = records[index]
+        if record['username'] in existing_usernames or record['email'] in existing_emails:
+            results[index] = {'row': index, 'username': record['username'], 'status': 'exists',
+                              'error': '用户名或邮箱已存在'}
+        else:
+            to_create.append(index)
+
+    if not dry_run and to_create:
+        # 只哈希需要新建且没有提供哈希的行；哈希期间不占用数据库准入名额和连接
+        plain = [index for index in to_create if not records[index].get('password_hash')]
+        passwords = [records[index]['password'] for index in plain]
+        with released_db_admission():
+            if hasher is not None:
+                hashes = hasher.hash_many(passwords)
+            else:
+                hashes = hash_passwords(passwords,
+                                        config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                                        config.get('PASSWORD_SALT_LENGTH', 16),
+                                        workers, config.get('PASSWORD_HASH_NICE', 10))
+        hashed = dict(zip(plain, hashes))
+
+        failed = {}
+        for start in range(0, len(to_create), chunk_size):
+            rows = [{
+                'username': records[index]['username'],
+                'email': records[index]['email'],
+                'password_hash': hashed.get(index) or records[index]['password_hash']
+            } for index in to_create[start:start + chunk_size]]
+            failed.update(_insert_chunk(rows))
+
+        ids = _ids_by_username([records[index]['username'] for index in to_create
+                                if records[index]['username'] not in failed])
+        for index in to_create:
+            username = records[index]['username']
+            if username in failed:
+                results[index] = {'row': index, 'username': username, 'status': 'exists', 'error': failed[username]}
+            else:
+                results[index] = {'row': index, 'username': username, 'status': 'created', 'id': ids.get(username)}
+    else:
+        for index in to_create:
+            results[index] = {'row': index, 'username': records[index]['username'],
+                              'status': 'valid' if dry_run else 'created'}
+
+    summary = {'total': len(records), 'dry_run': dry_run,
+               'elapsed_seconds': round(time.perf_counter() - started, 3)}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary, results
+
+
+@users_cli.command('provision')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['json', 'csv']), default=None,
+              help='文件格式，默认按扩展名判断')
+@click.option('--chunk-size', default=1000, show_default=True, help='每次多行插入的用户数')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='并行哈希的进程数')
+@click.option('--batch-size', default=20000, show_default=True, help='每批校验、哈希、插入的用户数，每批结束输出进度')
+@click.option('--report', type=click.Path(dir_okay=False), default=None, help='逐行结果写入 CSV 文件')
+@click.option('--dry-run', is_flag=True, help='只校验，不写入')
+def provision_command(path, file_format, chunk_size, workers, batch_size, report, dry_run):
+    """从 JSON 数组或 CSV 文件批量开通用户"""
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'json')
+    with open(path, encoding='utf-8-sig') as f:
+        records = parse_users_csv(f.read()) if file_format == 'csv' else json.load(f)
+    if isinstance(records, dict):
+        records = records.get('users', [])
+
+    totals = {}
+    report_file = open(report, 'w', newline='', encoding='utf-8') if report else None
+    try:
+        writer = None
+        if report_file:
+            writer = csv.DictWriter(report_file, fieldnames=['row', 'username', 'status', 'id', 'error'])
+            writer.writeheader()
+        for offset in range(0, len(records), batch_size):
+            summary, results = provision_users(records[offset:offset + batch_size], chunk_size=chunk_size,
+                                               workers=workers, dry_run=dry_run)
+            for key, value in summary.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+            if writer:
+                for result in results:
+                    writer.writerow(dict(result, row=result['row'] + offset))
+            click.echo(f'已处理 {min(offset + batch_size, len(records))}/{len(records)}')
+    finally:
+        if report_file:
+            report_file.close()
+
+    click.echo(' '.join(f'{key}={value}' for key, value in totals.items()))
@@ -0,0 +1,75 @@
+"""
+事件查询条件构建
+
+管理端列表、导出等接口共用同一套筛选参数。日期参数统一解析为 datetime 后再下推，
+生成 created_at 上的纯范围条件（不对列套函数），这样 MySQL 可以按分区裁剪，
+也能直接使用 created_at 索引。
+"""
+from datetime import datetime
+
+from app.models import Event
+from app.event_metadata import METADATA_FILTER_PREFIX, validate_metadata_key, metadata_filter_clause
+
+
+EVENT_FILTER_ARGS = ('user_id', 'anonymous_id', 'page_url', 'event_type', 'event_name', 'start_date', 'end_date')
+
+
+def parse_datetime(value):
+    """解析 YYYY-MM-DD 或 ISO 格式的日期时间；格式错误时抛出 ValueError"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value
+
+    text = str(value).strip().replace('Z', '')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'无效的日期格式: {value}')
+
+
+def get_event_filters(args):
+    """从请求参数（或 JSON 字典）中提取事件筛选条件"""
+    user_id = args.get('user_id')
+    try:
+        user_id = int(user_id) if user_id not in (None, '') else None
+    except (TypeError, ValueError):
+        user_id = None
+
+    # meta.<key>=value 形式的元数据筛选
+    meta = {}
+    for key in args.keys():
+        if key.startswith(METADATA_FILTER_PREFIX) and args.get(key) not in (None, ''):
+            meta[validate_metadata_key(key[len(METADATA_FILTER_PREFIX):])] = args.get(key)
+
+    return {
+        'user_id': user_id,
+        'anonymous_id': args.get('anonymous_id') or None,
+        'page_url': args.get('page_url') or None,
+        'event_type': args.get('event_type') or None,
+        'event_name': args.get('event_name') or None,
+        'start_date': parse_datetime(args.get('start_date')),
+        'end_date': parse_datetime(args.get('end_date')),
+        'meta': meta
+    }
+
+
+def apply_event_filters(query, filters):
+    """将筛选条件应用到事件查询上"""
+    if filters.get('user_id'):
+        query = query.filter(Event.user_id == filters['user_id'])
+    if filters.get('anonymous_id'):
+        query = query.filter(Event.anonymous_id == filters['anonymous_id'])
+    if filters.get('page_url'):
+        query = query.filter(Event.page_url.contains(filters['page_url']))
+    if filters.get('event_type'):
+        query = query.filter(Event.event_type == filters['event_type'])
+    if filters.get('event_name'):
+        query = query.filter(Event.event_name.contains(filters['event_name']))
+    if filters.get('start_date'):
+        query = query.filter(Event.created_at >= filters['start_date'])
+    if filters.get('end_date'):
+        query = query.filter(Event.created_at <= filters['end_date'])
+    for key, value in (filters.get('meta') or {}).items():
+        query = query.filter(metadata_filter_clause(key, value))
+    return query
@@ -0,0 +1,402 @@
+"""
+最近事件的内存列式窗口
+
+开启 RECENT_WINDOW_ENABLED 后，每个进程在内存中用 NumPy 数组保存最近 RECENT_WINDOW_HOURS 小时的事件，
+字符串列使用字典编码（每列一个 值 -> 编号 的字典，数组中只存 int32 编号）。
+管理端对该时间范围内的筛选、分页和计数直接用向量化扫描回答，不再访问数据库；
+超出窗口范围的查询照常走数据库。
+
+数据来源：
+- 首次使用时（或 gunicorn 的 post_worker_init 中）在后台线程按块加载窗口内的事件，只查询窗口需要的列，
+  加载完成前 get_recent_window 返回 None，管理端查询照常走数据库；
+- 本进程的 record_event 写入成功后直接追加；
+- 每隔 RECENT_WINDOW_REFRESH_SECONDS 秒按主键增量拉取其他 worker 写入的事件，
+  根据删除墓碑剔除已删除的事件，并按 identify 记录把匿名事件关联到用户。
+  三个流都用 ChangeCursor 同步：提交顺序与ID顺序不一致时，较晚提交的较小ID在之后的同步中补上。
+
+字典只增不减会让 ip_address、user_agent、anonymous_id 等高基数列的字典随进程存活时间无限增长，
+因此淘汰或删除行后，字典大小超过上次重建时的两倍就按仍在使用的值重新编码（均摊开销与追加相当）。
+
+窗口是每个 worker 一份，而不是整台主机共享一份：NumPy 数组可以放进共享内存，但字典编码和
+event_metadata 是 Python 对象，跨进程共享需要自己实现序列化和并发写入，复杂度远超收益。
+内存占用约为 worker 数 × 窗口行数 × 每行约 100 字节（另加 metadata 对象），
+开启窗口时应按此选择 RECENT_WINDOW_HOURS，并优先使用进程数少的 gthread / gevent worker。
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.changes import ChangeCursor
+from app.models import Event, EventTombstone, IdentityLink
+
+
+logger = logging.getLogger(__name__)
+
+STRING_COLUMNS = ('anonymous_id', 'event_type', 'event_name', 'page_url', 'element_id', 'ip_address', 'user_agent')
+
+# 窗口只保存这些列，同步时不加载完整的 ORM 实例
+WINDOW_COLUMNS = (Event.id, Event.user_id, Event.created_at, Event.event_metadata) + \
+    tuple(getattr(Event, name) for name in STRING_COLUMNS)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_micros(value):
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+class _Dictionary:
+    """字符串列的字典编码，None 编码为 -1"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        # 上次重建时的大小，增长到两倍后才再次重建
+        self.rebuilt_size = len(self.values)
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def decode(self, code):
+        return self.values[code] if code >= 0 else None
+
+    def matching_codes(self, substring):
+        """包含子串的所有编码（字典规模远小于行数，直接遍历）"""
+        return [code for code, value in enumerate(self.values) if substring in value]
+
+
+class RecentEventWindow:
+    """最近 N 小时事件的列式存储"""
+
+    def __init__(self, hours=24, refresh_interval=1.0, chunk_size=10000, settle_seconds=5):
+        import numpy as np
+
+        self.np = np
+        self.hours = hours
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype=np.int64)  # 微秒时间戳
+        self.metadata = np.empty(0, dtype=object)
+        self.codes = {name: np.empty(0, dtype=np.int32) for name in STRING_COLUMNS}
+        self.dictionaries = {name: _Dictionary() for name in STRING_COLUMNS}
+
+        self.loaded = False
+        self._loader = None
+        self.events = ChangeCursor(Event, Event.created_at, settle_seconds, columns=WINDOW_COLUMNS)
+        self.tombstones = ChangeCursor(EventTombstone, EventTombstone.deleted_at, settle_seconds)
+        self.identities = ChangeCursor(IdentityLink, IdentityLink.created_at, settle_seconds)
+        self.synced_at = 0.0
+
+    # ===== 写入 =====
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.ids):
+            return
+        capacity = max(needed, len(self.ids) * 2, 1024)
+        np = self.np
+
+        def grow(array):
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            return grown
+
+        self.ids = grow(self.ids)
+        self.user_ids = grow(self.user_ids)
+        self.created = grow(self.created)
+        self.metadata = grow(self.metadata)
+        self.codes = {name: grow(array) for name, array in self.codes.items()}
+
+    def _append_rows(self, rows):
+        """rows 为包含 Event 各列属性的对象（ORM 实例或查询结果行）"""
+        self._reserve(len(rows))
+        for row in rows:
+            i = self.size
+            self.ids[i] = row.id
+            self.user_ids[i] = row.user_id if row.user_id is not None else -1
+            self.created[i] = _to_micros(row.created_at)
+            self.metadata[i] = row.event_metadata
+            for name in STRING_COLUMNS:
+                self.codes[name][i] = self.dictionaries[name].encode(getattr(row, name))
+            self.size += 1
+
+    def append(self, event):
+        """ingest 路径：本进程写入成功的事件直接进入窗口"""
+        with self._lock:
+            # 游标同时负责去重：同步时再拉到这条事件会被跳过
+            if not self.loaded or not self.events.remember(event.id):
+                return
+            self._append_rows([event])
+
+    def discard(self, event_ids):
+        """剔除已删除的事件"""
+        with self._lock:
+            if not self.size or not event_ids:
+                return
+            keep = ~self.np.isin(self.ids[:self.size], list(event_ids))
+            self._compact(keep)
+
+    def link_identity(self, anonymous_id, user_id):
+        """identify：把该匿名ID下尚未关联用户的事件关联到 user_id"""
+        with self._lock:
+            code = self.dictionaries['anonymous_id'].codes.get(anonymous_id)
+            if code is None or not self.size:
+                return
+            n = self.size
+            mask = (self.codes['anonymous_id'][:n] == code) & (self.user_ids[:n] == -1)
+            self.user_ids[:n][mask] = user_id
+
+    def _compact(self, keep):
+        kept = int(keep.sum())
+        if kept == self.size:
+            return
+        self.ids = self.ids[:self.size][keep]
+        self.user_ids = self.user_ids[:self.size][keep]
+        self.created = self.created[:self.size][keep]
+        self.metadata = self.metadata[:self.size][keep]
+        self.codes = {name: array[:self.size][keep] for name, array in self.codes.items()}
+        self.size = kept
+        for name in STRING_COLUMNS:
+            if len(self.dictionaries[name].values) >= max(1024, 2 * self.dictionaries[name].rebuilt_size):
+                self._reencode(name)
+
+    def _reencode(self, name):
+        """只保留仍被窗口中的行使用的字典值，并重写该列的编码"""
+        np = self.np
+        dictionary = self.dictionaries[name]
+        codes = self.codes[name][:self.size]
+        used = np.unique(codes[codes >= 0])
+        # 下标整体加 1，让 -1（None）映射到 -1
+        remap = np.full(len(dictionary.values) + 1, -1, dtype=codes.dtype)
+        remap[used + 1] = np.arange(len(used), dtype=codes.dtype)
+        codes[:] = remap[codes + 1]
+        self.dictionaries[name] = _Dictionary(dictionary.values[code] for code in used.tolist())
+
+    # ===== 与数据库同步 =====
+
+    @property
+    def window_start(self):
+        return datetime.now() - timedelta(hours=self.hours)
+
+    def start_loading(self, app):
+        """在后台线程中完成首次加载（已在加载或已加载时什么也不做）"""
+        with self._lock:
+            if self.loaded or self._loader is not None:
+                return
+            self._loader = threading.Thread(target=self._run_loader, args=(app,),
+                                            name='recent-window-loader', daemon=True)
+        self._loader.start()
+
+    def _run_loader(self, app):
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                self.load()
+            logger.info('最近事件窗口加载完成：%s 条，耗时 %.1f 秒', self.size, time.monotonic() - started)
+        except Exception:
+            logger.exception('最近事件窗口加载失败')
+        finally:
+            # 失败时允许下一次 get_recent_window 重新开始加载
+            with self._lock:
+                self._loader = None
+
+    def load(self):
+        """首次加载：每块单独持锁，加载期间本进程的写入、删除和 identify 不会被长时间阻塞"""
+        with self._lock:
+            self.tombstones.start_at_latest()
+            self.identities.start_at_latest()
+            first_id = db.session.query(db.func.min(Event.id)) \
+                .filter(Event.created_at >= self.window_start).scalar()
+            if first_id is None:
+                self.events.start_at_latest()
+            else:
+                self.events.start(first_id - 1)
+
+        while True:
+            with self._lock:
+                self._append_rows(self.events.fetch_new(self.chunk_size))
+                self.events.settle()
+                has_more = self.events.has_more
+            # 每块之后结束只读事务，避免长时间持有快照
+            db.session.rollback()
+            if not has_more:
+                break
+
+        with self._lock:
+            self._sync_changes()
+            self.loaded = True
+            self.synced_at = time.monotonic()
+
+    def sync(self, force=False):
+        """增量同步（在应用上下文中调用）；首次加载由 load 完成"""
+        if not self.loaded:
+            return
+        if not force and time.monotonic() - self.synced_at < self.refresh_interval:
+            return
+
+        with self._lock:
+            self._sync_changes()
+            self.synced_at = time.monotonic()
+
+    def _sync_changes(self):
+        self._load()
+        self._apply_tombstones()
+        self._apply_identity_links()
+        self._evict()
+
+    def catch_up(self, max_event_id, max_tombstone_id, max_identity_id=0):
+        """数据库中已有比窗口更新的事件、删除或 identify 时立即同步"""
+        if (self.events.seen < max_event_id or self.tombstones.seen < max_tombstone_id
+                or self.identities.seen < max_identity_id):
+            self.sync(force=True)
+
+    def _load(self):
+        self._append_rows(self.events.fetch_gaps())
+        while True:
+            rows = self.events.fetch_new(self.chunk_size)
+            self._append_rows(rows)
+            # 每批之后推进水位线，首次加载时去重集合不会涨到整个窗口大小
+            self.events.settle()
+            if not self.events.has_more:
+                break
+
+    def _apply_tombstones(self):
+        tombstones = self.tombstones.fetch_gaps() + self.tombstones.fetch_new()
+        if tombstones:
+            self.discard([tombstone.event_id for tombstone in tombstones])
+        self.tombstones.settle()
+
+    def _apply_identity_links(self):
+        for link in self.identities.fetch_gaps() + self.identities.fetch_new():
+            self.link_identity(link.anonymous_id, link.user_id)
+        self.identities.settle()
+
+    def _evict(self):
+        if self.size:
+            self._compact(self.created[:self.size] >= _to_micros(self.window_start))
+
+    # ===== 查询 =====
+
+    def covers(self, filters, sort_by='created_at'):
+        """查询是否完全落在窗口内（必须带开始时间，且不含元数据筛选）"""
+        start = filters.get('start_date')
+        return (self.loaded and start is not None and start >= self.window_start
+                and not filters.get('meta')
+                and sort_by in ('created_at', 'page_url'))
+
+    def _mask(self, filters):
+        np = self.np
+        n = self.size
+        mask = self.created[:n] >= _to_micros(filters['start_date'])
+        if filters.get('end_date'):
+            mask &= self.created[:n] <= _to_micros(filters['end_date'])
+        if filters.get('user_id'):
+            mask &= self.user_ids[:n] == filters['user_id']
+        if filters.get('anonymous_id'):
+            code = self.dictionaries['anonymous_id'].codes.get(filters['anonymous_id'], -2)
+            mask &= self.codes['anonymous_id'][:n] == code
+        if filters.get('event_type'):
+            code = self.dictionaries['event_type'].codes.get(filters['event_type'], -2)
+            mask &= self.codes['event_type'][:n] == code
+        for name in ('page_url', 'event_name'):
+            if filters.get(name):
+                codes = self.dictionaries[name].matching_codes(filters[name])
+                mask &= np.isin(self.codes[name][:n], codes)
+        return mask
+
+    def _row_dict(self, i):
+        created = _EPOCH + timedelta(microseconds=int(self.created[i]))
+        user_id = int(self.user_ids[i])
+        row = {
+            'id': int(self.ids[i]),
+            'user_id': user_id if user_id >= 0 else None,
+            'event_metadata': self.metadata[i] or {},
+            'created_at': created.isoformat()
+        }
+        for name in STRING_COLUMNS:
+            row[name] = self.dictionaries[name].decode(int(self.codes[name][i]))
+        return row
+
+    def query(self, filters, sort_by='created_at', sort_order='desc', offset=0, limit=50):
+        """返回 (当前页事件字典列表, 总数)"""
+        np = self.np
+        with self._lock:
+            indexes = np.nonzero(self._mask(filters))[0]
+            total = len(indexes)
+
+            if sort_by == 'page_url':
+                # 按字典值的字符串顺序排序，None 排在最前（与 MySQL 升序一致）
+                dictionary = self.dictionaries['page_url']
+                ranks = np.empty(len(dictionary.values) + 1, dtype=np.int64)
+                ranks[0] = -1
+                order = sorted(range(len(dictionary.values)), key=dictionary.values.__getitem__)
+                ranks[np.array(order, dtype=np.int64) + 1] = np.arange(len(order))
+                keys = ranks[self.codes['page_url'][indexes] + 1]
+            else:
+                keys = self.created[indexes]
+
+            order = np.argsort(keys, kind='stable')
+            if sort_order != 'asc':
+                order = order[::-1]
+            page = indexes[order[offset:offset + limit]]
+            return [self._row_dict(i) for i in page], total
+
+    def count_since(self, start):
+        with self._lock:
+            return int((self.created[:self.size] >= _to_micros(start)).sum())
+
+    def daily_counts(self, start):
+        """按天统计 start 之后的事件数，返回 [(YYYY-MM-DD, 数量), ...]（日期倒序）"""
+        np = self.np
+        with self._lock:
+            created = self.created[:self.size]
+            days = created[created >= _to_micros(start)].astype('datetime64[us]').astype('datetime64[D]')
+            values, counts = np.unique(days, return_counts=True)
+            return [(str(day), int(count)) for day, count in zip(values[::-1], counts[::-1])]
+
+
+def _ensure_recent_window(app):
+    window = app.extensions.get('recent_window')
+    if window is None:
+        window = RecentEventWindow(
+            hours=app.config.get('RECENT_WINDOW_HOURS', 24),
+            refresh_interval=app.config.get('RECENT_WINDOW_REFRESH_SECONDS', 1.0),
+            settle_seconds=app.config.get('CHANGES_SETTLE_SECONDS', 5)
+        )
+        app.extensions['recent_window'] = window
+    window.start_loading(app)
+    return window
+
+
+def preload_recent_window(app):
+    """gunicorn post_worker_init 调用：worker 启动后立即在后台加载窗口"""
+    if app.config.get('RECENT_WINDOW_ENABLED'):
+        _ensure_recent_window(app)
+
+
+def get_recent_window():
+    """返回已同步的最近事件窗口；未启用或仍在后台加载时返回 None"""
+    if not current_app.config.get('RECENT_WINDOW_ENABLED'):
+        return None
+
+    window = _ensure_recent_window(current_app._get_current_object())
+    if not window.loaded:
+        return None
+    window.sync()
+    return window
@@ -0,0 +1,157 @@
+"""
+只读副本路由
+
+配置 SQLALCHEMY_REPLICA_URIS 后，被 @read_replica 装饰的只读接口（管理端列表、统计、导出等）
+的查询会分发到副本；写入（flush）以及其他接口始终走主库。
+副本按请求轮询选择：同一个请求中的所有查询（计数、当前页、数据版本）都走同一个副本，
+避免不同延迟的副本返回不一致的总数和分页，或把落后副本的结果缓存在较新的 ETag 下。
+
+副本健康检查按 REPLICA_HEALTH_CHECK_INTERVAL 秒懒执行：连接失败或复制延迟超过
+REPLICA_MAX_LAG_SECONDS 的副本会被暂时剔除，全部不可用时回退到主库。
+"""
+import itertools
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaEngine:
+    """单个副本引擎及其健康状态"""
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+        self.lag = None
+        self.checked_at = 0.0
+
+    def check(self, max_lag):
+        """检查连接和复制延迟"""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                self.lag = _replication_lag(conn)
+            self.healthy = self.lag is None or self.lag <= max_lag
+            if not self.healthy:
+                logger.warning('副本 %s 复制延迟 %s 秒，暂时回退到主库', self.name, self.lag)
+        except Exception as e:
+            self.healthy = False
+            logger.warning('副本 %s 健康检查失败: %s', self.name, e)
+        self.checked_at = time.monotonic()
+
+
+def _replication_lag(conn):
+    """返回复制延迟秒数；非 MySQL 副本（如本地 SQLite 替身）返回 None"""
+    if conn.dialect.name != 'mysql':
+        return None
+
+    for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+        try:
+            row = conn.execute(text(statement)).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            # 不是副本（例如测试时指向另一个独立实例）
+            return None
+        lag = row.get(column)
+        # 复制线程停止时延迟为 NULL，视为不可用
+        return float('inf') if lag is None else float(lag)
+    return None
+
+
+class ReplicaPool:
+    """轮询选择健康的副本"""
+
+    def __init__(self, replicas, check_interval=5, max_lag=10):
+        self.replicas = replicas
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._cycle = itertools.cycle(replicas) if replicas else None
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """返回下一个健康副本的引擎，没有可用副本时返回 None"""
+        if not self.replicas:
+            return None
+
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            if time.monotonic() - replica.checked_at >= self.check_interval:
+                replica.check(self.max_lag)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def status(self):
+        return [{
+            'name': replica.name,
+            'healthy': replica.healthy,
+            'lag': replica.lag
+        } for replica in self.replicas]
+
+
+class RoutingSession(Session):
+    """根据请求标记把只读查询路由到副本的会话"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_requested():
+            # 每个请求只选择一次（没有可用副本时记为 False，整个请求都走主库）
+            if 'replica_engine' not in g:
+                pool = current_app.extensions.get('replicas')
+                g.replica_engine = (pool.choose() if pool else None) or False
+            if g.replica_engine:
+                return g.replica_engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_requested():
+    return has_app_context() and g.get('use_replica', False)
+
+
+def read_replica(view):
+    """标记只读接口：其中的查询优先走副本"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.use_replica = False
+            g.pop('replica_engine', None)
+    return wrapper
+
+
+def init_replicas(app):
+    """根据配置创建副本引擎"""
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+    replicas = []
+    for index, uri in enumerate(uris):
+        engine = create_engine(uri, **engine_options)
+        replica = ReplicaEngine(f'replica{index}', engine)
+
+        @event.listens_for(engine, 'handle_error')
+        def mark_unhealthy(context, replica=replica):
+            # 连接断开时立即剔除，等待下一次健康检查恢复
+            if context.is_disconnect:
+                replica.healthy = False
+                replica.checked_at = time.monotonic()
+
+        replicas.append(replica)
+
+    app.extensions['replicas'] = ReplicaPool(
+        replicas,
+        check_interval=app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 5),
+        max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 10)
+    )
@@ -0,0 +1,223 @@
+"""
+数据保留策略与后台分块删除
+
+删除任务按主键分块执行：每次取 DELETE_CHUNK_SIZE 个匹配的事件ID删除并提交，
+块之间暂停 DELETE_CHUNK_PAUSE 秒，避免长事务锁住大范围数据和拖大主从延迟。
+任务进度（cursor_id、deleted_count）持久化在 delete_jobs 表中，
+进程退出后可以通过 flask retention run 从断点继续。
+启用归档时，数据库中的行删除完后再从归档文件中删除匹配的事件（重写受影响的文件）并写入墓碑。
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import Event, DeleteJob
+from app.queries import get_event_filters, apply_event_filters, EVENT_FILTER_ARGS
+from app.archive import get_cold_store
+from app.changes import delete_events, record_tombstones
+from app.event_metadata import METADATA_FILTER_PREFIX
+
+
+logger = logging.getLogger(__name__)
+
+retention_cli = AppGroup('retention', help='数据保留策略与后台删除任务')
+
+
+def _job_query(filters):
+    """根据任务保存的筛选条件构建事件查询"""
+    query = apply_event_filters(Event.query, get_event_filters(filters))
+    exclude_types = filters.get('exclude_event_types')
+    if exclude_types:
+        query = query.filter(Event.event_type.notin_(exclude_types))
+    return query
+
+
+def normalize_filters(data):
+    """校验并规范化删除条件；没有任何条件时抛出 ValueError，防止误删全部数据"""
+    filters = {key: data[key] for key in data
+               if (key in EVENT_FILTER_ARGS or key.startswith(METADATA_FILTER_PREFIX))
+               and data.get(key) not in (None, '')}
+    if data.get('exclude_event_types'):
+        if not isinstance(data['exclude_event_types'], list):
+            raise ValueError('exclude_event_types 必须是数组')
+        filters['exclude_event_types'] = data['exclude_event_types']
+
+    if not filters:
+        raise ValueError('至少需要一个筛选条件')
+
+    # 提前校验日期格式
+    get_event_filters(filters)
+    return filters
+
+
+def create_delete_job(filters, kind='filter'):
+    """创建删除任务并估算待删除条数（归档部分不扣除 exclude_event_types）"""
+    estimated_total = _job_query(filters).count()
+    cold_store = get_cold_store()
+    if cold_store:
+        estimated_total += cold_store.count_events(get_event_filters(filters))
+    job = DeleteJob(
+        kind=kind,
+        filters=json.dumps(filters, ensure_ascii=False),
+        status='pending',
+        estimated_total=estimated_total
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def create_retention_jobs(policies, now=None):
+    """
+    根据保留策略创建删除任务
+
+    policies 形如 {'*': 365, 'click': 90}，单位为天；'*' 为默认策略，
+    不作用于单独配置了策略的事件类型。已有未完成的保留任务时不重复创建。
+    """
+    if not policies:
+        return []
+
+    unfinished = DeleteJob.query.filter(
+        DeleteJob.kind == 'retention',
+        DeleteJob.status.in_(['pending', 'running'])
+    ).count()
+    if unfinished:
+        return []
+
+    now = now or datetime.now()
+    specific_types = [event_type for event_type in policies if event_type != '*']
+
+    jobs = []
+    for event_type, max_age_days in policies.items():
+        filters = {'end_date': (now - timedelta(days=int(max_age_days))).isoformat()}
+        if event_type == '*':
+            if specific_types:
+                filters['exclude_event_types'] = specific_types
+        else:
+            filters['event_type'] = event_type
+        jobs.append(create_delete_job(filters, kind='retention'))
+    return jobs
+
+
+def _claim_job(job_id):
+    """抢占任务：只有 pending 或心跳超时的 running 任务可以被执行，避免多个进程重复执行"""
+    stale_before = datetime.now() - timedelta(seconds=current_app.config.get('DELETE_JOB_STALE_SECONDS', 300))
+    claimed = DeleteJob.query.filter(
+        DeleteJob.id == job_id,
+        or_(
+            DeleteJob.status == 'pending',
+            and_(DeleteJob.status == 'running', DeleteJob.updated_at < stale_before)
+        )
+    ).update({'status': 'running', 'updated_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def run_delete_job(job_id):
+    """分块执行删除任务（需在应用上下文中调用），返回任务对象"""
+    if not _claim_job(job_id):
+        return db.session.get(DeleteJob, job_id)
+
+    chunk_size = current_app.config.get('DELETE_CHUNK_SIZE', 1000)
+    pause = current_app.config.get('DELETE_CHUNK_PAUSE', 0.1)
+
+    job = db.session.get(DeleteJob, job_id)
+    filters = json.loads(job.filters)
+
+    try:
+        while True:
+            event_ids = [row[0] for row in _job_query(filters).with_entities(Event.id)
+                         .filter(Event.id > job.cursor_id)
+                         .order_by(Event.id.asc()).limit(chunk_size).all()]
+            if not event_ids:
+                break
+
+            job.deleted_count += delete_events(event_ids)
+            job.cursor_id = event_ids[-1]
+            db.session.commit()
+
+            if pause:
+                time.sleep(pause)
+
+        cold_store = get_cold_store()
+        if cold_store:
+            cold_ids = cold_store.delete_events(get_event_filters(filters),
+                                                exclude_types=filters.get('exclude_event_types'))
+            record_tombstones(cold_ids)
+            job.deleted_count += len(cold_ids)
+
+        job.status = 'completed'
+        job.finished_at = datetime.now()
+        db.session.commit()
+        logger.info('删除任务 %s 完成，共删除 %s 条', job.id, job.deleted_count)
+
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(DeleteJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        db.session.commit()
+        logger.exception('删除任务 %s 失败', job_id)
+
+    return job
+
+
+def start_delete_job(job_id):
+    """在后台线程中执行删除任务"""
+    app = current_app._get_current_object()
+
+    def worker():
+        with app.app_context():
+            run_delete_job(job_id)
+
+    thread = threading.Thread(target=worker, name=f'delete-job-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+def resumable_job_ids():
+    """返回待执行或心跳超时的任务ID"""
+    stale_before = datetime.now() - timedelta(seconds=current_app.config.get('DELETE_JOB_STALE_SECONDS', 300))
+    jobs = DeleteJob.query.filter(or_(
+        DeleteJob.status == 'pending',
+        and_(DeleteJob.status == 'running', DeleteJob.updated_at < stale_before)
+    )).order_by(DeleteJob.id.asc()).all()
+    return [job.id for job in jobs]
+
+
+@retention_cli.command('apply')
+def apply_retention():
+    """按 EVENT_RETENTION_POLICIES 创建保留任务并立即执行（适合 cron 定时调用）"""
+    policies = current_app.config.get('EVENT_RETENTION_POLICIES') or {}
+    if not policies:
+        click.echo('未配置 EVENT_RETENTION_POLICIES')
+        return
+
+    jobs = create_retention_jobs(policies)
+    if not jobs:
+        click.echo('已有未完成的保留任务，继续执行')
+
+    for job_id in resumable_job_ids():
+        job = run_delete_job(job_id)
+        click.echo(f'任务 {job.id} [{job.status}] 删除 {job.deleted_count} 条')
+
+
+@retention_cli.command('run')
+def run_pending_jobs():
+    """执行所有待执行或中断的删除任务"""
+    job_ids = resumable_job_ids()
+    if not job_ids:
+        click.echo('没有待执行的删除任务')
+        return
+
+    for job_id in job_ids:
+        job = run_delete_job(job_id)
+        click.echo(f'任务 {job.id} [{job.status}] 删除 {job.deleted_count} 条')
@@ -1,15 +1,30 @@
 from datetime import datetime
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, request, jsonify, render_template, current_app, g, stream_with_context
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
 from app import db
-from app.models import User, Event
-from app.utils import hash_password, check_password, get_client_info, validate_email, validate_password
+from app.models import User, Event, DeleteJob
+from app.queries import get_event_filters, apply_event_filters
+from app.changes import fetch_changes, delete_events, record_tombstones, DEFAULT_CHANGES_LIMIT
+from app.archive import get_cold_store, read_merged_page
+from app.pool import get_pool_report
+from app.recent_window import get_recent_window
+from app.replicas import read_replica
+from app.sqlite_mode import get_group_commit_writer
+from app.sql_profiler import get_sql_profiler
+from app.data_version import conditional_event_list
+from app.live_stream import LiveStreamFull, get_event_broker, publish_event, sse_stream, worker_stream_capacity
+from app.serializers import (ADMIN_LIST_FIELDS, parse_fields, project_event_dicts,
+                             paginate_event_rows, events_json_response, event_dicts_json_response)
+from app.retention import normalize_filters, create_delete_job, create_retention_jobs, start_delete_job
+from app.password_hashing import PasswordHashingBusy, get_password_hasher, hash_password, verify_password
+from app.provisioning import count_plain_passwords, parse_users_csv, provision_admin_required, provision_users
+from app.utils import get_client_info, validate_email, validate_password
+from app.user_directory import MAX_SEARCH_LIMIT, attach_usernames, get_user_dict, get_users_by_ids, search_users
+from app.write_keys import link_identity, validate_anonymous_id, write_key_required
 import json
-import pandas as pd
-from io import BytesIO
-from flask import send_file
-import tempfile
+import logging
 import os
+from collections import Counter
 
 
 # 获取项目根目录（app 文件夹的上级目录）
@@ -23,6 +38,15 @@ import os
 # # 创建蓝图
 main_bp = Blueprint('main', __name__)
 
+logger = logging.getLogger(__name__)
+
+
+def _auth_busy_response():
+    """密码哈希并发已满"""
+    response = jsonify({'error': '服务繁忙，请稍后重试'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 
 @main_bp.route('/api/register', methods=['POST'])
 def register():
@@ -32,7 +56,6 @@ def register():
     try:
         data = request.get_json()
 
-        print('user info: ', data)
         # 验证必要字段
         required_fields = ['username', 'email', 'password']
         for field in required_fields:
@@ -56,8 +79,6 @@ def register():
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'error': '邮箱已存在'}), 400
 
-        print('register: 11')
-
         # 创建新用户
         user = User(
             username=data['username'],
@@ -65,11 +86,9 @@ def register():
             password_hash=hash_password(data['password'])
         )
 
-        print('register: 22')
         db.session.add(user)
         db.session.commit()
-        print('register: 33')
-
+        logger.info('新用户注册', extra={'user_id': user.id})
         # 创建访问令牌
         access_token = create_access_token(identity=str(user.id))
 
@@ -79,11 +98,12 @@ def register():
             'user': user.to_dict()
         }), 201
 
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return _auth_busy_response()
     except Exception as e:
         db.session.rollback()
-        print(f"数据库错误详情: {str(e)}")  # 打印详细错误
-        import traceback
-        traceback.print_exc()  # 打印完整的堆栈跟踪
+        logger.exception('注册失败')
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 @main_bp.route('/api/login', methods=['POST'])
@@ -101,8 +121,15 @@ def login():
         # 查找用户
         user = User.query.filter_by(username=data['username']).first()
 
-        # 验证用户和密码
-        if user and check_password(user.password_hash, data['password']):
+        # 验证用户和密码（哈希参数已更新时顺便写回新哈希）
+        if user:
+            matched, new_hash = verify_password(user.password_hash, data['password'])
+        else:
+            matched, new_hash = False, None
+        if matched:
+            if new_hash:
+                user.password_hash = new_hash
+                db.session.commit()
             access_token = create_access_token(identity=str(user.id))
             return jsonify({
                 'message': '登录成功',
@@ -112,6 +139,9 @@ def login():
 
         return jsonify({'error': '用户名或密码错误'}), 401
 
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return _auth_busy_response()
     except Exception as e:
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
@@ -138,17 +168,80 @@ def record_event():
             event_name=data.get('event_name'),
             page_url=data.get('page_url'),
             element_id=data.get('element_id'),
-            event_metadata=json.dumps(data.get('event_metadata', {})),
+            event_metadata=data.get('event_metadata', {}),
             ip_address=client_info['ip_address'],
             user_agent=client_info['user_agent']
         )
 
+        return jsonify({
+            'message': '事件记录成功',
+            'event': _store_event(event)
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+
+def _store_event(event):
+    """写入一条事件并返回其字典形式（record_event 与写入密钥上报共用）"""
+    writer = get_group_commit_writer()
+    if writer:
+        # SQLite 组提交：由写线程批量插入，等待所在批次提交
+        event.created_at = datetime.now()
+        event.id = writer.submit({column.name: getattr(event, column.name)
+                                  for column in Event.__table__.columns if column.name != 'id'})
+    else:
         db.session.add(event)
         db.session.commit()
 
+    event_data = event.to_dict()
+
+    # 本进程写入的事件直接进入最近事件窗口
+    window = current_app.extensions.get('recent_window')
+    if window:
+        window.append(event)
+
+    # 推送给本进程的实时事件流订阅者
+    publish_event(event_data)
+    return event_data
+
+
+@main_bp.route('/api/ingest/events', methods=['POST'])
+@write_key_required
+def ingest_event():
+    """
+    匿名/设备事件上报接口
+    使用项目级写入密钥（X-Write-Key 请求头或 write_key 参数），事件以 anonymous_id 标识，不需要用户账号和 JWT
+    """
+    try:
+        # sendBeacon 发送的请求体通常是 text/plain
+        data = request.get_json(force=True, silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': '请求体必须是 JSON 对象'}), 400
+        client_info = get_client_info()
+
+        # 验证必要字段
+        if not data.get('event_name'):
+            return jsonify({'error': '事件名称不能为空'}), 400
+        error = validate_anonymous_id(data.get('anonymous_id'))
+        if error:
+            return jsonify({'error': error}), 400
+
+        event = Event(
+            anonymous_id=data['anonymous_id'],
+            event_type=data.get('event_type', 'custom'),
+            event_name=data.get('event_name'),
+            page_url=data.get('page_url'),
+            element_id=data.get('element_id'),
+            event_metadata=data.get('event_metadata', {}),
+            ip_address=client_info['ip_address'],
+            user_agent=client_info['user_agent']
+        )
+
         return jsonify({
             'message': '事件记录成功',
-            'event': event.to_dict()
+            'event': _store_event(event)
         }), 201
 
     except Exception as e:
@@ -156,7 +249,36 @@ def record_event():
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 
+@main_bp.route('/api/identify', methods=['POST'])
+@jwt_required()
+def identify():
+    """
+    把匿名ID下尚未关联用户的事件关联到当前登录用户
+    只接受用户 JWT：写入密钥嵌在网页中、对任何人可见，不能用来把设备关联到任意用户
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        error = validate_anonymous_id(data.get('anonymous_id'))
+        if error:
+            return jsonify({'error': error}), 400
+
+        user_id = int(get_jwt_identity())
+        linked = link_identity(data['anonymous_id'], user_id)
+        return jsonify({
+            'message': '关联成功',
+            'anonymous_id': data['anonymous_id'],
+            'user_id': user_id,
+            'linked_events': linked
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+
 @main_bp.route('/api/events/public', methods=['GET'])
+@read_replica
+@conditional_event_list
 def get_events_public():
     """
     公开获取事件数据接口（仅用于测试）
@@ -164,21 +286,24 @@ def get_events_public():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 100)
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         events_query = Event.query
 
-        # 按时间倒序排列并分页
-        events = events_query.order_by(Event.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # 按时间倒序排列并分页（只取列值，不构造 ORM 对象）
+        rows, total = paginate_event_rows(events_query.order_by(Event.created_at.desc()), page, per_page, fields)
 
-        return jsonify({
-            'events': [event.to_dict() for event in events.items],
-            'total': events.total,
-            'pages': events.pages,
-            'current_page': page,
-            'per_page': per_page
-        })
+        return events_json_response(
+            rows,
+            fields,
+            total=total,
+            pages=(total + per_page - 1) // per_page,
+            current_page=page,
+            per_page=per_page
+        )
 
     except Exception as e:
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
@@ -186,6 +311,8 @@ def get_events_public():
 
 @main_bp.route('/api/events', methods=['GET'])
 @jwt_required()
+@read_replica
+@conditional_event_list
 def get_events():
     """
     获取用户事件数据接口
@@ -193,24 +320,27 @@ def get_events():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 100)  # 限制每页最多100条
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # 查询用户的事件数据
         # current_user_id = int(get_jwt_identity())
         # events_query = Event.query.filter_by(user_id=current_user_id)
         events_query = Event.query
 
-        # 按时间倒序排列并分页
-        events = events_query.order_by(Event.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # 按时间倒序排列并分页（只取列值，不构造 ORM 对象）
+        rows, total = paginate_event_rows(events_query.order_by(Event.created_at.desc()), page, per_page, fields)
 
-        return jsonify({
-            'events': [event.to_dict() for event in events.items],
-            'total': events.total,
-            'pages': events.pages,
-            'current_page': page,
-            'per_page': per_page
-        })
+        return events_json_response(
+            rows,
+            fields,
+            total=total,
+            pages=(total + per_page - 1) // per_page,
+            current_page=page,
+            per_page=per_page
+        )
 
     except Exception as e:
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
@@ -224,12 +354,13 @@ def get_user_profile():
     """
     try:
         current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
+        # 进程内缓存，用户信息修改后自动失效
+        user = get_user_dict(current_user_id)
 
         if not user:
             return jsonify({'error': '用户不存在'}), 404
 
-        return jsonify({'user': user.to_dict()})
+        return jsonify({'user': user})
 
     except Exception as e:
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
@@ -243,7 +374,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': '服务器运行正常',
-        'timestamp': datetime.datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat()
     })
 
 
@@ -272,18 +403,24 @@ def login_page():
 
 @main_bp.route('/api/admin/events', methods=['GET'])
 # @jwt_required()
+@read_replica
+@conditional_event_list
 def get_admin_events():
     """
     管理员获取事件数据接口 - 支持排序、筛选和分组
     """
     try:
         # 获取查询参数
-        user_id = request.args.get('user_id', type=int)
-        page_url = request.args.get('page_url')
-        event_type = request.args.get('event_type')
-        event_name = request.args.get('event_name')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        try:
+            filters = get_event_filters(request.args)
+            # 返回字段，默认只包含列表页显示的列（不含 user_agent、event_metadata）
+            fields = parse_fields(request.args.get('fields'), ADMIN_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # with_username=true 时按本页的 user_id 批量查出用户名附在每条事件上
+        decorate = attach_usernames if request.args.get('with_username', 'false').lower() == 'true' else None
+        if decorate and 'user_id' not in fields:
+            fields = parse_fields(','.join(fields + ('user_id',)))
 
         # 排序参数
         sort_by = request.args.get('sort_by', 'created_at')
@@ -293,22 +430,8 @@ def get_admin_events():
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 50, type=int), 200)  # 限制每页最多200条
 
-        # 构建查询
-        query = Event.query
-
-        # 应用筛选条件
-        if user_id:
-            query = query.filter(Event.user_id == user_id)
-        if page_url:
-            query = query.filter(Event.page_url.contains(page_url))
-        if event_type:
-            query = query.filter(Event.event_type == event_type)
-        if event_name:
-            query = query.filter(Event.event_name.contains(event_name))
-        if start_date:
-            query = query.filter(Event.created_at >= start_date)
-        if end_date:
-            query = query.filter(Event.created_at <= end_date)
+        # 构建查询并应用筛选条件
+        query = apply_event_filters(Event.query, filters)
 
         # 应用排序
         if sort_by == 'created_at':
@@ -322,28 +445,115 @@ def get_admin_events():
             else:
                 query = query.order_by(Event.page_url.desc())
 
-        # 执行分页查询
-        events = query.paginate(
-            page=page, per_page=per_page, error_out=False
+        # 查询范围完全落在最近事件窗口内时，直接在内存中筛选和分页
+        window = get_recent_window()
+        if window and window.covers(filters, sort_by):
+            # 窗口落后于 ETag 对应的数据版本时先追上，避免把旧结果缓存在新版本下
+            version = g.get('data_version')
+            if version:
+                window.catch_up(version.max_event_id, version.max_tombstone_id, version.max_identity_id)
+            events, total = window.query(filters, sort_by, sort_order, (page - 1) * per_page, per_page)
+            events = project_event_dicts(events, fields)
+            if decorate:
+                decorate(events)
+            return jsonify({
+                'events': events,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page,
+                'current_page': page,
+                'per_page': per_page,
+                'total_events': total
+            })
+
+        # 查询范围与归档日期有交集（包括不带 start_date 的默认视图）时，合并热数据和冷数据
+        cold_store = get_cold_store()
+        if cold_store and cold_store.needs_cold(filters):
+            try:
+                events, total = read_merged_page(query, cold_store, filters, sort_by, sort_order,
+                                                 (max(page, 1) - 1) * per_page, per_page, fields)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return event_dicts_json_response(
+                events,
+                decorate=decorate,
+                total=total,
+                pages=(total + per_page - 1) // per_page,
+                current_page=page,
+                per_page=per_page,
+                total_events=total
+            )
+
+        # 执行分页查询（只取列值，不构造 ORM 对象）
+        rows, total = paginate_event_rows(query, page, per_page, fields)
+
+        return events_json_response(
+            rows,
+            fields,
+            decorate=decorate,
+            total=total,
+            pages=(total + per_page - 1) // per_page,
+            current_page=page,
+            per_page=per_page,
+            total_events=total
         )
 
-        # 获取事件统计
-        total_events = query.count()
+    except Exception as e:
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
-        return jsonify({
-            'events': [event.to_dict() for event in events.items],
-            'total': events.total,
-            'pages': events.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'total_events': total_events
-        })
+
+@main_bp.route('/api/admin/events/stream', methods=['GET'])
+# @jwt_required()
+def stream_events():
+    """
+    实时事件流（Server-Sent Events）
+    筛选参数、fields、with_username 与 /api/admin/events 相同；只推送订阅之后写入的事件，
+    断线重连时按 Last-Event-ID 补发进程内缓存的最近事件。不访问数据库，不占用数据库准入名额。
+    每个连接在最长 LIVE_STREAM_MAX_SECONDS 秒内占用一个 worker 线程：应使用 gevent worker；
+    gthread worker 下连接数不超过线程数的 LIVE_STREAM_THREAD_SHARE，sync worker 下返回 503
+    """
+    try:
+        capacity = worker_stream_capacity(request.environ, current_app.config)
+        if capacity <= 0:
+            return jsonify({'error': '当前 worker 类型不支持实时事件流（长连接会占满 sync worker），'
+                                     '请使用 gevent worker，或刷新列表查看新事件'}), 503
+
+        try:
+            filters = get_event_filters(request.args)
+            fields = parse_fields(request.args.get('fields'), ADMIN_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        decorate = attach_usernames if request.args.get('with_username', 'false').lower() == 'true' else None
+        if decorate and 'user_id' not in fields:
+            fields = parse_fields(','.join(fields + ('user_id',)))
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        broker = get_event_broker(max_subscribers=capacity)
+        try:
+            subscriber = broker.subscribe(filters, last_event_id)
+        except LiveStreamFull:
+            response = jsonify({'error': '实时事件流连接数已满，请稍后重试'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+
+        return Response(
+            stream_with_context(sse_stream(broker, subscriber, fields, decorate)),
+            mimetype='text/event-stream',
+            # 禁止代理缓冲，事件写出后立即到达浏览器
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
     except Exception as e:
+        logger.exception('实时事件流错误')
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 
 @main_bp.route('/api/admin/stats', methods=['GET'])
+@read_replica
 def get_admin_stats():
     """
     获取管理统计信息（总览和事件详细统计）
@@ -361,7 +571,12 @@ def get_admin_stats():
         # 今日事件数
         today = date.today()
         today_start = datetime.combine(today, datetime.min.time())
-        today_events = Event.query.filter(Event.created_at >= today_start).count()
+        window = get_recent_window()
+        if window and window.window_start <= today_start:
+            # 最近事件窗口覆盖今天时直接在内存中计数
+            today_events = window.count_since(today_start)
+        else:
+            today_events = Event.query.filter(Event.created_at >= today_start).count()
 
         # 唯一页面数
         # 这行代码的用途是统计唯一页面URL的数量，让我详细解释每个部分的作用和实际应用场景：
@@ -400,26 +615,59 @@ def get_admin_stats():
 
         # 最近7天活动
         seven_days_ago = datetime.now() - timedelta(days=7)
-        recent_activity = db.session.query(
-            func.date(Event.created_at).label('date'),
-            func.count(Event.id).label('count')
-        ).filter(Event.created_at >= seven_days_ago) \
-            .group_by(func.date(Event.created_at)) \
-            .order_by(func.date(Event.created_at).desc()).all()
-
-        # 格式化最近活动日期
-        recent_activity_formatted = []
-        for activity in recent_activity:
-            activity_date = activity.date
-            if isinstance(activity_date, (datetime, date)):
-                activity_date_str = activity_date.isoformat()
-            else:
-                activity_date_str = str(activity_date)
-
-            recent_activity_formatted.append({
-                'date': activity_date_str,
-                'count': activity.count
-            })
+        if window and window.window_start <= seven_days_ago:
+            recent_activity_formatted = [
+                {'date': activity_date, 'count': count}
+                for activity_date, count in window.daily_counts(seven_days_ago)
+            ]
+        else:
+            recent_activity = db.session.query(
+                func.date(Event.created_at).label('date'),
+                func.count(Event.id).label('count')
+            ).filter(Event.created_at >= seven_days_ago) \
+                .group_by(func.date(Event.created_at)) \
+                .order_by(func.date(Event.created_at).desc()).all()
+
+            # 格式化最近活动日期
+            recent_activity_formatted = []
+            for activity in recent_activity:
+                activity_date = activity.date
+                if isinstance(activity_date, (datetime, date)):
+                    activity_date_str = activity_date.isoformat()
+                else:
+                    activity_date_str = str(activity_date)
+
+                recent_activity_formatted.append({
+                    'date': activity_date_str,
+                    'count': activity.count
+                })
+
+        # 合并归档（冷）数据的统计，冷数据聚合结果按 manifest 版本缓存
+        cold_store = get_cold_store()
+        if cold_store and cold_store.total_rows():
+            cold = cold_store.aggregates()
+            total_events += cold['total']
+
+            # 归档后热表较小，页面和用户改为不带 LIMIT 的全量分组，与冷数据合并后再取前10
+            hot_pages = Counter(dict(db.session.query(
+                Event.page_url,
+                func.count(Event.id)
+            ).filter(Event.page_url.isnot(None)).group_by(Event.page_url).all()))
+            hot_users = Counter(dict(db.session.query(
+                Event.user_id,
+                func.count(Event.id)
+            ).group_by(Event.user_id).all()))
+
+            unique_pages = len(set(hot_pages) | set(cold['pages']))
+            event_type_stats = list((Counter(dict(event_type_stats)) + cold['types']).items())
+            page_stats = (hot_pages + cold['pages']).most_common(10)
+            user_stats = (hot_users + cold['users']).most_common(10)
+
+            recent_counts = Counter({item['date']: item['count'] for item in recent_activity_formatted})
+            recent_counts.update({day: count for day, count in cold['dates'].items()
+                                  if day >= seven_days_ago.date().isoformat()})
+            recent_activity_formatted = [{'date': day, 'count': count}
+                                         for day, count in sorted(recent_counts.items(), reverse=True)]
 
         return jsonify({
             'total_events': total_events,
@@ -442,215 +690,299 @@ def get_admin_stats():
         })
 
     except Exception as e:
-        print(f"统计接口错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('统计接口错误')
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 @main_bp.route('/api/admin/users', methods=['GET'])
 # @jwt_required()
+@read_replica
 def get_users():
     """
-    获取用户列表（用于筛选）
+    用户目录（用于筛选）
+    q 为用户名前缀，按用户名分页：cursor 传上一页返回的 next_cursor，limit 最大 100；
+    ids=1,2,3 时按 ID 批量查询（走进程内缓存）
     """
     try:
-        users = User.query.all()
-        return jsonify({
-            'users': [{'id': user.id, 'username': user.username} for user in users]
-        })
+        if request.args.get('ids'):
+            try:
+                user_ids = [int(value) for value in request.args['ids'].split(',') if value.strip()]
+            except ValueError:
+                return jsonify({'error': 'ids 必须是逗号分隔的整数'}), 400
+            users = get_users_by_ids(user_ids[:MAX_SEARCH_LIMIT])
+            return jsonify({
+                'users': [{'id': user['id'], 'username': user['username']} for user in users.values()],
+                'next_cursor': None,
+                'has_more': False
+            })
+
+        users, next_cursor = search_users(
+            prefix=request.args.get('q', '').strip(),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 50, type=int)
+        )
+        return jsonify({'users': users, 'next_cursor': next_cursor, 'has_more': next_cursor is not None})
+    except Exception as e:
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+
+@main_bp.route('/api/admin/events/changes', methods=['GET'])
+@read_replica
+def get_event_changes():
+    """
+    增量导出接口（变更流）
+    按ID顺序返回水位线之后的新增事件、删除墓碑和 identify 关联记录，以及下一次请求使用的水位线
+    """
+    try:
+        since = request.args.get('since', '')
+        limit = request.args.get('limit', DEFAULT_CHANGES_LIMIT, type=int)
+
+        try:
+            changes = fetch_changes(since, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify(changes)
+
     except Exception as e:
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 
-@main_bp.route('/api/admin/events/export/test', methods=['GET'])
-def export_events_test():
+@main_bp.route('/api/admin/events/batch', methods=['DELETE'])
+def batch_delete_events():
     """
-    导出功能测试端点
+    批量删除事件数据
     """
     try:
-        # 测试基本功能
-        import pandas as pd
-        from io import BytesIO
+        data = request.get_json()
+
+        if not data or 'event_ids' not in data:
+            return jsonify({'error': '需要提供事件ID列表'}), 400
 
-        # 创建测试数据
-        data = {
-            '测试列1': ['数据1', '数据2', '数据3'],
-            '测试列2': [1, 2, 3]
-        }
-        df = pd.DataFrame(data)
+        event_ids = data['event_ids']
+        if not isinstance(event_ids, list):
+            return jsonify({'error': 'event_ids 必须是数组'}), 400
 
-        output = BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8')
-        output.seek(0)
+        # 按块删除事件（同时写入墓碑，供增量导出同步删除），每块单独提交，避免长事务
+        chunk_size = current_app.config.get('DELETE_CHUNK_SIZE', 1000)
+        deleted_count = 0
+        for start in range(0, len(event_ids), chunk_size):
+            deleted_count += delete_events(event_ids[start:start + chunk_size])
+            db.session.commit()
+
+        # 已归档的事件从归档文件中删除
+        cold_store = get_cold_store()
+        if cold_store:
+            cold_ids = cold_store.delete_events(event_ids=event_ids)
+            record_tombstones(cold_ids)
+            db.session.commit()
+            deleted_count += len(cold_ids)
+
+        window = current_app.extensions.get('recent_window')
+        if window:
+            window.discard(event_ids)
 
         return jsonify({
-            'message': '导出测试成功',
-            'data_created': True,
-            'pandas_available': True
+            'message': f'成功删除 {deleted_count} 个事件',
+            'deleted_count': deleted_count
         })
 
-    except ImportError as e:
-        return jsonify({
-            'error': '依赖包未安装',
-            'details': str(e),
-            'required_packages': ['pandas', 'openpyxl']
-        }), 500
     except Exception as e:
-        return jsonify({
-            'error': '测试失败',
-            'details': str(e)
-        }), 500
+        db.session.rollback()
+        return jsonify({'error': '删除失败', 'details': str(e)}), 500
 
-@main_bp.route('/api/admin/events/export', methods=['GET'])
-def export_events():
+@main_bp.route('/api/admin/events/delete-jobs', methods=['POST'])
+def create_events_delete_job():
     """
-    导出事件数据接口
-    支持格式：csv, excel
+    按条件删除事件（后台分块执行）
+    请求体为筛选条件，与 /api/admin/events 的筛选参数一致
     """
     try:
-        # 获取查询参数
-        user_id = request.args.get('user_id', type=int)
-        page_url = request.args.get('page_url')
-        event_type = request.args.get('event_type')
-        event_name = request.args.get('event_name')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        export_format = request.args.get('format', 'csv')  # csv 或 excel
-
-        # 构建查询
-        query = Event.query
-
-        # 应用筛选条件
-        if user_id:
-            query = query.filter(Event.user_id == user_id)
-        if page_url:
-            query = query.filter(Event.page_url.contains(page_url))
-        if event_type:
-            query = query.filter(Event.event_type == event_type)
-        if event_name:
-            query = query.filter(Event.event_name.contains(event_name))
-        if start_date:
-            query = query.filter(Event.created_at >= start_date)
-        if end_date:
-            query = query.filter(Event.created_at <= end_date)
-
-        # 按时间倒序排列
-        events = query.order_by(Event.created_at.desc()).all()
-
-        if not events:
-            return jsonify({'error': '没有找到可导出的数据'}), 404
-
-        # 准备数据
-        data = []
-        for event in events:
-            # 解析事件数据
-            event_data = {}
-
-            data.append({
-                '事件ID': event.id,
-                '用户ID': event.user_id,
-                '事件类型': event.event_type,
-                '事件名称': event.event_name,
-                '页面URL': event.page_url or '',
-                '元素ID': event.element_id or '',
-                'IP地址': event.ip_address or '',
-                'User Agent': event.user_agent or '',
-                '事件数据': json.dumps(event_data, ensure_ascii=False) if event_data else '',
-                '创建时间': event.created_at.isoformat() if hasattr(event.created_at, 'isoformat') else str(
-                    event.created_at)
-            })
+        data = request.get_json() or {}
 
-        # 创建 DataFrame
-        df = pd.DataFrame(data)
-
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"事件数据_{timestamp}"
-
-        if export_format.lower() == 'excel':
-            # 导出为 Excel
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='事件数据', index=False)
-
-                # 获取工作表并调整列宽
-                worksheet = writer.sheets['事件数据']
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
-
-            output.seek(0)
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'{filename}.xlsx'
-            )
+        try:
+            filters = normalize_filters(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        else:
-            # 导出为 CSV
-            output = BytesIO()
-            df.to_csv(output, index=False, encoding='utf-8-sig')  # utf-8-sig 会自动添加 BOM
+        job = create_delete_job(filters)
+        start_delete_job(job.id)
 
-            output.seek(0)
+        return jsonify({
+            'message': '删除任务已创建',
+            'job': job.to_dict()
+        }), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
-            response = send_file(
-                output,
-                mimetype='text/csv; charset=utf-8',  # 明确指定字符集
-                as_attachment=True,
-                download_name=f'{filename}.csv'
-            )
 
-            # 添加额外的头部信息
-            response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-            # 添加缓存控制头部，避免缓存问题
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+@main_bp.route('/api/admin/events/delete-jobs', methods=['GET'])
+def get_events_delete_jobs():
+    """
+    获取删除任务列表（最近的在前）
+    """
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        jobs = DeleteJob.query.order_by(DeleteJob.id.desc()).limit(limit).all()
+        return jsonify({'jobs': [job.to_dict() for job in jobs]})
 
-            return response
     except Exception as e:
-        print(f"导出错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': '导出失败', 'details': str(e)}), 500
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
 
-@main_bp.route('/api/admin/events/batch', methods=['DELETE'])
-def batch_delete_events():
+@main_bp.route('/api/admin/events/delete-jobs/<int:job_id>', methods=['GET'])
+def get_events_delete_job(job_id):
     """
-    批量删除事件数据
+    获取删除任务进度
     """
     try:
-        data = request.get_json()
+        job = db.session.get(DeleteJob, job_id)
+        if not job:
+            return jsonify({'error': '任务不存在'}), 404
 
-        if not data or 'event_ids' not in data:
-            return jsonify({'error': '需要提供事件ID列表'}), 400
+        return jsonify({'job': job.to_dict()})
 
-        event_ids = data['event_ids']
-        if not isinstance(event_ids, list):
-            return jsonify({'error': 'event_ids 必须是数组'}), 400
+    except Exception as e:
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
-        # 删除事件
-        deleted_count = Event.query.filter(Event.id.in_(event_ids)).delete()
+
+@main_bp.route('/api/admin/events/delete-jobs/<int:job_id>/resume', methods=['POST'])
+def resume_events_delete_job(job_id):
+    """
+    从断点继续执行失败的删除任务
+    """
+    try:
+        job = db.session.get(DeleteJob, job_id)
+        if not job:
+            return jsonify({'error': '任务不存在'}), 404
+        if job.status != 'failed':
+            return jsonify({'error': '只能继续执行失败的任务'}), 400
+
+        job.status = 'pending'
+        job.error = None
         db.session.commit()
+        start_delete_job(job.id)
+
+        return jsonify({'message': '删除任务已继续执行', 'job': job.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+
+@main_bp.route('/api/admin/retention/apply', methods=['POST'])
+def apply_retention_policies():
+    """
+    按配置的数据保留策略创建并执行后台删除任务
+    """
+    try:
+        policies = current_app.config.get('EVENT_RETENTION_POLICIES') or {}
+        if not policies:
+            return jsonify({'error': '未配置数据保留策略'}), 400
+
+        jobs = create_retention_jobs(policies)
+        for job in jobs:
+            start_delete_job(job.id)
 
         return jsonify({
-            'message': f'成功删除 {deleted_count} 个事件',
-            'deleted_count': deleted_count
-        })
+            'message': f'已创建 {len(jobs)} 个保留任务' if jobs else '已有未完成的保留任务',
+            'jobs': [job.to_dict() for job in jobs]
+        }), 202
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': '删除失败', 'details': str(e)}), 500
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+@main_bp.route('/api/admin/users/provision', methods=['POST'])
+@provision_admin_required
+def provision_users_bulk():
+    """
+    批量开通用户（需要请求头 X-Admin-Token，与 PROVISION_ADMIN_TOKEN 一致）
+    请求体为 JSON（{"users": [...], "dry_run": false} 或数组）、text/csv，或以 file 字段上传的 CSV；
+    每个用户提供 username、email 以及 password 或 password_hash；
+    明文密码通过与登录共用的哈希名额计算，单次最多 PROVISION_MAX_PASSWORDS 个
+    """
+    try:
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        if 'file' in request.files:
+            records = parse_users_csv(request.files['file'].read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            records = parse_users_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                dry_run = dry_run or bool(data.get('dry_run'))
+                data = data.get('users')
+            if not isinstance(data, list):
+                return jsonify({'error': '需要提供用户列表'}), 400
+            records = data
+
+        max_users = current_app.config.get('PROVISION_MAX_USERS', 1000)
+        if len(records) > max_users:
+            return jsonify({'error': f'单次最多开通 {max_users} 个用户，更多请使用 flask users provision'}), 400
+        max_passwords = current_app.config.get('PROVISION_MAX_PASSWORDS', 100)
+        if not dry_run and count_plain_passwords(records) > max_passwords:
+            return jsonify({'error': f'单次最多哈希 {max_passwords} 个明文密码，请提供 password_hash '
+                                     f'或使用 flask users provision'}), 400
+
+        summary, results = provision_users(
+            records,
+            chunk_size=current_app.config.get('PROVISION_CHUNK_SIZE', 1000),
+            dry_run=dry_run,
+            hasher=get_password_hasher()
+        )
+        return jsonify({'summary': summary, 'results': results})
+
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return _auth_busy_response()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('批量开通用户失败')
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+@main_bp.route('/api/admin/pool', methods=['GET'])
+def get_pool_status():
+    """
+    查看当前 worker 的数据库连接池和准入闸门使用情况
+    """
+    return jsonify(get_pool_report(db))
+
+
+@main_bp.route('/api/admin/replicas', methods=['GET'])
+def get_replicas_status():
+    """
+    查看只读副本的健康状态和复制延迟
+    """
+    pool = current_app.extensions.get('replicas')
+    return jsonify({'replicas': pool.status() if pool else []})
+
+
+@main_bp.route('/api/admin/sql-profile', methods=['GET'])
+def get_sql_profile():
+    """
+    查看当前 worker 的查询统计：各接口查询次数与耗时、最耗时的语句、慢查询和疑似 N+1
+    """
+    profiler = get_sql_profiler()
+    if profiler is None:
+        return jsonify({'error': '未开启 SQL 查询分析（SQL_PROFILER_ENABLED）'}), 404
+
+    top = request.args.get('top', 20, type=int)
+    return jsonify(profiler.summary(top=top))
+
+
+@main_bp.route('/api/admin/sql-profile', methods=['DELETE'])
+def reset_sql_profile():
+    """
+    清空当前 worker 的查询统计
+    """
+    profiler = get_sql_profiler()
+    if profiler is None:
+        return jsonify({'error': '未开启 SQL 查询分析（SQL_PROFILER_ENABLED）'}), 404
+
+    profiler.reset()
+    return jsonify({'message': '查询统计已清空'})
 
 # # 在你的Flask routes.py中添加代理接口
 # @main_bp.route('/proxy/icon-negative-list')
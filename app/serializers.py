@@ -0,0 +1,108 @@
+"""
+事件列表的快速序列化
+
+列表接口不再构造 ORM 对象再逐个调用 to_dict()：
+- 只查询需要的列，结果为元组行；
+- event_metadata 按原始文本取出（type_coerce 为 Text，跳过 JSON 解析），
+  包装为 orjson.Fragment 原样写入输出，避免 解析 -> 重新编码 的往返；
+- 整页用一次 fast_dumps（orjson 可用时为 C 实现）编码，datetime 由编码器直接输出 ISO 格式。
+  未安装 orjson 时退回标准库，metadata 需要先解析。
+
+输出与 Event.to_dict() 的字段和取值一致（键顺序不同）。
+"""
+import json
+
+from flask import current_app
+from sqlalchemy import Text, type_coerce
+
+from app.json_provider import fast_dumps, orjson
+from app.models import Event
+
+
+EVENT_FIELDS = ('id', 'user_id', 'anonymous_id', 'event_type', 'event_name', 'page_url', 'element_id',
+                'event_metadata', 'ip_address', 'user_agent', 'created_at')
+
+# 管理端列表默认返回的字段（即 templates/events.html 表格中显示的列），详情需要 fields=all
+ADMIN_LIST_FIELDS = ('id', 'user_id', 'anonymous_id', 'event_type', 'event_name', 'page_url', 'element_id',
+                     'ip_address', 'created_at')
+
+# to_dict() 中 `event_metadata or {}` 会把这些值都变成 {}
+_EMPTY_METADATA = {None, '', 'null', '{}', '[]', '0', 'false', '""'}
+
+
+def parse_fields(value, default=EVENT_FIELDS):
+    """解析 fields=a,b,c 参数（all 表示全部字段）；返回按 EVENT_FIELDS 顺序排列、始终包含 id 的元组"""
+    if not value:
+        return tuple(default)
+    if value.strip() == 'all':
+        return EVENT_FIELDS
+
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(EVENT_FIELDS)
+    if unknown:
+        raise ValueError(f'无效的字段: {", ".join(sorted(unknown))}（可选: {", ".join(EVENT_FIELDS)}）')
+    requested.add('id')
+    return tuple(field for field in EVENT_FIELDS if field in requested)
+
+
+def project_event_dicts(events, fields):
+    """裁剪已经是字典形式的事件（内存窗口、归档数据）"""
+    if len(fields) == len(EVENT_FIELDS):
+        return events
+    return [{field: event.get(field) for field in fields} for event in events]
+
+
+def event_columns(fields=EVENT_FIELDS):
+    """fields 对应的查询列，event_metadata 以原始 JSON 文本返回"""
+    columns = []
+    for field in fields:
+        if field == 'event_metadata':
+            columns.append(type_coerce(Event.event_metadata, Text).label('event_metadata'))
+        else:
+            columns.append(getattr(Event, field))
+    return columns
+
+
+def paginate_event_rows(query, page, per_page, fields=EVENT_FIELDS):
+    """返回 (当前页元组行, 总数)；query 为已筛选、排序的 Event 查询"""
+    page = max(page, 1)
+    per_page = max(per_page, 1)
+    total = query.order_by(None).count()
+    rows = query.with_entities(*event_columns(fields)) \
+        .offset((page - 1) * per_page).limit(per_page).all()
+    return rows, total
+
+
+def _metadata_value(raw):
+    """原始 metadata 文本 -> 可直接编码的值（orjson 下为 Fragment，原样写入输出）"""
+    if isinstance(raw, str):
+        raw = raw.strip()
+    elif raw is not None:
+        # 驱动已经解析过（部分驱动对 JSON 列返回 dict）
+        return raw or {}
+    if raw in _EMPTY_METADATA:
+        return {}
+    if orjson is not None:
+        return orjson.Fragment(raw)
+    return json.loads(raw)
+
+
+def event_row_dict(row, fields=EVENT_FIELDS):
+    """元组行 -> 待编码的字典（created_at 保持 datetime，由编码器输出 ISO 格式）"""
+    values = dict(zip(fields, row))
+    if 'event_metadata' in values:
+        values['event_metadata'] = _metadata_value(values['event_metadata'])
+    return values
+
+
+def events_json_response(rows, fields=EVENT_FIELDS, decorate=None, **payload):
+    """编码 {"events": [...], **payload} 的 JSON 响应；decorate 可对整页事件字典做补充（如附带用户名）"""
+    return event_dicts_json_response([event_row_dict(row, fields) for row in rows], decorate, **payload)
+
+
+def event_dicts_json_response(events, decorate=None, **payload):
+    """同 events_json_response，事件已经是字典形式（如冷热数据合并后的一页）"""
+    if decorate is not None:
+        decorate(events)
+    payload['events'] = events
+    return current_app.response_class(fast_dumps(payload) + b'\n', mimetype='application/json')
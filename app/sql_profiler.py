@@ -0,0 +1,233 @@
+"""
+SQL 查询分析
+
+开启 SQL_PROFILER_ENABLED 后，在主库和副本引擎上注册游标事件：
+- 按接口统计每个请求的查询次数和耗时，按语句统计执行次数、总耗时和最大耗时；
+- 超过 SQL_SLOW_QUERY_MS 的语句写入慢查询日志（附带参数类型，不记录参数值）；
+- 超过 SQL_EXPLAIN_THRESHOLD_MS 的 SELECT 额外抓取执行计划；
+- 同一个请求内同一条语句执行次数达到 SQL_N_PLUS_ONE_THRESHOLD 时记为 N+1。
+
+汇总结果通过 /api/admin/sql-profile 查看（每个 worker 独立统计）。未开启时不注册任何事件。
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+
+def parameter_shape(parameters):
+    """参数的类型结构，例如 {'user_id': 'int'} 或 ['int', 'str']"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        # executemany：只取第一组
+        return parameter_shape(parameters[0])
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _explain(dbapi_connection, dialect, statement, parameters):
+    """用原始 DBAPI 游标执行 EXPLAIN（不触发 SQLAlchemy 事件）"""
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in cursor.description or []]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception as e:
+        return [{'error': str(e)}]
+    finally:
+        cursor.close()
+
+
+class _StatementStats:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class _EndpointStats:
+    __slots__ = ('requests', 'queries', 'total', 'max_queries')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.total = 0.0
+        self.max_queries = 0
+
+
+class SQLProfiler:
+    """当前 worker 的查询统计"""
+
+    def __init__(self, slow_ms=100, explain_ms=500, n_plus_one_threshold=5,
+                 max_statements=500, history=100):
+        self.slow_seconds = slow_ms / 1000
+        self.explain_seconds = explain_ms / 1000
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_statements = max_statements
+        self.history = history
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}
+            self.endpoints = {}
+            self.slow_queries = deque(maxlen=self.history)
+            self.n_plus_one = Counter()
+            self.started_at = time.time()
+
+    # ===== 引擎事件 =====
+
+    def attach(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            starts = conn.info.get('profiler_query_start')
+            if not starts:
+                return
+            elapsed = time.perf_counter() - starts.pop()
+            self._record(conn, statement, parameters, elapsed)
+
+    def _record(self, conn, statement, parameters, elapsed):
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            profile = g.get('sql_profile')
+            if profile is not None:
+                profile['queries'] += 1
+                profile['time'] += elapsed
+                profile['statements'][statement] += 1
+
+        with self._lock:
+            stats = self.statements.get(statement)
+            if stats is None and len(self.statements) < self.max_statements:
+                stats = self.statements[statement] = _StatementStats()
+            if stats is not None:
+                stats.count += 1
+                stats.total += elapsed
+                stats.max = max(stats.max, elapsed)
+
+        if elapsed < self.slow_seconds:
+            return
+
+        entry = {
+            'statement': statement,
+            'parameters': parameter_shape(parameters),
+            'duration_ms': round(elapsed * 1000, 3),
+            'endpoint': endpoint,
+            'at': time.time()
+        }
+        if elapsed >= self.explain_seconds and statement.lstrip().upper().startswith('SELECT'):
+            entry['plan'] = _explain(conn.connection.dbapi_connection, conn.dialect.name, statement, parameters)
+        logger.warning('慢查询 %.1fms [%s] %s 参数类型=%s', elapsed * 1000, endpoint, statement, entry['parameters'])
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    # ===== 请求生命周期 =====
+
+    def start_request(self):
+        g.sql_profile = {'queries': 0, 'time': 0.0, 'statements': Counter()}
+
+    def finish_request(self):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+
+        repeated = [(statement, count) for statement, count in profile['statements'].items()
+                    if count >= self.n_plus_one_threshold]
+        for statement, count in repeated:
+            logger.warning('疑似 N+1：%s 在一次请求中执行 %s 次: %s', endpoint, count, statement)
+
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = _EndpointStats()
+            stats.requests += 1
+            stats.queries += profile['queries']
+            stats.total += profile['time']
+            stats.max_queries = max(stats.max_queries, profile['queries'])
+            for statement, count in repeated:
+                self.n_plus_one[(endpoint, statement)] = max(self.n_plus_one[(endpoint, statement)], count)
+
+    # ===== 汇总 =====
+
+    def summary(self, top=20):
+        with self._lock:
+            endpoints = [{
+                'endpoint': endpoint,
+                'requests': stats.requests,
+                'queries_per_request': round(stats.queries / stats.requests, 2),
+                'max_queries': stats.max_queries,
+                'db_time_avg_ms': round(stats.total / stats.requests * 1000, 3),
+                'db_time_total_ms': round(stats.total * 1000, 3)
+            } for endpoint, stats in self.endpoints.items()]
+            statements = sorted(self.statements.items(), key=lambda item: item[1].total, reverse=True)[:top]
+            return {
+                'pid': os.getpid(),
+                'since': self.started_at,
+                'endpoints': sorted(endpoints, key=lambda item: item['db_time_total_ms'], reverse=True),
+                'statements': [{
+                    'statement': statement,
+                    'count': stats.count,
+                    'total_ms': round(stats.total * 1000, 3),
+                    'avg_ms': round(stats.total / stats.count * 1000, 3),
+                    'max_ms': round(stats.max * 1000, 3)
+                } for statement, stats in statements],
+                'slow_queries': list(self.slow_queries),
+                'n_plus_one': [{
+                    'endpoint': endpoint,
+                    'statement': statement,
+                    'max_repeats': count
+                } for (endpoint, statement), count in self.n_plus_one.most_common(top)]
+            }
+
+
+def get_sql_profiler():
+    """返回当前应用的查询分析器；未启用时返回 None"""
+    return current_app.extensions.get('sql_profiler')
+
+
+def init_sql_profiler(app):
+    """按配置在主库和副本引擎上注册查询分析"""
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return None
+
+    from app import db
+
+    profiler = SQLProfiler(
+        slow_ms=app.config.get('SQL_SLOW_QUERY_MS', 100),
+        explain_ms=app.config.get('SQL_EXPLAIN_THRESHOLD_MS', 500),
+        n_plus_one_threshold=app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5),
+        max_statements=app.config.get('SQL_PROFILER_MAX_STATEMENTS', 500)
+    )
+    with app.app_context():
+        profiler.attach(db.engine)
+        for replica in app.extensions['replicas'].replicas:
+            profiler.attach(replica.engine)
+    app.extensions['sql_profiler'] = profiler
+
+    @app.before_request
+    def start_sql_profile():
+        profiler.start_request()
+
+    @app.teardown_request
+    def finish_sql_profile(exc=None):
+        profiler.finish_request()
+
+    return profiler
@@ -0,0 +1,181 @@
+"""
+单机 SQLite 生产模式
+
+- 每个连接建立时设置 WAL、synchronous=NORMAL、mmap、缓存大小和 busy_timeout，
+  WAL 模式下读不阻塞写、写不阻塞读。
+- 开启 SQLITE_GROUP_COMMIT 后，record_event 的写入交给每个进程内唯一的写线程，
+  写线程把一小段时间内同一进程中到达的事件合并为一个事务批量插入（组提交）；
+  多个 gunicorn worker 之间再通过文件锁串行化写事务，避免争抢 SQLite 写锁时反复 busy 重试。
+- 批次只在进程内合并，需要每个进程同时处理多个请求：嵌入式模式要求 gthread 或 gevent worker
+  （gunicorn_config.py 默认使用 gthread，并拒绝 sync）。
+- gevent 下写线程是协程，文件锁在 gevent 的原生线程池中获取，等待其他 worker 释放锁时不阻塞整个进程。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+from sqlalchemy import event, insert
+
+from app import db
+from app.models import Event
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为依赖 busy_timeout
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _gevent_threadpool():
+    """threading 已被 gevent 打补丁时返回 hub 的原生线程池，否则返回 None"""
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('threading'):
+        return None
+    return get_hub().threadpool
+
+
+def _lock_exclusive(lock_file):
+    """获取文件锁；gevent 下放到原生线程中阻塞，不阻塞 hub（锁属于打开的文件，可以在协程中释放）"""
+    threadpool = _gevent_threadpool()
+    if threadpool is None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    else:
+        threadpool.apply(fcntl.flock, (lock_file.fileno(), fcntl.LOCK_EX))
+
+
+def _apply_pragmas(dbapi_connection, config):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+        cursor.execute(f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}")
+        # 负数表示以 KiB 为单位
+        cursor.execute(f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))}")
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine, config):
+    """为 SQLite 引擎注册连接参数设置"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, config)
+
+
+class GroupCommitWriter:
+    """进程内单写线程：批量插入事件并一次提交"""
+
+    def __init__(self, app, max_batch=500, max_delay=0.005, lock_path=None):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.lock_path = lock_path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # gunicorn 预加载后 fork 出的 worker 不继承线程，需要在各自进程中启动
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sqlite-group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, row, timeout=10):
+        """提交一行事件数据，等待所在批次提交后返回事件ID"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((row, future))
+        return future.result(timeout=timeout)
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                ids = self._write([row for row, _ in batch])
+                for (_, future), event_id in zip(batch, ids):
+                    future.set_result(event_id)
+            except Exception as e:
+                logger.exception('SQLite 组提交失败（%s 条）', len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def _write(self, rows):
+        table = Event.__table__
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        with self.app.app_context():
+            lock_file = open(self.lock_path, 'a') if fcntl and self.lock_path else None
+            try:
+                if lock_file:
+                    _lock_exclusive(lock_file)
+                with db.engine.begin() as conn:
+                    return conn.execute(stmt, rows).scalars().all()
+            finally:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+
+def get_group_commit_writer():
+    """返回当前应用的组提交写线程；未启用时返回 None"""
+    return current_app.extensions.get('sqlite_writer')
+
+
+def init_sqlite_mode(app):
+    """配置 SQLite 连接参数，按需创建表和组提交写线程"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        configure_sqlite_engine(engine, app.config)
+        for replica in app.extensions['replicas'].replicas:
+            configure_sqlite_engine(replica.engine, app.config)
+
+        if app.config.get('SQLITE_CREATE_TABLES'):
+            db.create_all()
+
+        if app.config.get('SQLITE_GROUP_COMMIT'):
+            database = engine.url.database
+            app.extensions['sqlite_writer'] = GroupCommitWriter(
+                app,
+                max_batch=app.config.get('SQLITE_GROUP_COMMIT_MAX_BATCH', 500),
+                max_delay=app.config.get('SQLITE_GROUP_COMMIT_MAX_DELAY', 0.005),
+                lock_path=f'{database}.writer.lock' if database and database != ':memory:' else None
+            )
@@ -0,0 +1,136 @@
+"""
+用户目录与按 ID 查询用户的进程内缓存
+
+- search_users：按用户名前缀搜索，按用户名做游标分页（username 上有唯一索引，
+  前缀 LIKE 与 username > 游标 都能走索引），不再一次返回全部用户；
+- UserCache：每个 worker 的 LRU（id -> 用户字典），个人信息接口、事件列表附带用户名时使用；
+  本进程通过 ORM 修改或删除用户时立即失效，其他 worker 的修改最迟 USER_CACHE_TTL 秒后可见；
+- attach_usernames：一次 IN 查询（先查缓存）给一页事件补上 username，管理端无需加载完整用户列表。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from app import db
+from app.models import User
+
+
+MAX_SEARCH_LIMIT = 100
+
+
+class UserCache:
+    """id -> user.to_dict() 的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, user_ids):
+        """返回 ({id: 用户字典}, 未命中的 id 列表)"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is None or entry[0] < now:
+                    missing.append(user_id)
+                    continue
+                self._entries.move_to_end(user_id)
+                found[user_id] = entry[1]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, users):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for user in users:
+                self._entries[user['id']] = (expires, user)
+                self._entries.move_to_end(user['id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = UserCache(
+            max_entries=current_app.config.get('USER_CACHE_SIZE', 10000),
+            ttl=current_app.config.get('USER_CACHE_TTL', 60)
+        )
+        current_app.extensions['user_cache'] = cache
+    return cache
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    if has_app_context() and 'user_cache' in current_app.extensions:
+        current_app.extensions['user_cache'].invalidate(target.id)
+
+
+def get_users_by_ids(user_ids):
+    """批量按 ID 取用户字典（先查缓存，未命中的一次 IN 查询），返回 {id: 用户字典}"""
+    user_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id is not None))
+    if not user_ids:
+        return {}
+    cache = get_user_cache()
+    found, missing = cache.get_many(user_ids)
+    if missing:
+        loaded = [user.to_dict() for user in User.query.filter(User.id.in_(missing)).all()]
+        cache.put_many(loaded)
+        found.update((user['id'], user) for user in loaded)
+    return found
+
+
+def get_user_dict(user_id):
+    """按 ID 取用户字典，不存在时返回 None"""
+    return get_users_by_ids([user_id]).get(user_id)
+
+
+def attach_usernames(events):
+    """给事件字典补上 username（匿名事件为 None）"""
+    users = get_users_by_ids(event.get('user_id') for event in events)
+    for item in events:
+        user = users.get(item.get('user_id'))
+        item['username'] = user['username'] if user else None
+    return events
+
+
+def _escape_like(value):
+    # 用 / 作转义符，避免反斜杠在不同数据库字符串字面量中的差异
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def search_users(prefix=None, cursor=None, limit=50):
+    """
+    按用户名前缀搜索用户，按用户名升序分页
+
+    cursor 为上一页最后一个用户名，返回 (用户摘要列表, 下一页游标或 None)。
+    """
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    stmt = select(User.id, User.username).order_by(User.username.asc()).limit(limit + 1)
+    if prefix:
+        stmt = stmt.where(User.username.like(_escape_like(prefix) + '%', escape='/'))
+    if cursor:
+        stmt = stmt.where(User.username > cursor)
+
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    users = [{'id': row.id, 'username': row.username} for row in rows]
+    return users, (rows[-1].username if has_more else None)
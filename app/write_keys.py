@@ -0,0 +1,178 @@
+"""
+写入密钥（匿名 / 设备事件上报）
+
+Web、移动端的匿名流量不需要用户账号和 JWT：客户端携带项目级写入密钥
+（X-Write-Key 请求头，sendBeacon 等无法设置请求头时用 ?write_key=）上报事件，
+事件以 anonymous_id（设备/匿名ID）标识，user_id 为空；用户登录后携带自己的 JWT 调用 identify
+把该匿名ID下的历史事件关联到用户。写入密钥是公开的（嵌在网页和客户端中），只能上报事件，
+不能用于 identify，否则任何人都能把别人设备的事件关联到任意用户。
+
+密钥只保存 SHA-256，校验时查每个进程内存中的密钥表，不访问数据库；
+密钥表每隔 WRITE_KEY_REFRESH_SECONDS 秒从数据库刷新一次，吊销最迟在一个刷新周期后生效。
+
+- flask writekeys create NAME    创建密钥（明文只显示这一次）
+- flask writekeys list           列出密钥
+- flask writekeys revoke ID      吊销密钥
+
+已有数据库通过 Alembic 迁移添加 anonymous_id 列、放开 user_id 非空约束并创建新表（flask db upgrade，
+见 migrations/versions/8b2e4d6f1a37_anonymous_events.py）。
+"""
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+import click
+from flask import current_app, g, jsonify, request
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from app import db
+from app.models import Event, IdentityLink, WriteKey
+
+
+writekeys_cli = AppGroup('writekeys', help='匿名事件上报的写入密钥')
+
+KEY_PREFIX = 'wk_'
+
+WRITE_KEY_HEADER = 'X-Write-Key'
+
+# anonymous_id 列长度
+MAX_ANONYMOUS_ID_LENGTH = 64
+
+
+def hash_write_key(raw_key):
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+class WriteKeyTable:
+    """进程内的有效密钥表：SHA-256 -> (密钥ID, 名称)"""
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._keys = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        rows = db.session.query(WriteKey.key_hash, WriteKey.id, WriteKey.name) \
+            .filter(WriteKey.active.is_(True)).all()
+        keys = {key_hash: (key_id, name) for key_hash, key_id, name in rows}
+        with self._lock:
+            self._keys = keys
+            self._refreshed_at = time.monotonic()
+
+    def lookup(self, raw_key):
+        """返回 (密钥ID, 名称)，无效时返回 None"""
+        if not raw_key or not raw_key.startswith(KEY_PREFIX):
+            return None
+        # 只按时间刷新，无效密钥再多也不会打到数据库
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        return self._keys.get(hash_write_key(raw_key))
+
+
+def get_write_key_table():
+    table = current_app.extensions.get('write_keys')
+    if table is None:
+        table = WriteKeyTable(current_app.config.get('WRITE_KEY_REFRESH_SECONDS', 30))
+        current_app.extensions['write_keys'] = table
+    return table
+
+
+def request_write_key():
+    return request.headers.get(WRITE_KEY_HEADER) or request.args.get('write_key')
+
+
+def write_key_required(view):
+    """校验写入密钥，通过后 g.write_key = (密钥ID, 名称)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = get_write_key_table().lookup(request_write_key())
+        if key is None:
+            return jsonify({'error': '无效的写入密钥'}), 401
+        g.write_key = key
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def validate_anonymous_id(value):
+    """校验 anonymous_id，返回错误信息，合法时返回 None"""
+    if not value or not isinstance(value, str):
+        return '缺少 anonymous_id'
+    if len(value) > MAX_ANONYMOUS_ID_LENGTH:
+        return f'anonymous_id 不能超过 {MAX_ANONYMOUS_ID_LENGTH} 个字符'
+    return None
+
+
+def create_write_key(name):
+    """创建密钥，返回 (WriteKey, 明文密钥)；明文不落库"""
+    raw_key = KEY_PREFIX + secrets.token_urlsafe(24)
+    key = WriteKey(name=name, key_hash=hash_write_key(raw_key), key_prefix=raw_key[:10])
+    db.session.add(key)
+    db.session.commit()
+    get_write_key_table().refresh()
+    return key, raw_key
+
+
+def revoke_write_key(key_id):
+    key = db.session.get(WriteKey, key_id)
+    if key is None:
+        return None
+    key.active = False
+    key.revoked_at = datetime.now()
+    db.session.commit()
+    get_write_key_table().refresh()
+    return key
+
+
+def link_identity(anonymous_id, user_id):
+    """
+    identify：把该匿名ID下尚未关联用户的事件关联到 user_id，并写入关联记录
+    （关联记录推高数据版本，列表缓存随之失效；也通过变更流通知下游）
+
+    返回本次关联的事件数。
+    """
+    linked = db.session.execute(
+        update(Event)
+        .where(Event.anonymous_id == anonymous_id, Event.user_id.is_(None))
+        .values(user_id=user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.add(IdentityLink(anonymous_id=anonymous_id, user_id=user_id, linked_count=linked))
+    db.session.commit()
+
+    window = current_app.extensions.get('recent_window')
+    if window:
+        window.link_identity(anonymous_id, user_id)
+    return linked
+
+
+@writekeys_cli.command('create')
+@click.argument('name')
+def create_command(name):
+    """创建写入密钥"""
+    key, raw_key = create_write_key(name)
+    click.echo(f'已创建密钥 {key.id}（{key.name}）：{raw_key}')
+    click.echo('明文密钥只显示这一次，请妥善保存')
+
+
+@writekeys_cli.command('list')
+def list_command():
+    """列出写入密钥"""
+    for key in WriteKey.query.order_by(WriteKey.id.asc()).all():
+        status = '有效' if key.active else f'已吊销 {key.revoked_at:%Y-%m-%d %H:%M}'
+        click.echo(f'{key.id}\t{key.name}\t{key.key_prefix}...\t{status}')
+
+
+@writekeys_cli.command('revoke')
+@click.argument('key_id', type=int)
+def revoke_command(key_id):
+    """吊销写入密钥（其他进程最迟在一个刷新周期后生效）"""
+    key = revoke_write_key(key_id)
+    if key is None:
+        raise click.ClickException(f'密钥 {key_id} 不存在')
+    click.echo(f'已吊销密钥 {key.id}（{key.name}）')
+
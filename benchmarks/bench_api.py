@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+全接口压测套件
+
+启动 gunicorn，先用 seed_events.py 生成合成数据，再依次运行各场景，
+输出每个场景的吞吐、p50/p95/p99、错误数和服务进程 RSS 峰值：
+
+    python benchmarks/bench_api.py --events 200000                      # 临时 SQLite
+    python benchmarks/bench_api.py --database-url mysql+pymysql://root:pw@127.0.0.1/tracking_bench --events 2000000
+    python benchmarks/bench_api.py --scenarios ingest_single,admin_list_deep --duration 20
+
+基线：
+    --save-baseline NAME   结果写入 benchmarks/baselines/NAME.json
+    --baseline NAME        与已保存的基线对比，吞吐下降或 p95 上升超过 --tolerance 时以非零状态退出
+
+同一份数据库可重复使用（--skip-seed），不同版本的代码对比时应使用相同的 --events / --seed。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import get_token, peak_rss_mb, reset_peak_rss, run_http_load, start_server  # noqa: E402
+from seed_events import seed  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+class Context:
+    """场景共享的数据：令牌、数据规模和常用时间点"""
+
+    def __init__(self, headers, events, per_page=50):
+        self.headers = headers
+        self.events = events
+        self.per_page = per_page
+        now = datetime.now()
+        self.last_day = (now - timedelta(days=1)).isoformat(timespec='seconds')
+        self.last_week = (now - timedelta(days=7)).isoformat(timespec='seconds')
+
+
+def _ingest_single(ctx):
+    def make_request(index):
+        return 'POST', '/api/events', {
+            'event_type': 'click',
+            'event_name': f'bench_{index % 50}',
+            'page_url': f'/bench/{index % 20}',
+            'event_metadata': {'n': index}
+        }, ctx.headers
+    return make_request
+
+
+def _admin_list_first(ctx):
+    def make_request(index):
+        return 'GET', f'/api/admin/events?page=1&per_page={ctx.per_page}', None, None
+    return make_request
+
+
+def _admin_list_deep(ctx):
+    # 翻到一半深度，OFFSET 分页最差的情况
+    page = max(1, ctx.events // ctx.per_page // 2)
+
+    def make_request(index):
+        return 'GET', f'/api/admin/events?page={page}&per_page={ctx.per_page}', None, None
+    return make_request
+
+
+def _admin_list_filtered(ctx):
+    filters = [
+        'event_type=click',
+        'page_url=/page/7',
+        f'start_date={ctx.last_day}',
+        f'event_type=view&start_date={ctx.last_week}',
+        'event_name=click_3&page_url=/page/1',
+    ]
+
+    def make_request(index):
+        return 'GET', f'/api/admin/events?{filters[index % len(filters)]}&per_page={ctx.per_page}', None, None
+    return make_request
+
+
+def _admin_list_meta(ctx):
+    def make_request(index):
+        return 'GET', f'/api/admin/events?meta.plan=pro&per_page={ctx.per_page}', None, None
+    return make_request
+
+
+def _stats(ctx):
+    def make_request(index):
+        return 'GET', '/api/admin/stats', None, None
+    return make_request
+
+
+def _export(export_format):
+    def factory(ctx):
+        def make_request(index):
+            return 'GET', f'/api/admin/events/export?format={export_format}&start_date={ctx.last_day}', None, None
+        return make_request
+    return factory
+
+
+# 名称 -> (请求构造函数, 是否需要较少的请求数)
+SCENARIOS = {
+    'ingest_single': (_ingest_single, False),
+    'admin_list_first': (_admin_list_first, False),
+    'admin_list_deep': (_admin_list_deep, False),
+    'admin_list_filtered': (_admin_list_filtered, False),
+    'admin_list_meta': (_admin_list_meta, False),
+    'stats': (_stats, False),
+    'export_csv': (_export('csv'), True),
+    'export_excel': (_export('excel'), True),
+}
+
+
+def run_scenarios(base_url, process, ctx, names, args):
+    results = {}
+    for name in names:
+        factory, heavy = SCENARIOS[name]
+        make_request = factory(ctx)
+        concurrency = min(args.concurrency, 4) if heavy else args.concurrency
+
+        # 预热后清零内存峰值，只统计本场景
+        run_http_load(base_url, make_request, concurrency=concurrency, total_requests=min(20, concurrency * 2))
+        reset_peak_rss(process.pid)
+        summary = run_http_load(base_url, make_request, concurrency=concurrency,
+                                duration=args.duration / (2 if heavy else 1)).summary()
+        summary['peak_rss_mb'] = peak_rss_mb(process.pid)
+        results[name] = summary
+        print(f"{name:<22} {summary['throughput']:>9} {summary['p50_ms']:>9} {summary['p95_ms']:>9} "
+              f"{summary['p99_ms']:>9} {summary['errors']:>7} {str(summary['peak_rss_mb']):>9}", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """返回超出容忍范围的退化项"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            continue
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {previous['throughput']} -> {current['throughput']} req/s")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: 错误数 {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全接口压测套件')
+    parser.add_argument('--database-url', default=None, help='默认使用临时 SQLite 文件')
+    parser.add_argument('--events', type=int, default=200000, help='预先生成的事件数')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help='数据库中已有数据时跳过生成')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default=None, help='默认 SQLite 为 gthread，其他数据库为 sync')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='每个场景的压测秒数（导出场景减半）')
+    parser.add_argument('--port', type=int, default=7200)
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--baseline', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='与基线对比允许的相对退化')
+    args = parser.parse_args()
+
+    names = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知场景: {", ".join(unknown)}（可选: {", ".join(SCENARIOS)}）')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if not args.skip_seed:
+        seed(database_url, args.events, seed_value=args.seed)
+
+    if args.worker_class is None:
+        # 嵌入式 SQLite 模式不支持 sync worker
+        args.worker_class = 'gthread' if database_url.startswith('sqlite') else 'sync'
+    process = start_server(args.worker_class, args.workers, args.port, database_url)
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        ctx = Context({'Authorization': f'Bearer {get_token(base_url)}'}, args.events)
+        print(f"{'scenario':<22} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MB':>9}")
+        results = run_scenarios(base_url, process, ctx, names, args)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'options': {
+            'database': database_url.split(':', 1)[0],
+            'events': args.events,
+            'seed': args.seed,
+            'workers': args.workers,
+            'worker_class': args.worker_class,
+            'concurrency': args.concurrency,
+            'duration': args.duration
+        },
+        'results': results
+    }
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save_baseline}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'基线已保存: {path}')
+
+    if args.baseline:
+        with open(os.path.join(BASELINE_DIR, f'{args.baseline}.json'), encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['options'] != {key: report['options'][key] for key in baseline['options']}:
+            print('注意：与基线的压测参数不同，对比结果仅供参考')
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('性能退化：')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print(f'与基线 {args.baseline} 对比未发现超过 {args.tolerance:.0%} 的退化')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+事件列表序列化微基准
+
+对比同一页事件的两种序列化方式（不经过 HTTP，只测查询 + 编码）：
+- orm：查询 ORM 对象 -> to_dict() -> 标准库 json 编码（原实现）
+- rows：只取列元组 -> 原始 metadata 作为 Fragment -> fast_dumps（orjson 可用时为 C 实现）
+
+    python benchmarks/bench_serialization.py --events 20000 --per-page 200 --repeat 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed_events import seed  # noqa: E402
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, min(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='事件列表序列化微基准')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--per-page', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'serialization.db')
+    seed(database_url, args.events, quiet=True)
+    os.environ['EMBEDDED_DATABASE_URL'] = database_url
+    os.environ.setdefault('SECRET_KEY', 'bench-serialization')
+
+    from app import create_app
+    from app.json_provider import fast_dumps, orjson
+    from app.models import Event
+    from app.serializers import event_columns, event_row_dict
+
+    app = create_app('embedded')
+    with app.app_context():
+        query = Event.query.order_by(Event.created_at.desc())
+
+        def fetch_orm():
+            return query.limit(args.per_page).all()
+
+        def fetch_rows():
+            return query.with_entities(*event_columns()).limit(args.per_page).all()
+
+        def orm_path():
+            events = fetch_orm()
+            return json.dumps({'events': [event.to_dict() for event in events]}, sort_keys=True).encode('utf-8')
+
+        def rows_path():
+            rows = fetch_rows()
+            return fast_dumps({'events': [event_row_dict(row) for row in rows]})
+
+        # 两种方式结果一致
+        assert json.loads(orm_path()) == json.loads(rows_path())
+
+        orm_objects = fetch_orm()
+        rows = fetch_rows()
+        cases = [
+            ('查询 + 序列化（orm）', orm_path),
+            ('查询 + 序列化（rows）', rows_path),
+            ('仅查询（ORM 对象）', fetch_orm),
+            ('仅查询（列元组）', fetch_rows),
+            ('仅序列化（to_dict + json）',
+             lambda: json.dumps({'events': [event.to_dict() for event in orm_objects]}, sort_keys=True)),
+            ('仅序列化（元组行 + fast_dumps）', lambda: fast_dumps({'events': [event_row_dict(row) for row in rows]})),
+        ]
+
+        print(f'每页 {args.per_page} 条，重复 {args.repeat} 次，orjson: {"可用" if orjson else "未安装"}')
+        print(f"{'case':<34} {'median ms':>10} {'min ms':>10}")
+        for name, fn in cases:
+            median, best = timed(fn, args.repeat)
+            print(f'{name:<34} {median:>10.3f} {best:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
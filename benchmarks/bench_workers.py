@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+sync 与 gevent worker 的 ingest 吞吐对比
+
+在相同 worker 数（相同 CPU）下分别启动 gunicorn，压测 POST /api/events：
+
+    python benchmarks/bench_workers.py --workers 2 --concurrency 200 --duration 20
+    python benchmarks/bench_workers.py --database-url mysql+pymysql://root:pw@127.0.0.1/tracking_bench
+
+不指定 --database-url 时使用临时 SQLite 文件（embedded 配置，不支持 sync，默认对比 gthread 与 gevent）；
+协程模式的优势主要体现在等待网络数据库（MySQL）时，SQLite 结果仅供冒烟验证。
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadgen import get_token, run_http_load, start_server  # noqa: E402
+
+
+def bench(worker_class, args, database_url, port):
+    process = start_server(worker_class, args.workers, port, database_url)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        headers = {'Authorization': f'Bearer {get_token(base_url)}'}
+
+        def make_request(index):
+            return 'POST', '/api/events', {
+                'event_type': 'click',
+                'event_name': f'bench_{index % 50}',
+                'page_url': f'/bench/{index % 20}',
+                'event_metadata': {'n': index}
+            }, headers
+
+        # 预热
+        run_http_load(base_url, make_request, concurrency=4, total_requests=50)
+        return run_http_load(base_url, make_request, concurrency=args.concurrency,
+                             duration=args.duration).summary()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sync / gevent worker ingest 压测对比')
+    parser.add_argument('--workers', type=int, default=2, help='两种模式使用相同的 worker 数')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--classes', default=None, help='默认 sync,gevent（SQLite 为 gthread,gevent）')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--port', type=int, default=7100)
+    args = parser.parse_args()
+
+    classes = args.classes or ('sync,gevent' if args.database_url else 'gthread,gevent')
+    results = {}
+    for offset, worker_class in enumerate(classes.split(',')):
+        database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        results[worker_class] = bench(worker_class, args, database_url, args.port + offset)
+        print(worker_class, results[worker_class], flush=True)
+
+    print()
+    print(f"{'worker':<8} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for worker_class, summary in results.items():
+        print(f"{worker_class:<8} {summary['throughput']:>10} {summary['p50_ms']:>10} "
+              f"{summary['p95_ms']:>10} {summary['p99_ms']:>10} {summary['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
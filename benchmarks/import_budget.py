@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+worker 冷启动导入预算检查
+
+在全新的子进程中导入应用并执行 create_app，检查：
+- 重依赖（pandas、NumPy、pyarrow、openpyxl）没有在启动阶段被导入；
+- APP_ROLE=ingest 时连数据库迁移（flask_migrate / alembic）也不加载；
+- 启动耗时（多次取中位数）不超过预算。
+
+任一项不满足时以非零状态退出，可直接放进 CI：
+
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --role ingest --budget-ms 600 --runs 5
+    python benchmarks/import_budget.py --top 15     # 额外打印 -X importtime 中最慢的模块
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import uuid
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'openpyxl']
+INGEST_EXTRA_MODULES = ['flask_migrate', 'alembic']
+
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app('embedded')
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'elapsed_ms': elapsed * 1000,
+    'modules': sorted(name for name in sys.modules if '.' not in name)
+}))
+"""
+
+
+def run_child(role, database_url, importtime=False):
+    env = dict(os.environ)
+    env.update({
+        'APP_ROLE': role,
+        'EMBEDDED_DATABASE_URL': database_url,
+        'SECRET_KEY': env.get('SECRET_KEY', 'import-budget-' + uuid.uuid4().hex),
+    })
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD_SCRIPT]
+    result = subprocess.run(command, cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f'子进程启动失败（退出码 {result.returncode}）')
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report, result.stderr
+
+
+def slowest_imports(stderr, top):
+    """解析 -X importtime 输出，返回累计耗时最长的模块"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查应用冷启动的导入耗时和重依赖')
+    parser.add_argument('--role', choices=['all', 'ingest'], default='all')
+    parser.add_argument('--budget-ms', type=float, default=1000.0, help='create_app 冷启动耗时上限（毫秒）')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=0, help='打印累计导入耗时最长的 N 个模块')
+    args = parser.parse_args()
+
+    forbidden = list(HEAVY_MODULES)
+    if args.role == 'ingest':
+        forbidden += INGEST_EXTRA_MODULES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = 'sqlite:///' + os.path.join(tmp, 'import_budget.db')
+        # 第一次运行负责建表和生成字节码缓存，不计入结果
+        run_child(args.role, database_url)
+
+        timings = []
+        loaded = set()
+        for _ in range(args.runs):
+            report, _ = run_child(args.role, database_url)
+            timings.append(report['elapsed_ms'])
+            loaded.update(report['modules'])
+
+        if args.top:
+            _, stderr = run_child(args.role, database_url, importtime=True)
+            print(f'累计导入耗时最长的 {args.top} 个模块：')
+            for cumulative_us, self_us, name in slowest_imports(stderr, args.top):
+                print(f'  {cumulative_us / 1000:8.1f} ms  (自身 {self_us / 1000:6.1f} ms)  {name}')
+
+    median = statistics.median(timings)
+    leaked = [name for name in forbidden if name in loaded]
+
+    print(f'角色: {args.role}')
+    print(f'create_app 冷启动: 中位数 {median:.0f} ms（{", ".join(f"{t:.0f}" for t in timings)}），预算 {args.budget_ms:.0f} ms')
+    print(f'已加载顶层模块数: {len(loaded)}')
+
+    failed = False
+    if leaked:
+        print(f'失败：启动阶段导入了重依赖 {", ".join(leaked)}')
+        failed = True
+    if median > args.budget_ms:
+        print('失败：冷启动耗时超出预算')
+        failed = True
+    if not failed:
+        print('通过')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
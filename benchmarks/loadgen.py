@@ -0,0 +1,222 @@
+"""
+简单的 HTTP 压测驱动（仅依赖标准库）
+
+每个并发客户端一个线程，复用一条 keep-alive 连接，记录每个请求的耗时。
+另外提供启动 gunicorn 服务、注册压测用户和读取服务进程内存峰值的辅助函数。
+"""
+import http.client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, p):
+    """计算百分位（输入已排序）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadResult:
+    """一次压测的结果"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'throughput': round(len(latencies) / self.duration, 1) if self.duration else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+
+class HttpClient:
+    """基于 http.client 的 keep-alive 客户端"""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回 (状态码, 响应体)"""
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+            headers.setdefault('Content-Type', 'application/json')
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了 keep-alive 连接（例如 worker 达到 max_requests 重启），重连一次
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_http_load(base_url, make_request, concurrency=10, duration=None, total_requests=None):
+    """
+    并发压测
+
+    make_request(序号) 返回 (method, path, body, headers)；
+    按 duration 秒或 total_requests 个请求结束（二者至少指定一个）。
+    """
+    result = LoadResult()
+    counter = iter(range(total_requests)) if total_requests else itertools.count()
+    counter_lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        client = HttpClient(base_url)
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None:
+                    break
+                method, path, body, headers = make_request(index)
+                started = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, body, headers)
+                    ok = status < 400
+                except Exception:
+                    ok = False
+                result.record(time.perf_counter() - started, ok)
+        finally:
+            client.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.duration = time.monotonic() - started
+    return result
+
+
+def start_server(worker_class, workers, port, database_url, extra_env=None):
+    """启动 gunicorn（SQLite 使用 embedded 配置，其他数据库使用 production 配置），等待健康检查通过"""
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': str(workers),
+        'SECRET_KEY': env.get('SECRET_KEY', 'bench-secret-key-' + uuid.uuid4().hex),
+    })
+    if database_url.startswith('sqlite'):
+        env.update({'FLASK_CONFIG': 'embedded', 'EMBEDDED_DATABASE_URL': database_url})
+    else:
+        env.update({'FLASK_CONFIG': 'production', 'DATABASE_URL': database_url})
+    env.update(extra_env or {})
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', '-b', f'127.0.0.1:{port}',
+         '--access-logfile', '/dev/null', 'run:app'],
+        cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    client = HttpClient(f'http://127.0.0.1:{port}')
+    for _ in range(100):
+        try:
+            status, _ = client.request('GET', '/api/health')
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{worker_class} 服务启动失败')
+
+
+def get_token(base_url):
+    """注册一个压测用户并返回访问令牌"""
+    client = HttpClient(base_url)
+    name = 'bench_' + uuid.uuid4().hex[:12]
+    status, body = client.request('POST', '/api/register', {
+        'username': name, 'email': f'{name}@bench.local', 'password': 'bench12345'
+    })
+    client.close()
+    if status != 201:
+        raise RuntimeError(f'注册压测用户失败: {status} {body[:200]}')
+    return json.loads(body)['access_token']
+
+
+def _children(pid):
+    """pid 的所有子进程（gunicorn worker）"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def process_tree(pid):
+    return [pid] + _children(pid)
+
+
+def reset_peak_rss(pid):
+    """清零进程树的 RSS 峰值（写 /proc/<pid>/clear_refs，仅 Linux）"""
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pid):
+    """进程树中单个进程的最大 RSS 峰值（VmHWM，MB）；非 Linux 返回 None"""
+    peak = None
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        value = int(line.split()[1]) / 1024
+                        peak = value if peak is None else max(peak, value)
+        except OSError:
+            continue
+    return round(peak, 1) if peak is not None else None
@@ -181,15 +181,75 @@ class BackendClient:
         response = self.session.post(url, headers=headers, json=data)
         return self._handle_response(response)
 
+    def record_anonymous_event(self,
+                               write_key: str,
+                               anonymous_id: str,
+                               event_name: str,
+                               event_type: str = "custom",
+                               page_url: Optional[str] = None,
+                               element_id: Optional[str] = None,
+                               metadata: Optional[Dict] = None) -> Dict:
+        """
+        使用写入密钥上报匿名/设备事件（不需要登录）
+
+        Args:
+            write_key: 项目级写入密钥
+            anonymous_id: 设备或匿名ID
+            event_name: 事件名称
+            event_type: 事件类型，默认 "custom"
+            page_url: 页面URL
+            element_id: 元素ID
+            metadata: 额外元数据
+
+        Returns:
+            事件记录结果
+        """
+        url = f"{self.base_url}/api/ingest/events"
+        headers = {'X-Write-Key': write_key}
+
+        data = {
+            'anonymous_id': anonymous_id,
+            'event_name': event_name,
+            'event_type': event_type
+        }
+
+        if page_url:
+            data['page_url'] = page_url
+        if element_id:
+            data['element_id'] = element_id
+        if metadata:
+            data['event_metadata'] = metadata
+
+        response = self.session.post(url, headers=headers, json=data)
+        return self._handle_response(response)
+
+    def identify(self, anonymous_id: str) -> Dict:
+        """
+        把匿名ID下的事件关联到当前登录用户
+
+        Args:
+            anonymous_id: 设备或匿名ID
+
+        Returns:
+            关联结果（linked_events 为本次关联的事件数）
+        """
+        url = f"{self.base_url}/api/identify"
+        headers = self._get_auth_headers()
+
+        response = self.session.post(url, headers=headers, json={'anonymous_id': anonymous_id})
+        return self._handle_response(response)
+
     def get_events(self,
                    page: int = 1,
-                   per_page: int = 20) -> Dict:
+                   per_page: int = 20,
+                   fields: Optional[str] = None) -> Dict:
         """
         获取当前用户的事件列表
 
         Args:
             page: 页码
             per_page: 每页数量
+            fields: 返回字段，逗号分隔（默认全部字段）
 
         Returns:
             事件列表
@@ -201,6 +261,8 @@ class BackendClient:
             'page': page,
             'per_page': per_page
         }
+        if fields:
+            params['fields'] = fields
 
         response = self.session.get(url, headers=headers, params=params)
         return self._handle_response(response)
@@ -217,7 +279,8 @@ class BackendClient:
                          sort_by: str = "created_at",
                          sort_order: str = "desc",
                          page: int = 1,
-                         per_page: int = 50) -> Dict:
+                         per_page: int = 50,
+                         fields: Optional[str] = None) -> Dict:
         """
         管理员获取事件数据（支持筛选和排序）
 
@@ -232,6 +295,7 @@ class BackendClient:
             sort_order: 排序方式 (asc, desc)
             page: 页码
             per_page: 每页数量
+            fields: 返回字段，逗号分隔；默认不含 user_agent、event_metadata，"all" 返回全部字段
 
         Returns:
             事件数据
@@ -259,6 +323,8 @@ class BackendClient:
             params['start_date'] = start_date
         if end_date:
             params['end_date'] = end_date
+        if fields:
+            params['fields'] = fields
 
         response = self.session.get(url, headers=headers, params=params)
         return self._handle_response(response)
@@ -276,17 +342,44 @@ class BackendClient:
         response = self.session.get(url, headers=headers)
         return self._handle_response(response)
 
-    def get_users_list(self) -> Dict:
+    def get_users_list(self, q: str = "", cursor: Optional[str] = None, limit: int = 50) -> Dict:
         """
-        获取用户列表（用于筛选）
+        按用户名前缀搜索用户（用于筛选）
+
+        Args:
+            q: 用户名前缀，为空时列出全部
+            cursor: 上一页响应中的 next_cursor
+            limit: 每页条数（最大 100）
 
         Returns:
-            用户列表
+            用户列表和 next_cursor（没有更多时为 None）
         """
         url = f"{self.base_url}/api/admin/users"
         headers = self._get_auth_headers()
+        params = {'q': q, 'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
 
-        response = self.session.get(url, headers=headers)
+        response = self.session.get(url, headers=headers, params=params)
+        return self._handle_response(response)
+
+    def get_event_changes(self, since: str = "", limit: int = 1000) -> Dict:
+        """
+        增量获取水位线之后的新增事件和删除记录
+
+        Args:
+            since: 上一次响应中的 next_since，首次同步传空字符串
+            limit: 每批最多返回条数
+
+        Returns:
+            包含 events、deleted、identities、next_since、has_more 的字典
+        """
+        url = f"{self.base_url}/api/admin/events/changes"
+        headers = self._get_auth_headers()
+
+        params = {'since': since, 'limit': limit}
+
+        response = self.session.get(url, headers=headers, params=params)
         return self._handle_response(response)
 
     # ===== 系统接口 =====
@@ -21,9 +21,136 @@ class BaseConfig:
     TRACKING_ENABLED = True
     TRACKING_BUFFER_SIZE = 100  # 内存缓冲条数
 
+    # events 表时间分区（仅 MySQL，flask partitions 命令使用）
+    EVENTS_PARTITION_GRANULARITY = os.environ.get('EVENTS_PARTITION_GRANULARITY', 'monthly')  # monthly 或 daily
+    EVENTS_PARTITION_PRECREATE = 3  # 预先创建的未来分区数量
+
+    # 数据保留策略：{'事件类型': 保留天数}，'*' 为默认策略，例如 {'*': 365, 'click': 90}
+    EVENT_RETENTION_POLICIES = {}
+    # 分块删除配置
+    DELETE_CHUNK_SIZE = 1000  # 每个事务删除的最大条数
+    DELETE_CHUNK_PAUSE = 0.1  # 块之间暂停秒数，降低主从延迟
+    DELETE_JOB_STALE_SECONDS = 300  # 任务心跳超时后可被其他进程接管
+
+    # 冷数据归档（flask archive run），依赖 pyarrow
+    ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_DAYS = 30  # 早于多少天的事件移入归档
+    ARCHIVE_COMPRESSION = 'zstd'
+    ARCHIVE_MERGE_MAX_ROWS = 10000  # 跨归档数据按页面排序时可翻到的最大深度（按时间排序不受限）
+
+    # 提升为生成列并建立索引的 event_metadata 键（flask metadata promote），支持 meta.<key>=value 筛选
+    EVENT_PROMOTED_METADATA_KEYS = []
+
+    # 只读副本：管理端列表、统计、导出等只读接口优先查询副本
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if uri]
+    REPLICA_HEALTH_CHECK_INTERVAL = 5  # 副本健康检查间隔（秒）
+    REPLICA_MAX_LAG_SECONDS = 10  # 复制延迟超过该值时回退到主库
+
+    # 最近事件内存窗口（每个进程一份，依赖 numpy）
+    RECENT_WINDOW_ENABLED = os.environ.get('RECENT_WINDOW_ENABLED', 'false').lower() == 'true'
+    RECENT_WINDOW_HOURS = 24  # 窗口覆盖的小时数
+    RECENT_WINDOW_REFRESH_SECONDS = 1.0  # 从数据库增量同步的最小间隔
+
+    # 按主键增量拉取（变更流、最近事件窗口、实时事件流）和列表 ETag 使用的稳定期（秒）：自增ID不按提交顺序可见，
+    # 该时间之内写入的行之前可能还有较小的ID未提交，水位线不越过它们；应大于最长的写入事务（含批量提交排队）
+    CHANGES_SETTLE_SECONDS = 5
+
+    # 数据库连接预算：整台主机的连接总数，按 gunicorn worker 数平均分配（0 表示不启用，使用 SQLALCHEMY_ENGINE_OPTIONS）
+    DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', 0))
+    DB_MIN_POOL_SIZE = 2  # 每个 worker 的最小连接数
+    DB_POOL_TIMEOUT = 10  # 从连接池获取连接的超时（秒）
+    DB_ADMISSION_QUEUE_LIMIT = 100  # 每个 worker 等待数据库连接的最大排队请求数
+    DB_ADMISSION_TIMEOUT = 5  # 排队超时（秒），超时返回 503
+    DB_ADMISSION_EXEMPT_ENDPOINTS = ['main.health_check', 'main.login_page', 'main.events_page', 'main.stream_events',
+                                     'metrics.metrics', 'static']
+
+    # Prometheus 指标（/metrics，需要安装 prometheus_client）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_GAUGE_REFRESH_SECONDS = 1.0  # 每个 worker 刷新连接池、队列深度 gauge 的最小间隔
+
+    # SQL 查询分析（/api/admin/sql-profile）
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', 'false').lower() == 'true'
+    SQL_SLOW_QUERY_MS = 100  # 超过该耗时的语句写入慢查询日志
+    SQL_EXPLAIN_THRESHOLD_MS = 500  # 超过该耗时的 SELECT 抓取执行计划
+    SQL_N_PLUS_ONE_THRESHOLD = 5  # 同一请求内同一语句执行次数达到该值时视为 N+1
+    SQL_PROFILER_MAX_STATEMENTS = 500  # 每个 worker 最多统计的不同语句数
+
+    # CPU 采样与内存快照（/api/admin/profiling/*，需要请求头 X-Admin-Token；CPU 采样在 gevent worker 下停用）
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_ADMIN_TOKEN = os.environ.get('PROFILING_ADMIN_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))  # 随机采样的请求比例
+    PROFILING_INTERVAL_MS = 5  # 调用栈采样间隔
+    PROFILING_HISTORY = 50  # 每个 worker 保留的采样结果数
+    PROFILING_TRACEMALLOC_FRAMES = 10  # tracemalloc 保存的调用栈深度
+
+    # 安装了 orjson 时使用 orjson 编码 jsonify 响应
+    JSON_FAST_PROVIDER = os.environ.get('JSON_FAST_PROVIDER', 'true').lower() == 'true'
+
+    # 响应压缩：按 Accept-Encoding 协商，br / zstd 需要安装 brotli / zstandard
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_ALGORITHMS = ['br', 'zstd', 'gzip']  # 客户端权重相同时的服务端偏好顺序
+    COMPRESS_LEVELS = {'br': 5, 'zstd': 6, 'gzip': 6}
+    COMPRESS_MIN_SIZE = 1024  # 小于该字节数的非流式响应不压缩
+    COMPRESS_BLUEPRINTS = ['main', 'export']
+
+    # 事件列表的 ETag / 304 与按数据版本失效的短期结果缓存（每个 worker 独立）
+    EVENT_LIST_CONDITIONAL = os.environ.get('EVENT_LIST_CONDITIONAL', 'true').lower() == 'true'
+    EVENT_LIST_CACHE_SECONDS = 10
+    EVENT_LIST_CACHE_SIZE = 256
+
+    # 部署角色：all 为完整应用；ingest 只提供采集和查询接口，不注册导出蓝图、不加载 pandas 等重依赖
+    APP_ROLE = os.environ.get('APP_ROLE', 'all')
+
     # 会话配置
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
     # 日志配置
     LOG_LEVEL = 'INFO'
-    LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
\ No newline at end of file
+    LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    # 单行 JSON 输出（关闭时使用 LOG_FORMAT）
+    LOG_JSON = os.environ.get('LOG_JSON', 'true').lower() == 'true'
+    # 非调试模式下的日志文件，多个 worker 追加写入，由 logrotate 轮转；为空时只输出到标准错误
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+    # 请求线程与写日志线程之间的队列长度，满了直接丢弃
+    LOG_QUEUE_SIZE = 10000
+    # 按 logger 名称前缀对 WARNING 以下的日志采样，如 {'app.sql_profiler': 0.1}
+    LOG_SAMPLING = {}
+
+    # 密码哈希：werkzeug 的哈希方法（如 scrypt:32768:8:1、pbkdf2:sha256:600000），修改后用户下次登录时自动重新哈希
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_MAX_CONCURRENT = int(os.environ.get('PASSWORD_HASH_MAX_CONCURRENT', 2))  # 整台主机同时进行的哈希数
+    PASSWORD_HASH_QUEUE_TIMEOUT = 0.05  # 等待哈希名额的时间（秒），超时返回 503
+    PASSWORD_HASH_POOL_SIZE = 1  # 每个 worker 的哈希进程数，0 表示在请求线程内执行
+    PASSWORD_HASH_TIMEOUT = 5  # 单次哈希的最长等待（秒）
+    PASSWORD_HASH_NICE = 10  # 哈希进程降低的调度优先级
+    # 主机级哈希名额的锁文件目录（同一台主机上的所有 worker 必须相同），默认在系统临时目录下
+    PASSWORD_HASH_SLOT_DIR = os.environ.get('PASSWORD_HASH_SLOT_DIR')
+
+    # 每个 worker 的用户信息缓存（id -> 用户），其他 worker 的修改最迟 TTL 秒后可见
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+
+    # 管理端实时事件流（SSE）：每个订阅者的队列长度（写满即断开）、每个 worker 的订阅者上限、
+    # 断线重连时可补发的最近事件数、拉取其他 worker 新事件的间隔（0 表示只推送本进程写入的事件）
+    LIVE_STREAM_QUEUE_SIZE = 1000
+    LIVE_STREAM_MAX_SUBSCRIBERS = 20
+    LIVE_STREAM_THREAD_SHARE = 0.25  # gthread worker 下实时事件流最多占用的线程比例（sync worker 不支持）
+    LIVE_STREAM_REPLAY_SIZE = 1000
+    LIVE_STREAM_POLL_SECONDS = 1.0
+    LIVE_STREAM_HEARTBEAT_SECONDS = 15
+    # 单个连接的最长时间，到期后浏览器自动重连；必须小于 gunicorn timeout（30 秒）
+    LIVE_STREAM_MAX_SECONDS = 25
+    LIVE_STREAM_RETRY_MS = 1000
+
+    # 写入密钥表的刷新间隔（秒），吊销最迟在一个周期后生效
+    WRITE_KEY_REFRESH_SECONDS = 30
+
+    # 批量开通用户接口：单次请求的用户数上限、需要哈希的明文密码数上限（更大的导入使用 flask users provision）
+    # 接口中的哈希与登录共用 PASSWORD_HASH_* 的名额和进程池，每个 scrypt 哈希约 0.1 秒，
+    # 明文密码上限需保证请求在 gunicorn timeout 内完成
+    PROVISION_ADMIN_TOKEN = os.environ.get('PROVISION_ADMIN_TOKEN')  # 接口要求请求头 X-Admin-Token，未配置时接口关闭
+    PROVISION_MAX_USERS = 1000
+    PROVISION_MAX_PASSWORDS = 100
+    PROVISION_CHUNK_SIZE = 1000
\ No newline at end of file
@@ -24,6 +24,7 @@ class DevelopmentConfig(BaseConfig):
     # 开发环境特殊配置
     TRACKING_BUFFER_SIZE = 50  # 开发环境减小缓冲
     LOG_LEVEL = 'DEBUG'  # 开发环境更详细的日志
+    LOG_JSON = False  # 开发环境使用便于阅读的文本格式
 
     # 开发服务器配置
     # HOST = '127.0.0.1'
@@ -0,0 +1,45 @@
+from .base import BaseConfig
+import os
+
+
+class EmbeddedConfig(BaseConfig):
+    """单机嵌入式 SQLite 生产配置（无需 MySQL）"""
+
+    DEBUG = False
+    TESTING = False
+
+    # 数据库文件默认放在 instance 目录下
+    basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'EMBEDDED_DATABASE_URL',
+        'sqlite:///' + os.path.join(basedir, 'instance', 'app.db')
+    )
+
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    if not SECRET_KEY:
+        raise ValueError("嵌入式生产环境必须设置SECRET_KEY环境变量")
+
+    # 单机部署没有迁移流程，启动时自动建表
+    SQLITE_CREATE_TABLES = True
+
+    # SQLite 连接参数
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 256MB
+    SQLITE_CACHE_SIZE_KB = 64 * 1024  # 每个连接 64MB 页缓存
+
+    # 组提交：单写线程合并同一进程内的写入，跨 worker 通过文件锁串行化（需要 gthread 或 gevent worker）
+    SQLITE_GROUP_COMMIT = True
+    SQLITE_GROUP_COMMIT_MAX_BATCH = 500  # 每个事务最多插入条数
+    SQLITE_GROUP_COMMIT_MAX_DELAY = 0.005  # 凑批等待时间（秒）
+
+    TRACKING_BUFFER_SIZE = 1000
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 0,
+        'pool_pre_ping': False
+    }
+
+    LOG_LEVEL = 'WARNING'
+    JSONIFY_PRETTYPRINT_REGULAR = False
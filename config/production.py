@@ -27,6 +27,9 @@ class ProductionConfig(BaseConfig):
 
     # 生产环境优化配置
     TRACKING_BUFFER_SIZE = 1000  # 生产环境增大缓冲
+    # 每台主机的数据库连接总预算（MySQL 默认 max_connections=151，预留管理连接）
+    # 启用后按 worker 数自动计算 pool_size，下面的 pool_size/max_overflow 仅在预算为 0 时生效
+    DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', 120))
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_recycle': 3600,
         'pool_pre_ping': True,
@@ -1,14 +1,54 @@
 # Gunicorn 配置文件
 import multiprocessing
+import os
+import tempfile
+
+# 工作模式
+# sync：每个 worker 同时只处理一个请求（不支持管理端实时事件流，该接口返回 503）
+# gevent：协程模式，单进程可同时保持上千个在途请求（等待 MySQL 时让出），适合 ingest 层
+# 使用 gevent 时数据库驱动必须是纯 Python 的 pymysql（mysql+pymysql://），mysqlclient 会阻塞整个进程
+# gthread：每个 worker 一个线程池
+# 嵌入式 SQLite（FLASK_CONFIG=embedded）的组提交在进程内合并写入：sync worker 每个进程同时只有一个请求，
+# 每批永远只有一条事件，因此该模式默认使用 gthread，并且不允许 sync
+embedded = os.environ.get('FLASK_CONFIG') == 'embedded'
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if embedded else 'sync')
+if embedded and worker_class == 'sync':
+    raise RuntimeError('嵌入式 SQLite 模式需要 gthread 或 gevent worker（GUNICORN_WORKER_CLASS）')
+
+if worker_class == 'gevent':
+    # 预加载应用前先打补丁，保证 socket、threading 等在 master 导入应用时就是协程版本
+    from gevent import monkey
+    monkey.patch_all()
 
 # 服务器绑定
 bind = "0.0.0.0:7000"
 
 # 工作进程数
-workers = multiprocessing.cpu_count() * 2 + 1
+if worker_class == 'gevent':
+    # 协程模式下并发来自 worker_connections，进程数与 CPU 核数相当即可
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() + 1))
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+elif worker_class == 'gthread':
+    # 进程越少，每个进程内能合并的写入越多；并发来自线程
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+    threads = int(os.environ.get('GUNICORN_THREADS', 32))
+else:
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
 
-# 工作模式
-worker_class = "sync"
+# 告知应用 worker 数，用于按 DB_CONNECTION_BUDGET 分配每个 worker 的连接池大小
+os.environ['GUNICORN_WORKERS'] = str(workers)
+# gthread 的线程数，用于限制实时事件流（SSE）占用的线程（见 app/live_stream.py）
+if worker_class == 'gthread':
+    os.environ['GUNICORN_THREADS'] = str(threads)
+
+# Prometheus 多进程模式：各 worker 把指标写入共享目录，/metrics 汇总所有 worker
+# 必须在预加载应用（导入 prometheus_client）之前设置；每次启动清空上次遗留的数据
+prometheus_multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'tracking_app_metrics'))
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+for name in os.listdir(prometheus_multiproc_dir):
+    if name.endswith('.db'):
+        os.remove(os.path.join(prometheus_multiproc_dir, name))
 
 # 最大请求数
 max_requests = 1000
@@ -26,4 +66,19 @@ loglevel = "info"
 proc_name = "tracking_app"
 
 # 预加载应用
-preload_app = True
\ No newline at end of file
+preload_app = True
+
+
+def post_worker_init(worker):
+    """worker 启动（包括回收后重启）后在后台加载最近事件窗口，不占用第一个管理端请求"""
+    from app.recent_window import preload_recent_window
+    preload_recent_window(worker.wsgi)
+
+
+def child_exit(server, worker):
+    """worker 退出（包括 max_requests 回收）时清理它的实时 gauge 数据"""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
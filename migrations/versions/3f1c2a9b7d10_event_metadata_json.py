@@ -0,0 +1,38 @@
+"""event_metadata 转为原生 JSON 类型
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-19 16:00:00
+
+MySQL 上把 events.event_metadata 从 TEXT 转为原生 JSON（空字符串先置为 NULL，否则转换失败）；
+SQLite 的 JSON 类型本身就是 TEXT，无需转换。已经是 JSON 类型时跳过，
+由 db.create_all() 建出的新库可以直接执行 flask db upgrade。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _metadata_column(bind):
+    return {column['name']: column for column in sa.inspect(bind).get_columns('events')}['event_metadata']
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql' or isinstance(_metadata_column(bind)['type'], sa.JSON):
+        return
+    op.execute("UPDATE events SET event_metadata = NULL WHERE event_metadata = ''")
+    op.alter_column('events', 'event_metadata', type_=sa.JSON(), existing_type=sa.Text(), existing_nullable=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql' or not isinstance(_metadata_column(bind)['type'], sa.JSON):
+        return
+    op.alter_column('events', 'event_metadata', type_=sa.Text(), existing_type=sa.JSON(), existing_nullable=True)
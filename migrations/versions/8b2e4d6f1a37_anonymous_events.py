@@ -0,0 +1,103 @@
+"""匿名事件上报：写入密钥、identify 记录和 events.anonymous_id
+
+Revision ID: 8b2e4d6f1a37
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-19 16:10:00
+
+- 创建 write_keys、identity_links 表；
+- events 增加 anonymous_id 列和索引，user_id 改为可空（匿名事件没有用户）。
+
+SQLite 不能修改列的非空约束，events 通过 batch_alter_table 重建（按反射出的现有表结构复制）。
+生成列不能出现在复制数据的 INSERT 中，flask metadata promote 创建的 meta_* 生成列及其索引
+先删除、重建后按原定义加回。已完成的步骤跳过，
+由 db.create_all() 建出的新库可以直接执行 flask db upgrade。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a37'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def _detach_generated_columns(inspector):
+    """SQLite：删除 events 上的生成列及其索引，返回加回时需要的 (列, 索引) 定义"""
+    if op.get_bind().dialect.name != 'sqlite':
+        return [], []
+    generated = [column for column in inspector.get_columns('events') if column.get('computed')]
+    names = {column['name'] for column in generated}
+    indexes = [index for index in inspector.get_indexes('events') if names & set(index['column_names'])]
+    for index in indexes:
+        op.drop_index(index['name'], table_name='events')
+    with op.batch_alter_table('events') as batch_op:
+        for column in generated:
+            batch_op.drop_column(column['name'])
+    return generated, indexes
+
+
+def _attach_generated_columns(generated, indexes):
+    for column in generated:
+        computed = column['computed']
+        op.add_column('events', sa.Column(column['name'], column['type'],
+                                          sa.Computed(computed['sqltext'], persisted=computed.get('persisted'))))
+    for index in indexes:
+        op.create_index(index['name'], 'events', index['column_names'], unique=bool(index['unique']))
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'write_keys' not in tables:
+        op.create_table(
+            'write_keys',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(100), nullable=False),
+            sa.Column('key_hash', sa.String(64), nullable=False, unique=True),
+            sa.Column('key_prefix', sa.String(16), nullable=False),
+            sa.Column('active', sa.Boolean(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('revoked_at', sa.DateTime())
+        )
+        op.create_index('ix_write_keys_active', 'write_keys', ['active'])
+
+    if 'identity_links' not in tables:
+        op.create_table(
+            'identity_links',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('anonymous_id', sa.String(64), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('linked_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime())
+        )
+        op.create_index('ix_identity_links_anonymous_id', 'identity_links', ['anonymous_id'])
+        op.create_index('ix_identity_links_created_at', 'identity_links', ['created_at'])
+
+    columns = {column['name']: column for column in inspector.get_columns('events')}
+    needs_column = 'anonymous_id' not in columns
+    needs_nullable = not columns['user_id']['nullable']
+    if not (needs_column or needs_nullable):
+        return
+    generated, indexes = _detach_generated_columns(inspector) if needs_nullable else ([], [])
+    with op.batch_alter_table('events') as batch_op:
+        if needs_nullable:
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+        if needs_column:
+            batch_op.add_column(sa.Column('anonymous_id', sa.String(64), nullable=True))
+            batch_op.create_index('ix_events_anonymous_id', ['anonymous_id'])
+    _attach_generated_columns(generated, indexes)
+
+
+def downgrade():
+    # 已有匿名事件（user_id 为空）时无法恢复非空约束，需先删除或 identify 这些事件
+    generated, indexes = _detach_generated_columns(sa.inspect(op.get_bind()))
+    with op.batch_alter_table('events') as batch_op:
+        batch_op.drop_index('ix_events_anonymous_id')
+        batch_op.drop_column('anonymous_id')
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+    _attach_generated_columns(generated, indexes)
+    op.drop_table('identity_links')
+    op.drop_table('write_keys')